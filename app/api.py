@@ -1,8 +1,16 @@
-import json
 import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 
+import orjson
 import requests
 
+from app.static import API_CACHE_SIZE, API_CACHE_TTL
+from app.utils.timing_utils import stage
+
 """
 API module
 
@@ -10,20 +18,74 @@ API module
 https://sc2pulse.nephest.com/sc2/doc/swagger-ui/index.html
 """
 
-API_ROOT = "https://sc2pulse.nephest.com/sc2/api"
+API_ROOT = os.environ.get("SC2PULSE_API_ROOT", "https://sc2pulse.nephest.com/sc2/api")
+
+# Shared session so connections to sc2pulse stay pooled between requests and checks
+SESSION = requests.Session()
 
 
 def get(endpoint):
     logging.info(f"Sending GET request to {endpoint}")
-    return requests.get(endpoint)
+    with stage("api", endpoint=endpoint.removeprefix(API_ROOT)) as span:
+        response = SESSION.get(endpoint)
+        span.attributes.update(status=response.status_code, bytes=len(response.content))
+    return response
+
+
+# Response bodies keyed by endpoint -> (fetched at, content). Shared by every check in the process. Every caller parses
+# its own copy, so what get_json returns can be changed freely.
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+
+# Set inside uncached blocks, where every request skips the cache
+_BYPASS = ContextVar("api_cache_bypass", default=False)
+
+
+@contextmanager
+def uncached():
+    """
+    Requests inside the block always go to the API. Their responses still refresh the cache for everyone else.
+    Work handed to other threads with a copy of the context is covered too.
+    """
+    token = _BYPASS.set(True)
+    try:
+        yield
+    finally:
+        _BYPASS.reset(token)
+
+
+def get_json(endpoint, ttl=API_CACHE_TTL):
+    """
+    GET and parse an endpoint, reusing a successful response younger than ttl seconds. ttl=0 always sends the request.
+    Error responses are returned but never cached.
+    """
+    now = time.monotonic()
+    if ttl > 0 and not _BYPASS.get():
+        with _CACHE_LOCK:
+            cached = _CACHE.get(endpoint)
+        if cached and now - cached[0] < ttl:
+            with stage("api", endpoint=endpoint.removeprefix(API_ROOT), cache_hit=True):
+                return orjson.loads(cached[1])
+
+    response = get(endpoint)
+    data = orjson.loads(response.content)
+    if not response.ok:
+        return data
 
+    with _CACHE_LOCK:
+        _CACHE.pop(endpoint, None)
+        _CACHE[endpoint] = (now, response.content)
+        while len(_CACHE) > API_CACHE_SIZE:
+            del _CACHE[next(iter(_CACHE))]
+    return data
 
-def get_character_summary(id, depth):
+
+def get_character_summary(id, depth, ttl=API_CACHE_TTL):
     """
     /character/{id}/summary/1v1/{depth}
     """
     endpoint = API_ROOT + f"/character/{id}/summary/1v1/{depth}"
-    return json.loads(get(endpoint).text)
+    return get_json(endpoint, ttl=ttl)
 
 
 def get_character_search(name):
@@ -31,7 +93,7 @@ def get_character_search(name):
     "/character/search?term={name}"
     """
     endpoint = API_ROOT + f"/character/search?term={name}"
-    return json.loads(get(endpoint).text)
+    return get_json(endpoint)
 
 
 def get_character_common(id, query=""):
@@ -40,12 +102,14 @@ def get_character_common(id, query=""):
     """
     endpoint = API_ROOT + f"/character/{id}/common"
     endpoint = endpoint + query if query else endpoint
-    return json.loads(get(endpoint).text)
+    return get_json(endpoint)
 
 
-def get_matches(id, date, matchType="_1V1"):
+def get_matches(id, date, matchType="_1V1", map_id=1, ttl=API_CACHE_TTL):
     """
-    /character/{id}/matches/{date}/{matchType}/1/1/1"
+    /character/{id}/matches/{date}/{matchType}/{map_id}/1/1"
+
+    date, matchType and map_id are the cursor of the last match already seen
     """
-    endpoint = API_ROOT + f"/character/{id}/matches/{date}/{matchType}/1/1/1"
-    return json.loads(get(endpoint).text)
+    endpoint = API_ROOT + f"/character/{id}/matches/{date}/{matchType}/{map_id}/1/1"
+    return get_json(endpoint, ttl=ttl)
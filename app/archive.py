@@ -0,0 +1,285 @@
+"""
+Single file, memory-mapped archive of the JSON under PROFILES_DIR
+
+Layout:
+    records      zlib compressed JSON documents, back to back
+    index        JSON {kind: {key: {"offset", "length", "mtime", ...}}}
+    footer       index offset, index length, magic
+
+Records are only decompressed and parsed when they are read.
+
+Match pages are appended to one loose file per character. Compacting appends them to the archived record, so pruning
+the loose file never drops match history.
+
+python -m app.archive compact [-prune]
+python -m app.archive info
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+
+import orjson
+
+from app.static import ARCHIVE_PATH, PROFILES_DIR
+
+MAGIC = b"SMRFARC1"
+FOOTER = struct.Struct("<QQ8s")
+ARCHIVE_KINDS = ("search", "summary", "common", "matches", "stats", "match_history")
+COMPRESSION_LEVEL = 6
+
+
+def _decode(kind, data):
+    """
+    Match pages are appended to one file per character, so those records hold several JSON documents
+    """
+    if kind != "matches":
+        return orjson.loads(data)
+
+    text = data.decode("utf-8")
+    decoder = json.JSONDecoder()
+    documents = []
+    position = 0
+    while True:
+        while position < len(text) and text[position].isspace():
+            position += 1
+        if position >= len(text):
+            return documents
+        document, position = decoder.raw_decode(text, position)
+        documents.append(document)
+
+
+def _append_pages(archived, entry, data):
+    """
+    Match page log of a character from its archived record and its loose file, which is only ever appended to.
+
+    The last loose_length bytes of the record were packed from a loose file. If the loose file still starts with them
+    it is that file, possibly grown, and replaces them. Otherwise it was pruned since and holds only newer pages.
+    Returns the merged log and the new loose_length.
+    """
+    base = archived[: len(archived) - entry.get("loose_length", 0)]
+    if not data.startswith(archived[len(base) :]):  # noqa: E203
+        base = archived
+    return base + data, len(data)
+
+
+def _index_metadata(kind, data):
+    """
+    Small fields kept in the index so listings don't need to decode records
+    """
+    if kind != "stats":
+        return {}
+    document = orjson.loads(data)
+    return {"name": document.get("name")}
+
+
+class ProfileArchive:
+    def __init__(self, path=ARCHIVE_PATH):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        index_offset, index_length, magic = FOOTER.unpack_from(self._mmap, len(self._mmap) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a profile archive")
+        self.index = orjson.loads(self._mmap[index_offset : index_offset + index_length])  # noqa: E203
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, kind_key):
+        kind, key = kind_key
+        return str(key) in self.index.get(kind, {})
+
+    def close(self):
+        self._mmap.close()
+
+    def keys(self, kind):
+        return self.index.get(kind, {}).keys()
+
+    def entry(self, kind, key):
+        return self.index.get(kind, {}).get(str(key))
+
+    def raw(self, kind, key):
+        entry = self.entry(kind, key)
+        if entry is None:
+            return None
+        return zlib.decompress(self._mmap[entry["offset"] : entry["offset"] + entry["length"]])  # noqa: E203
+
+    def get(self, kind, key):
+        data = self.raw(kind, key)
+        return _decode(kind, data) if data is not None else None
+
+    def iter_records(self, kind):
+        for key in self.keys(kind):
+            yield key, self.get(kind, key)
+
+
+_ARCHIVE = None
+_ARCHIVE_MTIME = None
+_ARCHIVE_LOCK = threading.Lock()
+
+
+def open_archive(path=ARCHIVE_PATH):
+    """
+    Shared reader, reopened when the archive is rewritten. None if there is no archive yet.
+    """
+    global _ARCHIVE, _ARCHIVE_MTIME
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _ARCHIVE_LOCK:
+        if _ARCHIVE is None or _ARCHIVE_MTIME != mtime:
+            # The previous reader is left to the garbage collector. Records may still be read from it.
+            _ARCHIVE = ProfileArchive(path)
+            _ARCHIVE_MTIME = mtime
+        return _ARCHIVE
+
+
+def read_profile_json(kind, key, profiles_dir=PROFILES_DIR):
+    """
+    Loose file if there is one, otherwise the archived record. None if neither exists.
+    """
+    path = Path(profiles_dir) / kind / f"{key}.json"
+    archive = open_archive()
+    if path.exists():
+        if kind != "matches":
+            return orjson.loads(path.read_bytes())
+        data = path.read_bytes()
+        entry = archive.entry(kind, key) if archive else None
+        if entry is not None:
+            # The loose page log may only hold pages appended since it was last pruned
+            data, _ = _append_pages(archive.raw(kind, key), entry, data)
+        return _decode(kind, data)
+
+    return archive.get(kind, key) if archive else None
+
+
+def profile_json_mtime(kind, key, profiles_dir=PROFILES_DIR):
+    """
+    mtime in nanoseconds of whatever read_profile_json would read, 0 if nothing
+    """
+    try:
+        return os.stat(Path(profiles_dir) / kind / f"{key}.json").st_mtime_ns
+    except FileNotFoundError:
+        pass
+
+    archive = open_archive()
+    entry = archive.entry(kind, key) if archive else None
+    return entry["mtime"] if entry else 0
+
+
+def _loose_files(profiles_dir):
+    for kind in ARCHIVE_KINDS:
+        directory = Path(profiles_dir) / kind
+        if directory.is_dir():
+            for path in directory.glob("*.json"):
+                yield kind, path.stem, path
+
+
+def compact(path=ARCHIVE_PATH, profiles_dir=PROFILES_DIR, prune=False):
+    """
+    Pack loose JSON files, and the records of an existing archive, into a new archive.
+    Loose files win over archived records with the same kind and key, except match page logs, which are appended to.
+
+    With prune, loose files are removed once they are in the archive, unless they changed after they were read.
+    """
+    path = Path(path)
+    previous = ProfileArchive(path) if path.exists() else None
+    loose = list(_loose_files(profiles_dir))
+    loose_keys = {(kind, key) for kind, key, _ in loose}
+
+    index = {kind: {} for kind in ARCHIVE_KINDS}
+    packed = []  # (file path, size, mtime) of every loose file as it was read
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+
+        def _write(kind, key, compressed, mtime, metadata):
+            entry = {"offset": f.tell(), "length": len(compressed), "mtime": mtime, **metadata}
+            index.setdefault(kind, {})[key] = entry
+            f.write(compressed)
+
+        if previous:
+            for kind, entries in previous.index.items():
+                for key, entry in entries.items():
+                    if (kind, key) in loose_keys:
+                        continue
+                    compressed = previous._mmap[entry["offset"] : entry["offset"] + entry["length"]]  # noqa: E203
+                    metadata = {k: v for k, v in entry.items() if k not in ("offset", "length", "mtime")}
+                    _write(kind, key, compressed, entry["mtime"], metadata)
+
+        for kind, key, file_path in loose:
+            data = file_path.read_bytes()
+            stat = file_path.stat()
+            if stat.st_size != len(data):
+                logging.warning(f"Skipping {file_path}, it is being written")
+                continue
+            try:
+                metadata = _index_metadata(kind, data)
+            except orjson.JSONDecodeError:
+                logging.warning(f"Skipping unreadable {file_path}")
+                continue
+
+            archived = previous.entry(kind, key) if previous else None
+            if kind == "matches":
+                if archived is not None:
+                    data, metadata["loose_length"] = _append_pages(previous.raw(kind, key), archived, data)
+                else:
+                    metadata["loose_length"] = len(data)
+
+            _write(kind, key, zlib.compress(data, COMPRESSION_LEVEL), stat.st_mtime_ns, metadata)
+            packed.append((file_path, stat.st_size, stat.st_mtime_ns))
+
+        index_bytes = orjson.dumps(index)
+        index_offset = f.tell()
+        f.write(index_bytes)
+        f.write(FOOTER.pack(index_offset, len(index_bytes), MAGIC))
+
+    if previous:
+        previous.close()
+    os.replace(tmp_path, path)
+    logging.info(f"Packed {len(packed)} loose files into {path} ({path.stat().st_size} bytes)")
+
+    if prune:
+        pruned = 0
+        for file_path, size, mtime in packed:
+            try:
+                stat = file_path.stat()
+            except FileNotFoundError:
+                continue
+            # Written to since it was packed. Left for the next compact.
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                continue
+            file_path.unlink()
+            pruned += 1
+        logging.info(f"Removed {pruned} loose files")
+
+    return path
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("compact", "info"))
+    parser.add_argument("-prune", action="store_true", help="Remove loose files once they are in the archive")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        compact(prune=args.prune)
+    else:
+        with ProfileArchive() as archive:
+            for kind, entries in archive.index.items():
+                size = sum(entry["length"] for entry in entries.values())
+                print(f"{kind:<16} {len(entries):8} records {size:12} bytes")
@@ -0,0 +1,181 @@
+"""
+Video ingestion
+
+Reads frames from a capture device or video file and starts a smurf check on the first frame of every versus loading
+screen, without a screenshot ever touching disk.
+
+Every frame goes through a cheap gate: a strided, grayscale thumbnail is compared with the one taken when the loading
+screen match last ran, and that decision is reused while the scene doesn't change. Comparing with the last evaluated
+frame rather than the previous one also catches fades, and the match is redone every CAPTURE_RECHECK_FRAMES frames
+regardless. Only then is the frame scaled to SCREEN_SIZE and are the race icon regions matched against the race
+templates, which is the layout signature of the loading screen. A loading screen has to hold for CAPTURE_CONFIRM_FRAMES
+frames before the frame is handed to the check, and no other check is started until it is gone.
+"""
+
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2 as cv
+
+from app.image import (
+    LEFT_RACE_COORDINATE,
+    RIGHT_RACE_COORDINATE,
+    crop,
+    race_capture,
+    warm_up,
+)
+from app.smurf_check import execute_smurf_check
+from app.static import (
+    CAPTURE_CONFIRM_FRAMES,
+    CAPTURE_RECHECK_FRAMES,
+    CAPTURE_SCENE_THRESHOLD,
+    CAPTURE_SOURCE,
+)
+
+SCREEN_SIZE = (1920, 1080)  # Coordinates in app.image are for this resolution
+THUMBNAIL_STRIDE = 16
+THUMBNAIL_SIZE = (-(-SCREEN_SIZE[0] // THUMBNAIL_STRIDE), -(-SCREEN_SIZE[1] // THUMBNAIL_STRIDE))
+FPS_LOG_INTERVAL = 10  # Seconds
+
+# Checks run off the capture loop so reading frames never waits on OCR or the API
+_CHECK_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture-check")
+
+
+def thumbnail(frame):
+    small = frame[::THUMBNAIL_STRIDE, ::THUMBNAIL_STRIDE]
+    if (small.shape[1], small.shape[0]) != THUMBNAIL_SIZE:
+        small = cv.resize(small, THUMBNAIL_SIZE, interpolation=cv.INTER_NEAREST)
+    return cv.cvtColor(small, cv.COLOR_BGR2GRAY)
+
+
+def to_screen(frame):
+    """
+    Frame scaled to SCREEN_SIZE, the resolution the coordinates in app.image are for
+    """
+    if (frame.shape[1], frame.shape[0]) == SCREEN_SIZE:
+        return frame
+    return cv.resize(frame, SCREEN_SIZE, interpolation=cv.INTER_LINEAR)
+
+
+def is_loading_screen(frame):
+    """
+    True if both race icons of the versus loading screen are in place
+    """
+    return (
+        race_capture(crop(frame, LEFT_RACE_COORDINATE)) is not None
+        and race_capture(crop(frame, RIGHT_RACE_COORDINATE)) is not None
+    )
+
+
+class LoadingScreenDetector:
+    def __init__(
+        self,
+        scene_threshold=CAPTURE_SCENE_THRESHOLD,
+        confirm_frames=CAPTURE_CONFIRM_FRAMES,
+        recheck_frames=CAPTURE_RECHECK_FRAMES,
+    ):
+        self.scene_threshold = scene_threshold
+        self.confirm_frames = confirm_frames
+        self.recheck_frames = recheck_frames
+        self.reference = None  # Thumbnail of the frame the loading screen match last ran on
+        self.since_evaluation = 0
+        self.loading = False
+        self.streak = 0
+        self.latched = False
+
+    def scene_changed(self, current):
+        return (
+            self.reference is None
+            or self.reference.shape != current.shape
+            or cv.absdiff(self.reference, current).mean() > self.scene_threshold
+        )
+
+    def update(self, frame):
+        """
+        Return the frame scaled to SCREEN_SIZE once per loading screen, on the frame it is confirmed. Frames are BGR
+        at any resolution.
+        """
+        current = thumbnail(frame)
+        self.since_evaluation += 1
+        if self.scene_changed(current) or self.since_evaluation >= self.recheck_frames:
+            frame = to_screen(frame)
+            self.loading = is_loading_screen(frame)
+            self.reference = current
+            self.since_evaluation = 0
+
+        if not self.loading:
+            self.streak = 0
+            self.latched = False
+            return None
+
+        self.streak += 1
+        if self.latched or self.streak < self.confirm_frames:
+            return None
+        self.latched = True
+        return to_screen(frame)
+
+
+def frames(source):
+    """
+    Frames from a device index or a video path at their native resolution
+    """
+    capture = cv.VideoCapture(int(source) if str(source).isdigit() else str(source))
+    if not capture.isOpened():
+        raise ValueError(f"Unable to open capture source {source=}")
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield frame
+    finally:
+        capture.release()
+
+
+def _finished(future):
+    if future.done():
+        if future.exception() is not None:
+            logging.error(f"Smurf check from capture failed: {future.exception()!r}")
+        return True
+    return False
+
+
+def run(source=CAPTURE_SOURCE, open_profile=True):
+    warm_up()
+    detector = LoadingScreenDetector()
+    pending = []
+
+    count = 0
+    window_start = time.perf_counter()
+    for frame in frames(source):
+        confirmed = detector.update(frame)
+        if confirmed is not None:
+            logging.info("Found loading screen, starting smurf check...")
+            pending = [future for future in pending if not _finished(future)]
+            pending.append(
+                _CHECK_EXECUTOR.submit(execute_smurf_check, screenshot_image=confirmed, open_profile=open_profile)
+            )
+
+        count += 1
+        elapsed = time.perf_counter() - window_start
+        if elapsed >= FPS_LOG_INTERVAL:
+            logging.info(f"Capture running at {count / elapsed:.1f} fps")
+            count = 0
+            window_start = time.perf_counter()
+
+    for future in pending:
+        future.result()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    parser = argparse.ArgumentParser(description="Start smurf checks from a video capture source")
+    parser.add_argument("-source", help="Capture device index or video path", default=CAPTURE_SOURCE)
+    parser.add_argument("-no_open_profile", help="Don't open the profile in the browser", action="store_true")
+    args = parser.parse_args()
+
+    logging.info(f"Watching {args.source=} for loading screens...")
+    run(args.source, open_profile=not args.no_open_profile)
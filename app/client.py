@@ -0,0 +1,88 @@
+"""
+Thin client for the smurf check daemon
+"""
+
+import errno
+import logging
+import socket
+import urllib.error
+import urllib.request
+
+import orjson
+
+from app.static import DAEMON_HOST, DAEMON_PORT
+
+# Seconds without a byte from the daemon before the check is reported as failed. Long enough for a warm check, short
+# enough that a stalled daemon doesn't eat the loading screen.
+DAEMON_TIMEOUT = 30
+
+# Connection errors that mean nothing is listening, so the daemon never saw the request
+UNAVAILABLE_ERRNOS = (errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EADDRNOTAVAIL)
+
+
+def request_smurf_check(host=DAEMON_HOST, port=DAEMON_PORT, **kwargs):
+    """
+    Run a smurf check on the daemon. Returns None if the daemon isn't running, so the caller can run it locally
+    instead, and {"error": ...} if the daemon failed the check or timed out.
+
+    Pass identity (an Identity or a dict of its fields) to check for one of our other players.
+    """
+    return _post(host, port, "/check", kwargs)
+
+
+def request_team_smurf_check(host=DAEMON_HOST, port=DAEMON_PORT, **kwargs):
+    """
+    Check every opponent of a team game on the daemon. Returns None if the daemon isn't running, and {"error": ...} if
+    the check failed.
+    """
+    return _post(host, port, "/team_check", kwargs)
+
+
+def _post(host, port, path, kwargs):
+    request = urllib.request.Request(
+        f"http://{host}:{port}{path}",
+        data=orjson.dumps(kwargs),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=DAEMON_TIMEOUT) as response:
+            return orjson.loads(response.read())
+    except urllib.error.HTTPError as e:
+        error = f"Smurf check daemon returned {e.code}: {e.read()}"
+    except urllib.error.URLError as e:
+        if isinstance(e.reason, socket.gaierror) or getattr(e.reason, "errno", None) in UNAVAILABLE_ERRNOS:
+            logging.debug(f"Smurf check daemon unavailable: {e.reason}")
+            return None
+        error = f"Smurf check daemon unavailable: {e.reason}"
+    except orjson.JSONDecodeError as e:
+        error = f"Smurf check daemon returned an unreadable response: {e}"
+    except OSError as e:
+        # Timed out or dropped after the request was sent. The check may still be running on the daemon, so running it
+        # again locally would only compete with it.
+        error = f"Smurf check daemon didn't answer: {e!r}"
+
+    logging.error(error)
+    return {"error": error}
+
+
+def smurf_check(**kwargs):
+    """
+    Run a smurf check on the daemon, falling back to running it in this process if the daemon isn't running.
+    Failures on the daemon are returned as {"error": ...}.
+    """
+    result = request_smurf_check(**kwargs)
+    if result is not None:
+        return result
+
+    logging.info("Smurf check daemon is unavailable. Running the check locally.")
+    from app.player import Identity, identity_from_dict, player_summary
+    from app.smurf_check import execute_smurf_check
+
+    if kwargs.get("identity") and not isinstance(kwargs["identity"], Identity):
+        kwargs["identity"] = identity_from_dict(kwargs["identity"])
+    player, opponent = execute_smurf_check(**kwargs) or (None, None)
+    return {
+        "player": player_summary(player) if player else None,
+        "opponent": player_summary(opponent) if opponent else None,
+    }
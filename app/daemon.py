@@ -0,0 +1,148 @@
+"""
+Resident smurf check service
+
+Keeps imports, templates, my own profile and the HTTP pool warm between checks. The CLI and the watcher talk to it
+through app.client and fall back to running the check in process when it isn't up.
+
+POST /check with a JSON body of execute_smurf_check keyword arguments. An optional "identity" object
+({"name", "race", "character_id", "region"}, name and character_id required) runs the check for another of our
+players. Checks run concurrently.
+POST /team_check with execute_team_smurf_check keyword arguments checks every opponent of a team game.
+GET /health
+"""
+
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import orjson
+
+from app.player import (
+    DEFAULT_IDENTITY,
+    cached_identities,
+    identity_from_dict,
+    player_summary,
+    refresh_my_profile,
+)
+from app.smurf_check import execute_smurf_check, execute_team_smurf_check
+from app.static import DAEMON_HOST, DAEMON_PORT, MY_PROFILE_REFRESH_INTERVAL
+
+CHECK_ARGUMENTS = (
+    "screenshot_path",
+    "opponent_character_id",
+    "opponent_name",
+    "opponent_race",
+    "open_profile",
+    "expand_linked",
+)
+TEAM_CHECK_ARGUMENTS = (
+    "screenshot_path",
+    "team_size",
+)
+
+
+def warm_up():
+    from app.image import warm_up as warm_up_image
+
+    logging.info("Warming up image templates...")
+    warm_up_image()
+
+    if DEFAULT_IDENTITY.character_id:
+        logging.info("Warming up my profile...")
+        refresh_my_profile(DEFAULT_IDENTITY)
+
+
+def refresh_my_profile_forever(interval=MY_PROFILE_REFRESH_INTERVAL):
+    """
+    Refresh the profile of every identity that has been checked for
+    """
+    while True:
+        time.sleep(interval)
+        for identity in cached_identities():
+            try:
+                refresh_my_profile(identity)
+            except Exception as e:
+                logging.error(f"Exception thrown refreshing profile of {identity=}")
+                logging.exception(e)
+
+
+class SmurfCheckHandler(BaseHTTPRequestHandler):
+    def _send_json(self, data, status=200):
+        body = orjson.dumps(data, default=str)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json({"status": "ok"})
+        else:
+            self._send_json({"error": "Not found"}, status=404)
+
+    def do_POST(self):
+        if self.path == "/check":
+            check, arguments = execute_smurf_check, CHECK_ARGUMENTS
+        elif self.path == "/team_check":
+            check, arguments = execute_team_smurf_check, TEAM_CHECK_ARGUMENTS
+        else:
+            self._send_json({"error": "Not found"}, status=404)
+            return
+
+        try:
+            body = orjson.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError(f"Request body must be an object, not {type(body).__name__}")
+            kwargs = {key: value for key, value in body.items() if key in arguments}
+            kwargs["identity"] = identity_from_dict(body.get("identity"))
+        except (orjson.JSONDecodeError, ValueError) as e:
+            self._send_json({"error": str(e)}, status=400)
+            return
+
+        try:
+            result = check(**kwargs)
+        except Exception as e:
+            logging.exception(e)
+            self._send_json({"error": str(e)}, status=500)
+            return
+
+        if check is execute_team_smurf_check:
+            player, opponents = result if result else (None, [])
+            self._send_json(
+                {
+                    "player": player_summary(player) if player else None,
+                    "opponents": [player_summary(opponent) if opponent else None for opponent in opponents],
+                }
+            )
+            return
+
+        player, opponent = result if result else (None, None)
+        self._send_json(
+            {
+                "player": player_summary(player) if player else None,
+                "opponent": player_summary(opponent) if opponent else None,
+            }
+        )
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def serve(host=DAEMON_HOST, port=DAEMON_PORT):
+    warm_up()
+    threading.Thread(target=refresh_my_profile_forever, name="my_profile_timer", daemon=True).start()
+    server = ThreadingHTTPServer((host, port), SmurfCheckHandler)
+    logging.info(f"Smurf check daemon listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+    serve()
@@ -1,28 +1,35 @@
 import logging
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Optional, Tuple
 
 import cv2
 import cv2 as cv
 import numpy as np
+import orjson
 import pytesseract
 from more_itertools import one
-from PIL import Image
 
+from app.image_archive import archive_async
+from app.player import DEFAULT_IDENTITY
 from app.race import Race
 from app.static import (
     BARCODE_TEMPLATE_PATH,
-    MY_PROFILE_NAME,
-    MY_RACE,
-    NAMES_DIR,
+    OCR_CONFIDENCE_THRESHOLD,
+    OCR_MAX_ATTEMPTS,
+    OCR_MAX_REGIONS,
+    OCR_MAX_WORKERS,
+    OCR_TOP_K,
     PROTOSS_TEMPLATE_PATH,
     RANDOM_TEMPLATE_PATH,
-    SCREENSHOTS_DIR,
+    TEAM_LAYOUT_PATH,
+    TEAM_ROW_HEIGHT,
     TERRAN_TEMPLATE_PATH,
-    TMP_DIR,
     ZERG_TEMPLATE_PATH,
 )
 from app.utils.date_utils import timestamp
-from app.utils.file_utils import copy
+from app.utils.timing_utils import stage
 
 
 @dataclass(frozen=True)
@@ -33,6 +40,26 @@ class Coordinate:
     bottom: int
 
 
+@dataclass(frozen=True)
+class NameCandidate:
+    text: str
+    confidence: float  # Tesseract word confidence, 0 to 100
+    variant: str  # Preprocessing it was read with
+
+
+@dataclass(frozen=True)
+class Nameplate:
+    side: str  # "left" or "right"
+    name: Optional[str]
+    race: Optional[str]
+    candidates: Tuple[NameCandidate, ...] = ()  # Every name guess, most confident first. name is the first.
+    slot: int = 0  # Top to bottom within the side
+
+    @property
+    def alternate_names(self):
+        return [candidate.text for candidate in self.candidates if candidate.text != self.name]
+
+
 TEMPLATE_MATCH_THRESHOLD = 0.75
 
 LEFT_NAME_COORDINATE = Coordinate(left=250, top=440, right=500, bottom=470)
@@ -41,79 +68,237 @@ RIGHT_NAME_COORDINATE = Coordinate(left=1920 - 500, top=440, right=1920 - 250, b
 LEFT_RACE_COORDINATE = Coordinate(left=510, top=440, right=570, bottom=490)
 RIGHT_RACE_COORDINATE = Coordinate(left=1920 - 570, top=440, right=1920 - 510, bottom=490)
 
+# (side, name coordinate, race coordinate) of both nameplates, left first
+NAMEPLATE_COORDINATES = (
+    ("left", LEFT_NAME_COORDINATE, LEFT_RACE_COORDINATE),
+    ("right", RIGHT_NAME_COORDINATE, RIGHT_RACE_COORDINATE),
+)
+
+# Players a side of the team loading screens that are looked for
+TEAM_SIZES = (2, 3, 4)
+
+# Tesseract runs in a subprocess per call. The pool bounds how many run at once across all checks in the process.
+_OCR_EXECUTOR = ThreadPoolExecutor(max_workers=OCR_MAX_WORKERS, thread_name_prefix="ocr")
+
+TEMPLATE_PATHS = (
+    BARCODE_TEMPLATE_PATH,
+    ZERG_TEMPLATE_PATH,
+    TERRAN_TEMPLATE_PATH,
+    PROTOSS_TEMPLATE_PATH,
+    RANDOM_TEMPLATE_PATH,
+)
+
+
+def screenshot_workflow(screenshot, identity=None):
+    """
+    Opponent name and race from a screenshot of the versus loading screen, as seen by identity.
+    (None, None) if the screen can't be parsed.
+
+    screenshot is a path or a BGR image already in memory, such as a frame from app.capture.
+    """
+    opponent = opponent_nameplate(screenshot, identity)
+    if opponent is None:
+        return None, None
+
+    logging.info("Done with screenshot parse! ")
+    logging.info(f"{opponent.name=}, {opponent.race=}")
+
+    return opponent.name, opponent.race
+
+
+def opponent_nameplate(screenshot, identity=None):
+    """
+    Nameplate of the opponent on a versus loading screen, as seen by identity, or None if the screen can't be parsed.
+    Unlike screenshot_workflow it keeps the less confident name reads.
+    """
+    identity = identity or DEFAULT_IDENTITY
+    nameplates = loading_screen_nameplates(screenshot, team_size=1)
+    if nameplates is None:
+        return None
+
+    # The opponent is whoever isn't us
+    opponents = [nameplate for nameplate in nameplates if not _is_identity(nameplate, identity)]
+    if len(opponents) != 1:
+        logging.warning(f"Unable to find {identity.name} on one side of the loading screen")
+        return None
+    return one(opponents)
+
+
+def opponent_nameplates(screenshot, identity=None, team_size=None):
+    """
+    Nameplates of every opponent on a versus loading screen, as seen by identity. The team size is detected from the
+    race icons unless it is given. Returns an empty list if the screen can't be parsed.
+    """
+    identity = identity or DEFAULT_IDENTITY
+    nameplates = loading_screen_nameplates(screenshot, team_size)
+    if nameplates is None:
+        return []
+
+    # Opponents are whoever is on the other side from us
+    sides = {nameplate.side for nameplate in nameplates if _is_identity(nameplate, identity)}
+    if len(sides) != 1:
+        logging.warning(f"Unable to find {identity.name} on one side of the loading screen")
+        return []
+    return [nameplate for nameplate in nameplates if nameplate.side not in sides]
+
+
+def _is_identity(nameplate, identity):
+    return identity.name in {nameplate.name, *(candidate.text for candidate in nameplate.candidates)}
+
+
+def loading_screen_nameplates(screenshot, team_size=1):
+    """
+    Every nameplate on a versus loading screen with team_size players a side, or None for a barcode player. The team
+    size is detected from the race icons if it is None.
+    """
+    img = read_image(screenshot)
 
-def screenshot_workflow(screenshot_path):
     # Barcode check
     # TODO Use smaller barcode template image
-    is_barcode = barcode_check(screenshot_path)
+    with stage("barcode"):
+        is_barcode = barcode_check(img)
     if is_barcode:
         logging.warning("You are playing a barcode player!")
-        return None, None
+        return None
 
-    # Crop screenshot
-    left_name_path, right_name_path, left_race_path, right_race_path = crop_screenshot(
-        screenshot_path, output_dir=TMP_DIR
-    )
+    if team_size is None:
+        with stage("team_size"):
+            team_size = detect_team_size(img)
+        logging.info(f"Detected {team_size=}")
 
-    # Profile name capture
-    left_name = name_capture(left_name_path)
-    right_name = name_capture(right_name_path)
+    nameplates = parse_nameplates(img, team_size)
+    for nameplate in nameplates:
+        logging.info(f"{nameplate=}")
 
-    copy(left_name_path, NAMES_DIR / f"{left_name}.png")
-    copy(right_name_path, NAMES_DIR / f"{right_name}.png")
+    # Keep name crops and screenshot. Only handing them to the archive worker is on the check path.
+    with stage("archive"):
+        archive_screenshot(img, nameplates)
+    return nameplates
 
-    # Race capture
-    left_race = race_capture(left_race_path)
-    right_race = race_capture(right_race_path)
 
-    logging.info(f"{left_name=}, {left_race=}")
-    logging.info(f"{right_name=}. {right_race=}")
+def detect_team_size(img):
+    """
+    Largest team size with a race icon in every nameplate slot. Race icons are cheap to match, names are not.
+    """
+    for team_size in sorted(TEAM_SIZES, reverse=True):
+        if all(race_capture(crop(img, race)) for _, _, _, race in nameplate_coordinates(team_size)):
+            return team_size
+    return 1
 
-    # Copy & rename screenshot
-    copy(screenshot_path, SCREENSHOTS_DIR / f"{timestamp()}_{left_name}_{left_race}_{right_name}_{right_race}.png")
 
-    # Detemine opponent details
-    opponent_name = [left_name, right_name]
-    opponent_name.remove(MY_PROFILE_NAME)
-    opponent_name = one(opponent_name)
-    opponent_race = [left_race, right_race]
-    opponent_race.remove(MY_RACE)
-    opponent_race = one(opponent_race)
+@lru_cache(maxsize=None)
+def _team_layouts(path):
+    if not path.exists():
+        return {}
+    return orjson.loads(path.read_bytes())
 
-    logging.info("Done with screenshot parse! ")
-    logging.info(f"{opponent_name=}, {opponent_race=}")
 
-    return opponent_name, opponent_race
+def nameplate_coordinates(team_size=1):
+    """
+    (side, slot, name coordinate, race coordinate) of every nameplate on a loading screen with team_size players a
+    side, left side first.
+
+    Team layouts are read from TEAM_LAYOUT_PATH, keyed by team size, with a list of {"name": ..., "race": ...}
+    coordinates per side, top to bottom. Team sizes it doesn't have stack the 1v1 row TEAM_ROW_HEIGHT apart, centered
+    on it.
+    """
+    if team_size == 1:
+        return [(side, 0, name, race) for side, name, race in NAMEPLATE_COORDINATES]
+
+    layout = _team_layouts(TEAM_LAYOUT_PATH).get(str(team_size))
+    if layout:
+        coordinates = [
+            (side, slot, Coordinate(**plate["name"]), Coordinate(**plate["race"]))
+            for side in ("left", "right")
+            for slot, plate in enumerate(layout[side])
+        ]
+        if len(coordinates) != 2 * team_size:
+            raise ValueError(f"Team layout for {team_size=} in {TEAM_LAYOUT_PATH} needs {team_size} slots a side")
+        return coordinates
+
+    first_offset = -(team_size - 1) * TEAM_ROW_HEIGHT // 2
+    coordinates = []
+    for side, name, race in NAMEPLATE_COORDINATES:
+        for slot in range(team_size):
+            offset = first_offset + slot * TEAM_ROW_HEIGHT
+            coordinates.append((side, slot, _shift(name, offset), _shift(race, offset)))
+    return coordinates
+
+
+def parse_nameplates(img, team_size=1):
+    """
+    Name and race of every player on a loading screen with team_size players a side, left side first
+    """
+    coordinates = nameplate_coordinates(team_size)
+
+    # Profile name capture. Every name is read at once on the shared OCR pool.
+    with stage("ocr", count=len(coordinates)):
+        candidates = list(_OCR_EXECUTOR.map(name_candidates, [crop(img, name) for _, _, name, _ in coordinates]))
+
+    # Race capture
+    with stage("race"):
+        races = [race_capture(crop(img, race)) for _, _, _, race in coordinates]
+
+    return [
+        Nameplate(
+            side=side,
+            slot=slot,
+            name=name_candidates[0].text if name_candidates else None,
+            race=race,
+            candidates=tuple(name_candidates),
+        )
+        for (side, slot, _, _), name_candidates, race in zip(coordinates, candidates, races)
+    ]
+
+
+def archive_screenshot(img, nameplates):
+    """
+    Keep the name crops and the screenshot, labelled with what was parsed from them. Stored in the background.
+    """
+    images = [
+        (crop(img, name_coordinate), "name", nameplate.name)
+        for nameplate, (_, _, name_coordinate, _) in zip(nameplates, nameplate_coordinates(len(nameplates) // 2))
+    ]
+    labels = "_".join(f"{nameplate.name}_{nameplate.race}" for nameplate in nameplates)
+    images.append((img, "screenshot", f"{timestamp()}_{labels}"))
+    archive_async(images)
 
 
-def crop_screenshot(screenshot_path, output_dir):
+def read_image(source):
     """
-    Crop profile names from a screenshot of the versus loading screen
+    BGR image from a path, or the image itself if it is already in memory
     """
+    return source if isinstance(source, np.ndarray) else cv.imread(str(source))
+
+
+def _shift(coordinate, offset):
+    return replace(coordinate, top=coordinate.top + offset, bottom=coordinate.bottom + offset)
 
-    def _crop_and_save(img, coordinate, output_path):
-        crop = img.crop((coordinate.left, coordinate.top, coordinate.right, coordinate.bottom))
-        crop.save(output_path)
-        return output_path
 
-    img = Image.open(screenshot_path)
+def crop(img, coordinate):
+    return img[coordinate.top : coordinate.bottom, coordinate.left : coordinate.right]  # noqa: E203
 
-    left_name_path = _crop_and_save(img, LEFT_NAME_COORDINATE, f"{output_dir}/left_name.png")
-    right_name_path = _crop_and_save(img, RIGHT_NAME_COORDINATE, f"{output_dir}/right_name.png")
 
-    left_race_path = _crop_and_save(img, LEFT_RACE_COORDINATE, f"{output_dir}/left_race.png")
-    right_race_path = _crop_and_save(img, RIGHT_RACE_COORDINATE, f"{output_dir}/right_race.png")
+@lru_cache(maxsize=None)
+def load_template(template_path):
+    return cv.imread(str(template_path), cv.IMREAD_GRAYSCALE)
 
-    return left_name_path, right_name_path, left_race_path, right_race_path
+
+def warm_up():
+    """
+    Load every template so the first check in a long running process doesn't pay for it
+    """
+    for template_path in TEMPLATE_PATHS:
+        load_template(template_path)
 
 
-def template_match(screenshot_path, template_path):
+def template_match(screenshot, template_path):
     """
     Return True if template is found in base image
     """
-    img_rgb = cv.imread(screenshot_path)
+    img_rgb = read_image(screenshot)
     img_gray = cv.cvtColor(img_rgb, cv.COLOR_BGR2GRAY)
-    template = cv.imread(str(template_path), cv.IMREAD_GRAYSCALE)
+    template = load_template(template_path)
     res = cv.matchTemplate(img_gray, template, cv.TM_CCOEFF_NORMED)
     loc = np.where(res >= TEMPLATE_MATCH_THRESHOLD)
     try:
@@ -123,16 +308,70 @@ def template_match(screenshot_path, template_path):
         logging.exception(e)
 
 
-def barcode_check(screenshot_path):
+def barcode_check(screenshot):
     """
     Determine if opponent is barcode from a screenshot of the versus loading screen
     """
-    return template_match(screenshot_path, BARCODE_TEMPLATE_PATH)
+    return template_match(screenshot, BARCODE_TEMPLATE_PATH)
+
+
+def name_capture(name_img, rect_size=20):
+    """
+    Best guess at the profile name in the cropped screenshot, or None
+    """
+    candidates = name_candidates(name_img, rect_size=rect_size)
+    return candidates[0].text if candidates else None
+
+
+def _otsu(gray):
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_OTSU | cv2.THRESH_BINARY_INV)[1]
+
+
+# Preprocessing tried on each text region, cheapest first: (name, scale, binarization or None for the color crop)
+OCR_VARIANTS = (
+    ("color", 1.2, None),
+    ("otsu", 1.2, _otsu),
+    ("otsu_2x", 2.0, _otsu),
+)
+
+
+def _text_regions(img, rect_size):
+    """
+    Bounding boxes of text regions in img, most name-like first. Names are the largest block, centered vertically.
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    rect_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (rect_size, rect_size))
+    dilation = cv2.dilate(_otsu(gray), rect_kernel, iterations=1)
+    contours, _ = cv2.findContours(dilation, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+
+    height = img.shape[0]
+
+    def _rank(box):
+        _, y, w, h = box
+        centrality = 1 - abs(y + h / 2 - height / 2) / height
+        return w * h * centrality
+
+    return sorted((cv2.boundingRect(cnt) for cnt in contours), key=_rank, reverse=True)
+
+
+def _ocr_word(region):
+    """
+    Last word Tesseract reads in region and its confidence. Clan tags come before the name.
+    """
+    data = pytesseract.image_to_data(region, lang="eng", config="--oem 1 --psm 7", output_type=pytesseract.Output.DICT)
+    words = [(text.strip(), float(conf)) for text, conf in zip(data["text"], data["conf"]) if text.strip()]
+    words = [(text, conf) for text, conf in words if conf >= 0]
+    return words[-1] if words else (None, None)
 
 
-def name_capture(input_path, rect_size=20):
+def name_candidates(name_img, rect_size=20, k=OCR_TOP_K):
     """
-    Capture the profile name from the cropped screenshot
+    Up to k guesses at the profile name in the cropped screenshot, most confident first.
+
+    The top ranked text region is read with the cheapest preprocessing first, then with the other variants, then the
+    next regions with the cheapest variant. Reading stops as soon as one guess reaches OCR_CONFIDENCE_THRESHOLD or
+    after OCR_MAX_ATTEMPTS Tesseract calls, so a clean name costs one call. Confidences are Tesseract's word
+    confidences, 0 to 100.
 
     https://stackoverflow.com/questions/9480013/image-processing-to-improve-tesseract-ocr-accuracy
     ^ Resize and other options
@@ -157,31 +396,38 @@ def name_capture(input_path, rect_size=20):
 
     """
     logging.info(f"Using {rect_size=} to parse name from image...")
-    img = cv2.imread(input_path)
-    img = cv2.resize(img, None, fx=1.2, fy=1.2, interpolation=cv2.INTER_CUBIC)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    _, thresh1 = cv2.threshold(gray, 0, 255, cv2.THRESH_OTSU | cv2.THRESH_BINARY_INV)
-    rect_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (rect_size, rect_size))
-    dilation = cv2.dilate(thresh1, rect_kernel, iterations=1)
-    contours, _ = cv2.findContours(dilation, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-    img_copy = img.copy()
-    for cnt in contours:
-        x, y, w, h = cv2.boundingRect(cnt)
-        cropped = img_copy[y : y + h, x : x + w]  # noqa: E203
-        text = pytesseract.image_to_string(cropped, lang="eng", config="--oem 1 --psm 7").strip()
-        if text:
-            logging.info(f"Found {text=}")
-            if " " in text:
-                text = text.split(" ")[-1]
-            return text
-
-
-def race_capture(input_path):
-    if template_match(input_path, ZERG_TEMPLATE_PATH):
+    img = read_image(name_img)
+    regions = _text_regions(img, rect_size)[:OCR_MAX_REGIONS]
+
+    if not regions:
+        return []
+    attempts = [(variant, regions[0]) for variant in OCR_VARIANTS] + [(OCR_VARIANTS[0], box) for box in regions[1:]]
+
+    best = {}
+    for (variant, scale, binarize), (x, y, w, h) in attempts[:OCR_MAX_ATTEMPTS]:
+        region = img[y : y + h, x : x + w]  # noqa: E203
+        region = cv2.resize(region, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+        if binarize is not None:
+            region = binarize(cv2.cvtColor(region, cv2.COLOR_BGR2GRAY))
+
+        text, confidence = _ocr_word(region)
+        if not text:
+            continue
+        logging.info(f"Found {text=} with {confidence=} using {variant=}")
+        if text not in best or confidence > best[text].confidence:
+            best[text] = NameCandidate(text=text, confidence=confidence, variant=variant)
+        if confidence >= OCR_CONFIDENCE_THRESHOLD:
+            break
+
+    return sorted(best.values(), key=lambda candidate: candidate.confidence, reverse=True)[:k]
+
+
+def race_capture(race_img):
+    if template_match(race_img, ZERG_TEMPLATE_PATH):
         return Race.ZERG.value
-    elif template_match(input_path, TERRAN_TEMPLATE_PATH):
+    elif template_match(race_img, TERRAN_TEMPLATE_PATH):
         return Race.TERRAN.value
-    elif template_match(input_path, PROTOSS_TEMPLATE_PATH):
+    elif template_match(race_img, PROTOSS_TEMPLATE_PATH):
         return Race.PROTOSS.value
-    elif template_match(input_path, RANDOM_TEMPLATE_PATH):
+    elif template_match(race_img, RANDOM_TEMPLATE_PATH):
         return Race.RANDOM.value
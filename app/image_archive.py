@@ -0,0 +1,250 @@
+"""
+Image archive
+
+Screenshots and name crops kept for reprocessing, stored by the hash of their pixels so a repeated image is stored
+once, and encoded with fast PNG compression. Every stored image is a line in an append-only index with its kind and
+label. Retention drops the oldest entries once the archive is over IMAGE_ARCHIVE_MAX_BYTES or they are older than
+IMAGE_ARCHIVE_MAX_AGE_DAYS, deletes images nothing refers to any more and rewrites the index.
+
+Several processes can share an archive (the daemon, the Flask app, the CLI). Every change to the index is made under a
+lock file, after catching up with what the other processes appended or rewrote since the last look.
+
+Checks hand images to archive_async, which stores them on a background worker.
+
+python -m app.image_archive info
+python -m app.image_archive prune
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+import cv2 as cv
+import orjson
+from filelock import FileLock
+
+from app.static import (
+    IMAGE_ARCHIVE_DIR,
+    IMAGE_ARCHIVE_MAX_AGE_DAYS,
+    IMAGE_ARCHIVE_MAX_BYTES,
+    IMAGE_ARCHIVE_PNG_COMPRESSION,
+)
+
+# Archival never runs on the check itself
+_ARCHIVE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image_archive")
+
+
+@dataclass
+class ArchivedImage:
+    hash: str
+    kind: str
+    label: Optional[str]
+    archived_at: float  # Epoch seconds
+    size: int  # Bytes of the stored image, shared by every entry with the same hash
+
+
+def image_hash(img):
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(str(img.shape).encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+class ImageArchive:
+    def __init__(
+        self,
+        root=IMAGE_ARCHIVE_DIR,
+        max_bytes=IMAGE_ARCHIVE_MAX_BYTES,
+        max_age=IMAGE_ARCHIVE_MAX_AGE_DAYS * 24 * 60 * 60,
+    ):
+        self.root = Path(root)
+        self.index_path = self.root / "index.jsonl"
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._file_lock = FileLock(self.root / "index.lock")  # Held by one process at a time
+        self._reset()
+        with self._lock, self._file_lock:
+            self._sync()
+
+    def _reset(self):
+        self._entries = []
+        self._refs = Counter()
+        self._sizes = {}
+        self._total = 0
+        self._index_id = None  # (device, inode) of the index file last read
+        self._offset = 0  # Bytes of it already read
+
+    def _track(self, entry):
+        self._entries.append(entry)
+        self._refs[entry.hash] += 1
+        if entry.hash not in self._sizes:
+            self._sizes[entry.hash] = entry.size
+            self._total += entry.size
+
+    def _sync(self):
+        """
+        Catch up with the index on disk: read lines other processes appended, or reload it if it was rewritten.
+        Called with the file lock held.
+        """
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            self._reset()
+            return
+
+        if (stat.st_dev, stat.st_ino) != self._index_id or stat.st_size < self._offset:
+            self._reset()
+            self._index_id = (stat.st_dev, stat.st_ino)
+        if stat.st_size == self._offset:
+            return
+
+        with open(self.index_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+
+        complete = data[: data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            if not line:
+                continue
+            try:
+                self._track(ArchivedImage(**orjson.loads(line)))
+            except (orjson.JSONDecodeError, TypeError):
+                logging.warning(f"Skipping unreadable entry in {self.index_path}: {line[:100]!r}")
+        self._offset += len(complete)
+
+    def path(self, entry):
+        return self.root / "objects" / entry.hash[:2] / f"{entry.hash}.png"
+
+    def entries(self, kind=None):
+        with self._lock, self._file_lock:
+            self._sync()
+            return [entry for entry in self._entries if kind is None or entry.kind == kind]
+
+    def add(self, img, kind, label=None):
+        """
+        Store an image unless the same pixels are already stored, and index it
+        """
+        entry = ArchivedImage(hash=image_hash(img), kind=kind, label=label, archived_at=time.time(), size=0)
+        with self._lock, self._file_lock:
+            self._sync()
+            if entry.hash in self._sizes:
+                entry.size = self._sizes[entry.hash]
+            else:
+                ok, encoded = cv.imencode(".png", img, [cv.IMWRITE_PNG_COMPRESSION, IMAGE_ARCHIVE_PNG_COMPRESSION])
+                if not ok:
+                    logging.error(f"Unable to encode {kind} {label} for the image archive")
+                    return None
+                path = self.path(entry)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(encoded.tobytes())
+                entry.size = len(encoded)
+
+            with open(self.index_path, "ab") as f:
+                f.write(orjson.dumps(asdict(entry)) + b"\n")
+                f.flush()
+                stat = os.fstat(f.fileno())
+            # Synced just before, so this process has now read the whole index
+            self._index_id = (stat.st_dev, stat.st_ino)
+            self._offset = stat.st_size
+            self._track(entry)
+
+            if self._total > self.max_bytes or self._entries[0].archived_at < time.time() - self.max_age:
+                self._enforce_retention()
+        return entry
+
+    def enforce_retention(self):
+        with self._lock, self._file_lock:
+            self._sync()
+            return self._enforce_retention()
+
+    def _enforce_retention(self):
+        """
+        Drop entries, oldest first, until the archive is within its age and size limits. Returns how many were dropped.
+        Called with the file lock held and the index just synced, so entries other processes added are kept.
+        """
+        cutoff = time.time() - self.max_age
+        dropped = 0
+        for entry in self._entries:
+            if entry.archived_at >= cutoff and self._total <= self.max_bytes:
+                break
+            dropped += 1
+            self._refs[entry.hash] -= 1
+            if self._refs[entry.hash] == 0:
+                del self._refs[entry.hash]
+                self._total -= self._sizes.pop(entry.hash)
+                self.path(entry).unlink(missing_ok=True)
+
+        if not dropped:
+            return 0
+
+        self._entries = self._entries[dropped:]
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(orjson.dumps(asdict(entry)) + b"\n" for entry in self._entries))
+        os.replace(tmp_path, self.index_path)
+        stat = os.stat(self.index_path)
+        self._index_id = (stat.st_dev, stat.st_ino)
+        self._offset = stat.st_size
+        logging.info(f"Dropped {dropped} images from the archive. {self._total} bytes remain.")
+        return dropped
+
+    def info(self):
+        with self._lock, self._file_lock:
+            self._sync()
+            return {
+                "entries": len(self._entries),
+                "images": len(self._sizes),
+                "bytes": self._total,
+                "kinds": dict(Counter(entry.kind for entry in self._entries)),
+            }
+
+
+_ARCHIVE = None
+_ARCHIVE_LOCK = threading.Lock()
+
+
+def image_archive():
+    global _ARCHIVE
+    with _ARCHIVE_LOCK:
+        if _ARCHIVE is None:
+            _ARCHIVE = ImageArchive()
+        return _ARCHIVE
+
+
+def _archive_all(images):
+    archive = image_archive()
+    for img, kind, label in images:
+        try:
+            archive.add(img, kind, label)
+        except Exception as e:
+            logging.error(f"Exception thrown archiving {kind} {label}")
+            logging.exception(e)
+
+
+def archive_async(images):
+    """
+    Store (image, kind, label) tuples on the archive worker. The images must not be modified afterwards.
+    """
+    return _ARCHIVE_EXECUTOR.submit(_archive_all, images)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    parser = argparse.ArgumentParser(description="Inspect or prune the image archive")
+    parser.add_argument("command", choices=("info", "prune"))
+    args = parser.parse_args()
+
+    if args.command == "prune":
+        image_archive().enforce_retention()
+    print(orjson.dumps(image_archive().info(), option=orjson.OPT_INDENT_2).decode())
@@ -1,15 +1,28 @@
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from time import perf_counter
 from typing import Dict, Optional
 
-from more_itertools import one
-
 from app.api import get_matches
+from app.archive import read_profile_json
 from app.player import GAMES_PLAYED_MAP, Player
-from app.static import MATCH_COUNT, MIN_MATCH_DURATION
+from app.static import (
+    MATCH_COUNT,
+    MATCH_HISTORY_DIR,
+    MATCH_STATS_CHECKPOINT,
+    MATCH_STATS_STABLE_CHECKPOINTS,
+    MAX_STALE_PAGES,
+    MIN_MATCH_DURATION,
+    PROFILES_DIR,
+)
 from app.utils.date_utils import DEFUALT_DATE_FORMAT, timestamp
-from app.utils.file_utils import write_json
+from app.utils.file_utils import write_compact_json, write_json
 from app.utils.math_utils import average
+from app.utils.timing_utils import stage
+
+# Ladder match type by players per team
+MATCH_TYPES = {1: "_1V1", 2: "_2V2", 3: "_3V3", 4: "_4V4"}
 
 
 @dataclass
@@ -21,7 +34,9 @@ class Match:
     map: str
     result: str
     type: str
-    participants: Optional[Dict] = None
+    participants: Optional[Dict] = None  # Raw participants. Only present in match payloads written before decode_match.
+    rating: Optional[int] = None  # Player's rating after the match
+    participant_count: Optional[int] = None
 
 
 @dataclass
@@ -46,103 +61,215 @@ class MatchStats:
     same_race_loss_percent: float
     smurf_score: float
     smurf_qual: str
+    early_stopped: bool = False  # Paging stopped once the smurf qual settled, before every available match was read
+
+
+@dataclass
+class AccountStats:
+    """
+    Smurf signal across every checked character of an account
+    """
+
+    character_count: int
+    max_smurf_score: Optional[float]
+    avg_smurf_score: Optional[float]
+    smurf_qual: Optional[str]
+    smurf_scores: Dict[str, Optional[float]]
 
 
-def get_matches_for_profile(profile, matchType="_1V1", match_count=MATCH_COUNT):
+def _member_race(member):
+    races = [race for race, games_played in GAMES_PLAYED_MAP.items() if games_played in member]
+    return races[0] if len(races) == 1 else None
+
+
+def decode_match(match, profile):
+    """
+    Build a Match from a raw match history entry in a single pass over its participants.
+
+    Missing fields decode to None. Returns None only when the player isn't a participant.
+    """
+    player_id = profile.character_id
+    player = None
+    opponent = None
+    opponent_id = None
+    participant_count = 0
+    for participant in match.get("participants") or ():
+        participant_count += 1
+        character_id = str((participant.get("participant") or {}).get("playerCharacterId"))
+        if character_id == player_id:
+            player = participant
+        elif opponent_id is None:
+            opponent, opponent_id = participant, character_id
+        else:
+            # More than one opponent, there is no single opponent to report
+            opponent, opponent_id = None, ""
+
+    if player is None:
+        return None
+
+    opponent_id = opponent_id or None
+    opponent_team = (opponent or {}).get("team") or {}
+    opponent_member = None
+    for member in opponent_team.get("members") or ():
+        if str((member.get("character") or {}).get("id")) == opponent_id:
+            opponent_member = member
+            break
+
+    info = match.get("match") or {}
+    player_team = player.get("team") or {}
+    player_team_state = (player.get("teamState") or {}).get("teamState") or {}
+    return Match(
+        player=Player(
+            character_id=player_id, name=profile.name, race=profile.race, rating_last=player_team.get("rating")
+        ),
+        opponent=Player(
+            character_id=opponent_id,
+            name=(opponent_member.get("character") or {}).get("name") if opponent_member else None,
+            race=_member_race(opponent_member) if opponent_member else None,
+            rating_last=opponent_team.get("rating"),
+        ),
+        date=info.get("date"),
+        duration=info.get("duration") or 0,
+        map=(match.get("map") or {}).get("name"),
+        result=(player.get("participant") or {}).get("decision"),
+        type=info.get("type"),
+        rating=player_team_state.get("rating"),
+        participant_count=participant_count,
+    )
+
+
+def _step_back(date):
+    """
+    One second before date. Used to jump past a page boundary that keeps returning matches we already have.
+    """
+    return (datetime.fromisoformat(date) - timedelta(seconds=1)).strftime(DEFUALT_DATE_FORMAT)
+
+
+def _match_id(match):
+    return (match.get("match") or {}).get("id")
+
+
+def _smurf_qual_settled(profile, matches, quals):
+    """
+    Record smurf_qual every MATCH_STATS_CHECKPOINT matches. Settled once it holds for MATCH_STATS_STABLE_CHECKPOINTS
+    checkpoints in a row, at which point further pages are unlikely, but not certain, to move the band. Stats computed
+    from an early stop are flagged with early_stopped.
+    """
+    if len(matches) < MATCH_STATS_CHECKPOINT * (len(quals) + 1):
+        return False
+
+    quals.append(get_match_stats(replace(profile, matches=matches)).smurf_qual)
+    recent = quals[-MATCH_STATS_STABLE_CHECKPOINTS:]
+    return len(recent) == MATCH_STATS_STABLE_CHECKPOINTS and len(set(recent)) == 1
+
+
+def _is_match_type(match, matchType):
+    """
+    The API doesn't respect match_type, so check the type, and that 1v1 games have only two participants
+    """
+    participant_count = len(match.get("participants") or ())
+    return (match.get("match") or {}).get("type") == matchType and not (matchType == "_1V1" and participant_count > 2)
+
+
+def newest_match_date(character_id, matchType="_1V1"):
+    """
+    Date of the most recent match of matchType, never from the API cache. Usually a single page request, pages of
+    other match types are skipped for up to MAX_STALE_PAGES pages.
+    """
+    date = timestamp(format=DEFUALT_DATE_FORMAT)
+    for _ in range(MAX_STALE_PAGES):
+        page = get_matches(character_id, date=date, matchType=matchType, ttl=0).get("result", [])
+        if not page:
+            return None
+        for match in page:
+            if _is_match_type(match, matchType):
+                return match["match"].get("date")
+        date = (page[-1].get("match") or {}).get("date") or _step_back(date)
+    return None
+
+
+def get_matches_for_profile(profile, matchType="_1V1", match_count=MATCH_COUNT, early_stop=True, deadline=None):
+    """
+    Page backwards through match history. The API's date/type/map path segments are a cursor, so each page continues
+    from the last match of the previous one. Page size is fixed by the API.
+
+    Paging stops at deadline (a perf_counter value) with whatever matches have been found by then.
+    """
+    profile.early_stopped = False
     date = timestamp(format=DEFUALT_DATE_FORMAT)
+    type_cursor = matchType
+    map_cursor = 1
     matches = []
+    seen_ids = set()
+    quals = []
     stale_count = 0
-    while len(matches) < match_count and stale_count <= 4:
+    page_count = 0
+    while len(matches) < match_count and stale_count < MAX_STALE_PAGES:
+        if deadline is not None and perf_counter() >= deadline:
+            logging.info(f"Out of time after {len(matches)} matches for {profile.name}.")
+            break
+
         logging.info(f"Getting matches starting from {date=}")
-        data = get_matches(profile.character_id, date=date, matchType=matchType)
-        write_json(data=data, path=f"profiles/matches/{profile.character_id}.json", mode="a")
-
-        result = data.get("result", [])
-
-        potential_matches = []
-        # NOTE: Append all matches to potential matches!
-        # We need the dates from recent invalid matches to search for more potentials
-        for match in result:
-            try:
-                player_id = profile.character_id
-                participants = get_match_participants(match)
-
-                result = participants[player_id]["participant"]["decision"]
-                type = match["match"]["type"]
-                date = match["match"]["date"]
-                duration = match["match"]["duration"] if match["match"]["duration"] is not None else 0
-                map = match["map"]["name"]
-                player_mmr = participants[player_id]["team"]["rating"] if participants[player_id]["team"] else None
-
-                try:
-                    opponent_id = str(one(list(filter(lambda x: str(x) != str(player_id), list(participants)))))
-                except Exception:
-                    opponent_id = None
-
-                opponent_team = participants[opponent_id]["team"] if opponent_id else None
-                opponent_mmr = opponent_team["rating"] if opponent_team and opponent_id else None
-                opponent_members = opponent_team["members"] if opponent_team and opponent_id else None
-                opponent_characters = {}
-                if opponent_members:
-                    for member in opponent_members:
-                        character_id = str(member["character"]["id"])
-                        opponent_characters[character_id] = member
-
-                opponent_character = opponent_characters[opponent_id] if opponent_id in opponent_characters else None
-                opponent_name = opponent_character["character"]["name"] if opponent_id in opponent_characters else None
-
-                try:
-                    opponent_race = (
-                        one([race for race in GAMES_PLAYED_MAP if GAMES_PLAYED_MAP[race] in opponent_character])
-                        if opponent_id in opponent_characters and opponent_character
-                        else None
-                    )
-                except Exception:
-                    opponent_race = None
-                    logging.debug("Exception thrown parsing opponent Race")
-
-                potential_matches.append(
-                    Match(
-                        player=Player(
-                            character_id=player_id, name=profile.name, race=profile.race, rating_last=player_mmr
-                        ),
-                        opponent=Player(
-                            character_id=opponent_id,
-                            name=opponent_name,
-                            race=opponent_race,
-                            rating_last=opponent_mmr,
-                        ),
-                        date=date,
-                        duration=duration,
-                        map=map,
-                        result=result,
-                        type=type,
-                        participants=participants,
-                    )
-                )
-            except Exception as e:
-                logging.error("Exception thrown parsing match")
-                logging.exception(f"{match=}")
-                raise e
-
-        if potential_matches:
-            date = potential_matches[-1].date  # Set date to last game in set for next iteration API call
-
-            # API doesn't seem to respect match_type param. Purge them here
-            potential_matches = list(filter(lambda match: match.type == "_1V1", potential_matches))
-
-            # Filter out games with more than two participants
-            potential_matches = list(filter(lambda match: len(match.participants) <= 2, potential_matches))
-
-            matches = matches + potential_matches
-        else:
-            # TODO Work on logic to try another date
-            stale_count += 1
+        page_count += 1
+        with stage("matches_page", page=page_count) as span:
+            data = get_matches(profile.character_id, date=date, matchType=type_cursor, map_id=map_cursor)
+            write_json(data=data, path=f"profiles/matches/{profile.character_id}.json", mode="a")
+
+            page = data.get("result", [])
+            new_matches = [match for match in page if _match_id(match) not in seen_ids]
+            span.attributes.update(results=len(page), new=len(new_matches))
+
+        if not page:
+            logging.info("Reached the end of the match history.")
+            break
 
+        if not new_matches:
+            # Cursor didn't move. Jump past the boundary instead of asking for the same page again.
+            stale_count += 1
+            date = _step_back(date)
+            continue
+
+        stale_count = 0
+        last_info = page[-1].get("match") or {}
+        date = last_info.get("date") or _step_back(date)
+        type_cursor = last_info.get("type") or type_cursor
+        map_cursor = (page[-1].get("map") or {}).get("id", 1)
+
+        for match in new_matches:
+            seen_ids.add(_match_id(match))
+
+            # Skip other match types before parsing
+            if not _is_match_type(match, matchType):
+                continue
+
+            decoded = decode_match(match, profile)
+            if decoded is None:
+                logging.warning(f"Skipping match {_match_id(match)} without {profile.character_id=}")
+                continue
+            matches.append(decoded)
+
+        if early_stop and _smurf_qual_settled(profile, matches, quals):
+            # Not a guarantee. Older matches could still move the qual, so the stats say they were cut short.
+            logging.info(f"Smurf qual settled at {quals[-1]} after {len(matches)} matches. Stopping early.")
+            profile.early_stopped = True
+            break
+
+    matches = matches[:match_count]
     logging.info(f"Found {len(matches)} matches for {profile.name}.")
     return matches
 
 
+def get_smurf_qual(count):
+    if count < 2:
+        return "Unlikely"
+    elif 2 <= count < 2.75:
+        return "Possible"
+    elif 2.75 <= count <= 3.5:
+        return "Likely"
+    else:
+        return "Definitely"
+
+
 def get_smurf_score(mmr_delta, smurf_win_loss_ratio, avg_duration_ratio, smurf_loss_percent, same_race_loss_percent):
     """
     5 categories for smurfing:
@@ -218,17 +345,7 @@ def get_smurf_score(mmr_delta, smurf_win_loss_ratio, avg_duration_ratio, smurf_l
         count += 0.25
     logging.debug(f"After same race loss % {count=}")
 
-    def _qual(count):
-        if count < 2:
-            return "Unlikely"
-        elif 2 <= count < 2.75:
-            return "Possible"
-        elif 2.75 <= count <= 3.5:
-            return "Likely"
-        else:
-            return "Definitely"
-
-    qual = _qual(count)
+    qual = get_smurf_qual(count)
     logging.info(f"Smurf check: {count=}, {qual=}")
     return count, qual
 
@@ -272,10 +389,11 @@ def get_match_stats(player):
 
     win_percent = round(win_count / match_count * 100) if match_count else None
 
-
     avg_loss_duration = round(average([match.duration for match in losses])) if losses else None
     avg_win_duration = round(average([match.duration for match in wins])) if wins else None
-    avg_duration_ratio = round(avg_win_duration / avg_loss_duration, 2) if avg_loss_duration and avg_win_duration else None
+    avg_duration_ratio = (
+        round(avg_win_duration / avg_loss_duration, 2) if avg_loss_duration and avg_win_duration else None
+    )
 
     logging.info(f"{len(losses)} Losses, {len(wins)} Wins")
 
@@ -337,12 +455,40 @@ def get_match_stats(player):
         mmr_delta=mmr_delta,
         smurf_score=smurf_score,
         smurf_qual=smurf_qual,
+        early_stopped=bool(player.early_stopped),
     )
 
 
-def get_match_participants(match):
-    participants = {}
-    for participant in match["participants"]:
-        participants[str(participant["participant"]["playerCharacterId"])] = participant
+def get_account_stats(players):
+    """
+    Aggregate the smurf scores of players linked to one account. The account is as suspicious as its most
+    suspicious character.
+    """
+    smurf_scores = {player.character_id: player.stats.smurf_score if player.stats else None for player in players}
+    scores = [score for score in smurf_scores.values() if score is not None]
+    max_smurf_score = max(scores) if scores else None
+    return AccountStats(
+        character_count=len(players),
+        max_smurf_score=max_smurf_score,
+        avg_smurf_score=round(average(scores), 2) if scores else None,
+        smurf_qual=get_smurf_qual(max_smurf_score) if max_smurf_score is not None else None,
+        smurf_scores=smurf_scores,
+    )
 
-    return participants
+
+def write_player_matches(player, directory=MATCH_HISTORY_DIR):
+    write_compact_json(data=player.matches or [], path=directory / f"{player.character_id}.json")
+
+
+def load_player_matches(character_id, profiles_dir=PROFILES_DIR):
+    """
+    Load the match payload stored separately from the stats summary, or None if there is none
+    """
+    matches = read_profile_json("match_history", character_id, profiles_dir=profiles_dir)
+    if matches is None:
+        return None
+
+    return [
+        Match(**{**match, "player": Player(**match["player"]), "opponent": Player(**match["opponent"])})
+        for match in matches
+    ]
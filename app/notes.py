@@ -0,0 +1,127 @@
+"""
+Player notes
+
+Notes are appended to one log shared by every character. Each note is a single write to a file opened with O_APPEND,
+so a note is either fully written or not at all and writers never rewrite each other's notes. An in-memory inverted
+index over the log answers searches across all characters. Per-character JSON files from before the log are still read.
+"""
+
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+
+import orjson
+
+from app.static import NOTES_DIR, NOTES_LOG_PATH
+from app.utils.date_utils import timestamp
+
+NOTE_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return {token.lower() for token in TOKEN_PATTERN.findall(text or "")}
+
+
+class NotesStore:
+    def __init__(self, log_path=NOTES_LOG_PATH, notes_dir=NOTES_DIR):
+        self.log_path = Path(log_path)
+        self.notes_dir = Path(notes_dir)
+        self._lock = threading.Lock()
+        self._notes = {}  # character id -> {date: note}
+        self._index = {}  # token -> {(character id, date)}
+        self._offset = 0  # Bytes of the log already indexed
+        self._load_legacy()
+
+    def _add(self, character_id, date, note):
+        self._notes.setdefault(character_id, {})[date] = note
+        for token in tokenize(note) | tokenize(character_id):
+            self._index.setdefault(token, set()).add((character_id, date))
+
+    def _load_legacy(self):
+        if not self.notes_dir.is_dir():
+            return
+        for path in self.notes_dir.glob("*.json"):
+            try:
+                notes = orjson.loads(path.read_bytes())
+            except orjson.JSONDecodeError:
+                logging.warning(f"Skipping unreadable notes file {path}")
+                continue
+            for date, note in notes.items():
+                self._add(path.stem, date, note)
+
+    def _refresh(self):
+        """
+        Index notes appended since the last read, including ones written by other processes
+        """
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        # Leave a partially written last line for the next refresh
+        complete = data[: data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            if not line:
+                continue
+            try:
+                record = orjson.loads(line)
+                self._add(str(record["character_id"]), record["date"], record["note"])
+            except (orjson.JSONDecodeError, KeyError, TypeError):
+                # A crash can leave a truncated line behind, one bad note must not hide the rest
+                logging.warning(f"Skipping unreadable note in {self.log_path}: {line[:100]!r}")
+        self._offset += len(complete)
+
+    def append(self, character_id, note, date=None):
+        character_id = str(character_id)
+        record = {"character_id": character_id, "date": date or timestamp(format=NOTE_DATE_FORMAT), "note": note}
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, orjson.dumps(record) + b"\n")
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        with self._lock:
+            self._refresh()
+        return record
+
+    def notes(self, character_id):
+        with self._lock:
+            self._refresh()
+            return dict(self._notes.get(str(character_id), {}))
+
+    def search(self, query, limit=100):
+        """
+        Notes containing every word of the query, newest first
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            self._refresh()
+            matches = set.intersection(*(self._index.get(token, set()) for token in tokens))
+            results = [
+                {"character_id": character_id, "date": date, "note": self._notes[character_id][date]}
+                for character_id, date in matches
+            ]
+
+        return sorted(results, key=lambda result: result["date"], reverse=True)[:limit]
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def notes_store():
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = NotesStore()
+        return _STORE
@@ -1,13 +1,26 @@
 import logging
-from dataclasses import dataclass
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
 from itertools import product
 from typing import Any, Optional
 
 from more_itertools import one
 
 from app.api import get_character_common, get_character_search, get_character_summary
-from app.static import MATCH_COUNT, PROFILES_DIR
+from app.static import (
+    API_CACHE_TTL,
+    MATCH_COUNT,
+    MY_CHARACTER_ID,
+    MY_PROFILE_MAX_AGE,
+    MY_PROFILE_NAME,
+    MY_RACE,
+    MY_REGION,
+    PROFILES_DIR,
+)
 from app.utils.file_utils import write_json
+from app.utils.timing_utils import annotate
 
 
 @dataclass
@@ -23,6 +36,45 @@ class Player:
     matches: Optional[Any] = None
     stats: Optional[Any] = None
     mmr_plot_path: Optional[str] = None
+    account_stats: Optional[Any] = None
+    early_stopped: Optional[bool] = None  # Set by get_matches_for_profile, see MatchStats.early_stopped
+
+
+@dataclass(frozen=True)
+class Identity:
+    """
+    The account a check is run for. The opponent is whoever else is on the loading screen.
+    """
+
+    name: Optional[str] = None
+    race: Optional[str] = None
+    character_id: Optional[str] = None
+    region: Optional[str] = None
+
+
+DEFAULT_IDENTITY = Identity(name=MY_PROFILE_NAME, race=MY_RACE, character_id=MY_CHARACTER_ID, region=MY_REGION)
+
+
+def identity_from_dict(data):
+    """
+    Identity from request data, or the configured account if there is none. Raises ValueError for anything that isn't
+    an identity object.
+    """
+    if not data:
+        return DEFAULT_IDENTITY
+    if not isinstance(data, dict):
+        raise ValueError(f"identity must be an object, not {type(data).__name__}")
+    if data.get("character_id") in (None, ""):
+        raise ValueError("identity requires a character_id")
+    if not data.get("name"):
+        # The name is how we are told apart from the opponent on the loading screen
+        raise ValueError("identity requires a name")
+    return Identity(
+        name=data.get("name"),
+        race=data.get("race"),
+        character_id=str(data["character_id"]),
+        region=data.get("region"),
+    )
 
 
 GAMES_PLAYED_MAP = {
@@ -33,10 +85,14 @@ GAMES_PLAYED_MAP = {
 }
 
 
-def player_from_character_id(character_id, name=None, race=None):
-    data = get_character_common(character_id, query="?matchType=_1V1")
-    write_json(data=data, path=PROFILES_DIR / f"common/{character_id}.json")
-    profile = data["linkedDistinctCharacters"][0]  # TODO This is really a guess.
+def player_summary(player):
+    """
+    Player fields and stats without the raw match payload
+    """
+    return {field.name: getattr(player, field.name) for field in fields(player) if field.name != "matches"}
+
+
+def _player_from_linked_character(profile, name=None, race=None):
     members = profile["members"]
     character = members["character"]
 
@@ -46,7 +102,7 @@ def player_from_character_id(character_id, name=None, race=None):
     rating_max = profile["ratingMax"]
     rating_last = profile["currentStats"]["rating"]
     return Player(
-        character_id=str(character_id),
+        character_id=str(character["id"]),
         name=name,
         race=race,
         rating_max=rating_max,
@@ -55,8 +111,35 @@ def player_from_character_id(character_id, name=None, race=None):
     )
 
 
-def player_from_summary(character_id, name, race, region, depth=MATCH_COUNT):
-    data = get_character_summary(character_id, depth=depth)
+def player_from_character_id(character_id, name=None, race=None):
+    data = get_character_common(character_id, query="?matchType=_1V1")
+    write_json(data=data, path=PROFILES_DIR / f"common/{character_id}.json")
+    profile = data["linkedDistinctCharacters"][0]  # TODO This is really a guess.
+    player = _player_from_linked_character(profile, name=name, race=race)
+    player.character_id = str(character_id)
+    return player
+
+
+def linked_players(character_id):
+    """
+    Every character linked to the same account as character_id, excluding itself
+    """
+    data = get_character_common(character_id, query="?matchType=_1V1")
+    players = []
+    for profile in data.get("linkedDistinctCharacters", []):
+        try:
+            player = _player_from_linked_character(profile)
+        except Exception as e:
+            logging.warning("Skipping linked character that couldn't be parsed")
+            logging.debug(e)
+            continue
+        if player.character_id != str(character_id):
+            players.append(player)
+    return players
+
+
+def player_from_summary(character_id, name, race, region, depth=MATCH_COUNT, ttl=API_CACHE_TTL):
+    data = get_character_summary(character_id, depth=depth, ttl=ttl)
     write_json(data=data, path=PROFILES_DIR / f"summary/{character_id}.json")
     if len(data) == 1:
         profile = data[0]
@@ -77,6 +160,50 @@ def player_from_summary(character_id, name, race, region, depth=MATCH_COUNT):
     )
 
 
+# Our own profiles keyed by Identity -> (fetched at, Player). Refreshed in the background so the live path of a
+# check never waits on the summary request once the slot is filled.
+_MY_PROFILES = {}
+_MY_PROFILES_LOCK = threading.Lock()
+_MY_PROFILE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="my_profile")
+
+
+def refresh_my_profile(identity):
+    # Always a fresh request, a cached summary would miss the rating change of the game just played
+    profile = player_from_summary(identity.character_id, identity.name, identity.race, identity.region, ttl=0)
+    with _MY_PROFILES_LOCK:
+        _MY_PROFILES[identity] = (time.monotonic(), profile)
+    return profile
+
+
+def refresh_my_profile_async(identity, max_age=MY_PROFILE_MAX_AGE):
+    """
+    Refresh our own profile in the background if the cached one is older than max_age seconds
+    """
+    cached = _MY_PROFILES.get(identity)
+    if cached and time.monotonic() - cached[0] < max_age:
+        return
+
+    _MY_PROFILE_EXECUTOR.submit(refresh_my_profile, identity)
+
+
+def my_profile(identity):
+    """
+    Memoized profile for one of our accounts. Only the first call waits on the API.
+    """
+    cached = _MY_PROFILES.get(identity)
+    annotate(cache_hit=bool(cached))
+    if cached:
+        return cached[1]
+
+    logging.info(f"No cached profile for {identity=}. Fetching it now.")
+    return refresh_my_profile(identity)
+
+
+def cached_identities():
+    with _MY_PROFILES_LOCK:
+        return list(_MY_PROFILES)
+
+
 def player_from_character_search(name, race=None, region=None, comparision_mmr=None):
     all_profiles = get_character_search(name)
     write_json(data=all_profiles, path=f"profiles/search/{name}.json")
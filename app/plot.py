@@ -1,60 +1,114 @@
-import matplotlib
-
-matplotlib.use("agg")
-
+import contextvars
 import logging
-from datetime import datetime
-import matplotlib.pyplot as plt
-from app.static import MATCH_COUNT, STATIC_DIR
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.static import MATCH_COUNT, MMR_PLOT_BACKEND, STATIC_DIR
+from app.utils.file_utils import write_compact_json
+from app.utils.timing_utils import defer, stage
 
 # TODO: This shows more than 1v1 games and \
 #   it should only show target race
 
+# numpy and matplotlib are imported where they are used so the json backend and callers that only need
+# mmr_plot_path never pay for them.
+
+# Figure is built once and redrawn for every plot. Not using pyplot keeps figures from leaking in long running
+# processes such as the watcher.
+_FIGURE = None
+_FIGURE_LOCK = threading.Lock()
+
+# Plots are rendered off the critical path of the smurf check. Pending plots are finished before the interpreter exits.
+_PLOT_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mmr_plot")
 
-def mmr_plot(player, depth=MATCH_COUNT):
-    character_id = player.character_id
-    logging.info(f"Creating MMR plot for {character_id=}")
-    try:
-        outpath = STATIC_DIR / f"mmr_plot/{character_id}.png"
-        logging.info(f"Attempting to create MMR plot from {len(player.matches)} matches...")
 
-        dates = []
-        ratings = []
-        # Isolate only the 1v1 matches of target race
-        for match in player.matches:
-            date = match.date
-            type = match.type
+def _get_figure():
+    global _FIGURE
+    if _FIGURE is None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
 
-            if type != "_1V1":
-                continue
+        fig = Figure(figsize=(9, 6))
+        FigureCanvasAgg(fig)
+        fig.add_subplot(1, 1, 1)
+        fig.subplots_adjust(left=0.1, right=0.97, top=0.94, bottom=0.2)
+        _FIGURE = fig
+    return _FIGURE
 
-            participants = match.participants
-            if len(participants) != 2:
-                continue
 
-            if character_id not in participants:
-                continue
+def mmr_series(player):
+    """
+    Dates and ratings of the 1v1 matches in a compact, JSON serializable form
+    """
+    dates = []
+    ratings = []
+    # Isolate only the 1v1 matches of target race
+    for match in player.matches:
+        if match.type != "_1V1" or match.participant_count != 2:
+            continue
 
-            team_state = participants[character_id]["teamState"] if "teamState" in participants[character_id] else {}
-            team_state = team_state["teamState"] if team_state and "teamState" in team_state else {}
-            rating = team_state["rating"] if team_state and "rating" in team_state else None
+        if match.date and match.rating:
+            dates.append(match.date[:10])
+            ratings.append(match.rating)
 
-            if date and rating:
-                formatted_date = datetime.strptime(date.split("T")[0], "%Y-%m-%d").date()
-                dates.append(formatted_date)
-                ratings.append(rating)
+    return {"dates": dates, "ratings": ratings, "rating_max": player.rating_max}
 
-        logging.info(f"Found {len(ratings)} matches for MMR plot...")
 
-        fig, ax = plt.subplots(1, figsize=(9, 6))
+def _render_png(series, outpath):
+    import numpy as np
+
+    dates = np.array(series["dates"], dtype="datetime64[D]")
+    ratings = np.array(series["ratings"])
+
+    with _FIGURE_LOCK:
+        fig = _get_figure()
+        ax = fig.axes[0]
+        ax.clear()
         ax.grid()
-        plt.title("MMR by Date")
-        plt.xticks(rotation=90)
-        plt.plot(dates, ratings, label="MMR")
-        if player.rating_max:
-            plt.plot(dates, [player.rating_max for _ in dates], label="Max MMR", color="red")
-        plt.savefig(outpath, format="png", bbox_inches="tight")
+        ax.set_title("MMR by Date")
+        ax.tick_params(axis="x", labelrotation=90)
+        ax.plot(dates, ratings, label="MMR")
+        if series["rating_max"] and len(dates):
+            ax.axhline(series["rating_max"], label="Max MMR", color="red")
+        fig.savefig(outpath, format="png")
+
+
+def mmr_plot_path(character_id, backend=MMR_PLOT_BACKEND):
+    return STATIC_DIR / f"mmr_plot/{character_id}.{'json' if backend == 'json' else 'png'}"
+
+
+def mmr_plot(player, depth=MATCH_COUNT, backend=MMR_PLOT_BACKEND):
+    """
+    Render the MMR plot as a PNG or, with the json backend, write the series for a client side chart
+    """
+    character_id = player.character_id
+    logging.info(f"Creating MMR plot for {character_id=}")
+    try:
+        logging.info(f"Attempting to create MMR plot from {len(player.matches)} matches...")
+        series = mmr_series(player)
+        logging.info(f"Found {len(series['ratings'])} matches for MMR plot...")
+
+        outpath = mmr_plot_path(character_id, backend)
+        with stage("plot"):
+            if backend == "json":
+                write_compact_json(data=series, path=outpath)
+            else:
+                _render_png(series, outpath)
         return outpath
     except Exception as e:
         logging.error("Exception thrown creating MMR plot...")
         logging.exception(e)
+
+
+def mmr_plot_async(player, backend=MMR_PLOT_BACKEND):
+    """
+    Queue the MMR plot in the background and return the path it will be written to
+    """
+    # Run in a copy of the caller's context so the plot is timed with the check that queued it. The trace is written
+    # once the plot is done.
+    defer(_PLOT_EXECUTOR.submit(contextvars.copy_context().run, mmr_plot, player, backend=backend))
+    return mmr_plot_path(player.character_id, backend)
+
+
+def wait_for_pending_plots():
+    _PLOT_EXECUTOR.submit(lambda: None).result()
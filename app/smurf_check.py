@@ -3,94 +3,493 @@ Entrypoint for smurf check
 """
 
 import argparse
-import dataclasses
+import contextvars
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait
 from time import perf_counter
 
 from dotenv import load_dotenv
 
+from app.api import uncached
+from app.archive import read_profile_json
 from app.browser import open_url
-from app.image import screenshot_workflow
-from app.matches import get_match_stats, get_matches_for_profile
+from app.client import request_smurf_check, request_team_smurf_check
+from app.matches import (
+    MATCH_TYPES,
+    MatchStats,
+    get_account_stats,
+    get_match_stats,
+    get_matches_for_profile,
+    newest_match_date,
+    write_player_matches,
+)
 from app.player import (
+    DEFAULT_IDENTITY,
+    Identity,
+    Player,
+    linked_players,
+    my_profile,
     player_from_alternate_names,
     player_from_character_id,
     player_from_character_search,
     player_from_summary,
+    player_summary,
+    refresh_my_profile_async,
+)
+from app.plot import mmr_plot_async, mmr_plot_path
+from app.static import (
+    LINKED_MAX_WORKERS,
+    MATCH_COUNT,
+    MATCH_HISTORY_DIR,
+    STATS_DIR,
+    TEAM_CHECK_BUDGET,
+    TEAM_DIR,
+    TEAM_MAX_WORKERS,
+    VERDICT_FAST_PATH_QUALS,
+    VERDICTS_PATH,
 )
-from app.plot import mmr_plot
-from app.static import MATCH_COUNT, MY_CHARACTER_ID, MY_PROFILE_NAME, MY_RACE, MY_REGION
-from app.utils.file_utils import write_json
+from app.utils.file_utils import write_compact_json
+from app.utils.timing_utils import stage, trace
+from app.verdicts import get_verdict, record_verdict
 
 load_dotenv()
 
+# Background recomputes of cached verdicts
+_REVALIDATE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="revalidate")
+
+
+# Bounded pool for linked character checks, shared by every check in the process
+_LINKED_EXECUTOR = ThreadPoolExecutor(max_workers=LINKED_MAX_WORKERS, thread_name_prefix="linked")
+
+# Opponents of a team game are checked side by side, one worker per opponent of a 4v4
+_OPPONENT_EXECUTOR = ThreadPoolExecutor(max_workers=TEAM_MAX_WORKERS, thread_name_prefix="opponent")
+
+
+def _linked_player_stats(player):
+    """
+    Check a linked character, writing the same stats, match history and plot as a check of the character itself
+    """
+    player.matches = get_matches_for_profile(player, match_count=MATCH_COUNT)
+    player.stats = get_match_stats(player)
+    record_verdict(player)
+    player.mmr_plot_path = mmr_plot_path(player.character_id)
+    write_compact_json(data=player_summary(player), path=STATS_DIR / f"{player.character_id}.json")
+    mmr_plot_async(player)
+    write_player_matches(player)
+    return player
+
+
+def _submit_linked_player_checks(character_id):
+    with stage("linked_players"):
+        players = linked_players(character_id)
+    logging.info(f"Checking {len(players)} linked characters of {character_id}")
+
+    # Each task gets its own copy of the context so its spans land in the current trace
+    return [_LINKED_EXECUTOR.submit(contextvars.copy_context().run, _linked_player_stats, player) for player in players]
+
+
+def submit_linked_checks(opponent):
+    """
+    Start stats for every character linked to the opponent's account. The linked characters are looked up on the
+    linked pool too, so the check doesn't wait on the lookup. Returns a future of the futures of the checked players.
+    """
+    return _LINKED_EXECUTOR.submit(contextvars.copy_context().run, _submit_linked_player_checks, opponent.character_id)
+
+
+def _linked_results(lookup):
+    try:
+        futures = lookup.result()
+    except Exception as e:
+        logging.error("Exception thrown looking up linked characters")
+        logging.exception(e)
+        return []
+
+    players = []
+    for future in futures:
+        try:
+            players.append(future.result())
+        except Exception as e:
+            logging.error("Exception thrown checking linked character")
+            logging.exception(e)
+    return players
+
+
+def result_paths(match_type="_1V1"):
+    """
+    (stats directory, match history directory, verdicts path) that results of match_type are written to. Team games
+    get their own directory per match type, so their stats are never read back as 1v1 stats.
+    """
+    if match_type == MATCH_TYPES[1]:
+        return STATS_DIR, MATCH_HISTORY_DIR, VERDICTS_PATH
+    directory = TEAM_DIR / match_type
+    return directory / "stats", directory / "match_history", directory / "verdicts.json"
+
+
+def _open_profile(character_id):
+    url = f"http://127.0.0.1:5000/profile/{character_id}"
+    logging.info(f"Opening profile. URL={url}")
+    open_url(url)
+
+
+def _revalidate(verdict, identity=None):
+    """
+    Recompute a cached verdict, as identity, if the player has played since it was recorded
+    """
+    try:
+        newest = newest_match_date(verdict.character_id)
+        if newest and (verdict.last_match_date is None or newest > verdict.last_match_date):
+            logging.info(f"Revalidating verdict for {verdict.character_id}. Played since {verdict.last_match_date}")
+            # The cache could still hold the responses the stale verdict was computed from
+            with uncached():
+                execute_smurf_check(opponent_character_id=verdict.character_id, use_verdicts=False, identity=identity)
+    except Exception as e:
+        logging.error(f"Exception thrown revalidating verdict for {verdict.character_id}")
+        logging.exception(e)
+
+
+def cached_check(character_id, open_profile=False, identity=None):
+    """
+    Opponent from the last stats of a known smurf, or None if the verdict isn't cached.
+    The verdict is revalidated in the background, as identity.
+    """
+    with stage("verdict") as span:
+        verdict = get_verdict(character_id)
+        summary = read_profile_json("stats", character_id) if verdict else None
+        span.attributes.update(cache_hit=bool(summary and verdict.smurf_qual in VERDICT_FAST_PATH_QUALS))
+
+    if not span.attributes["cache_hit"]:
+        return None
+
+    logging.info(f"Using cached verdict {verdict}")
+    opponent = Player(**{**summary, "stats": MatchStats(**summary["stats"])})
+    if open_profile:
+        _open_profile(character_id)
+
+    _REVALIDATE_EXECUTOR.submit(_revalidate, verdict, identity)
+    return opponent
+
 
 def execute_smurf_check(
-    screenshot_path=None, opponent_character_id=None, opponent_name=None, opponent_race=None, open_profile=False
+    screenshot_path=None,
+    opponent_character_id=None,
+    opponent_name=None,
+    opponent_race=None,
+    open_profile=False,
+    use_verdicts=True,
+    expand_linked=False,
+    identity=None,
+    screenshot_image=None,
 ):
     """
-    Calculate smurfing stats given either a loading screenshot or username as input
+    Calculate smurfing stats given either a loading screenshot or username as input.
+
+    screenshot_image is a BGR loading screen already in memory, such as a captured video frame. It is used instead of
+    screenshot_path so the frame never has to round trip through disk before it is parsed.
+
+    identity is the account the check is run for and defaults to the configured MY_* account. Checks for different
+    identities can run concurrently in one process and share its HTTP pool, caches and OCR workers.
+
+    With use_verdicts, players with a cached smurf verdict are answered from it as soon as their id is known.
+    With expand_linked, every character linked to the opponent's account is checked in parallel and aggregated into
+    the opponent's account_stats.
     """
+    identity = identity or DEFAULT_IDENTITY
+    screenshot = screenshot_path if screenshot_image is None else screenshot_image
+    with trace(
+        "smurf_check",
+        screenshot_path=screenshot_path,
+        opponent_character_id=opponent_character_id,
+        identity=identity.character_id,
+    ) as current:
+        result = _execute_smurf_check(
+            identity,
+            screenshot,
+            opponent_character_id,
+            opponent_name,
+            opponent_race,
+            open_profile,
+            use_verdicts,
+            expand_linked,
+        )
+        opponent = result[1] if result else None
+        if opponent is not None:
+            current.attributes.update(
+                opponent_character_id=opponent.character_id,
+                smurf_qual=opponent.stats.smurf_qual if opponent.stats else None,
+            )
+    return result
+
+
+def _execute_smurf_check(
+    identity,
+    screenshot,
+    opponent_character_id,
+    opponent_name,
+    opponent_race,
+    open_profile,
+    use_verdicts,
+    expand_linked,
+):
     start = perf_counter()
 
-    if screenshot_path:
-        opponent_name, opponent_race = screenshot_workflow(screenshot_path)
-        if opponent_name is None:
+    ocr_names = []
+    if screenshot is not None:
+        # OpenCV and Tesseract are only loaded when there is a screenshot to parse
+        from app.image import opponent_nameplate
+
+        with stage("screenshot"):
+            nameplate = opponent_nameplate(screenshot, identity)
+        if nameplate is None or nameplate.name is None:
             logging.warning(f"Unable to parse opponent details from screenshot.")
             return
+        opponent_name, opponent_race, ocr_names = nameplate.name, nameplate.race, nameplate.alternate_names
 
     # Profiles
-    player = player_from_summary(MY_CHARACTER_ID, MY_PROFILE_NAME, MY_RACE, MY_REGION)
+    with stage("my_profile"):
+        player = my_profile(identity)
 
+    opponent = _check_opponent(
+        identity,
+        player,
+        opponent_character_id,
+        opponent_name,
+        opponent_race,
+        open_profile,
+        use_verdicts,
+        expand_linked,
+        ocr_names=ocr_names,
+    )
+
+    stop = perf_counter()
+    logging.info(f"Smurf check took {round(stop - start, 2)} seconds.")
+
+    return player, opponent
+
+
+def _check_opponent(
+    identity,
+    player,
+    opponent_character_id,
+    opponent_name,
+    opponent_race,
+    open_profile=False,
+    use_verdicts=True,
+    expand_linked=False,
+    ocr_names=(),
+    match_type="_1V1",
+    deadline=None,
+):
+    """
+    Resolve and score the opponent of player from their match_type games. Match history paging stops at deadline.
+
+    ocr_names are the less confident OCR reads of opponent_name. They are looked up before the l/I permutations when
+    the name isn't found, so a misread name doesn't need the screenshot read again.
+
+    Team results are written under result_paths(match_type). Cached verdicts, linked characters, the MMR plot and the
+    profile page are 1v1 only.
+    """
+    is_1v1 = match_type == MATCH_TYPES[1]
+    use_verdicts = use_verdicts and is_1v1
     if opponent_character_id:
-        opponent = player_from_character_id(character_id=opponent_character_id, name=opponent_name, race=opponent_race)
+        cached = cached_check(opponent_character_id, open_profile, identity) if use_verdicts else None
+        if cached:
+            return cached
+
+        with stage("common"):
+            opponent = player_from_character_id(
+                character_id=opponent_character_id, name=opponent_name, race=opponent_race
+            )
     else:
-        opponent = player_from_character_search(opponent_name, opponent_race, MY_REGION, player.rating_last)
+        with stage("search"):
+            opponent = player_from_character_search(opponent_name, opponent_race, identity.region, player.rating_last)
         if opponent and opponent.character_id:
-            opponent = player_from_summary(opponent.character_id, opponent.name, opponent.race, opponent.region)
+            cached = cached_check(opponent.character_id, open_profile, identity) if use_verdicts else None
+            if cached:
+                return cached
+
+            with stage("summary"):
+                opponent = player_from_summary(opponent.character_id, opponent.name, opponent.race, opponent.region)
+
+    # Try the other OCR reads, then barcode iterations, if we failed
+    if opponent is None:
+        for ocr_name in ocr_names:
+            logging.warning(f"Unable to get player details for {opponent_name=}. Trying OCR candidate {ocr_name=}")
+            with stage("ocr_candidate"):
+                opponent = player_from_character_search(ocr_name, opponent_race, identity.region, player.rating_last)
+            if opponent is not None:
+                break
 
-    # Try barcode iterations if we failed
     if opponent is None:
         logging.warning(f"Unable to get player details for {opponent_name=}")
-        opponent = player_from_alternate_names(opponent_name, opponent_race, MY_REGION, player.rating_last)
+        with stage("alternate_names"):
+            opponent = player_from_alternate_names(opponent_name, opponent_race, identity.region, player.rating_last)
 
     logging.info(f"{player=}")
     logging.info(f"{opponent=}")
 
+    # Linked characters are checked alongside the opponent
+    expand_linked = expand_linked and is_1v1
+    linked_lookup = submit_linked_checks(opponent) if expand_linked else None
+
     # Get stats
-    opponent.matches = get_matches_for_profile(opponent, match_count=MATCH_COUNT)
-    opponent.mmr_plot_path = mmr_plot(opponent)
-    opponent.stats = get_match_stats(opponent)
-
-    write_json(
-        data=dataclasses.asdict(opponent),
-        path=f"profiles/stats/{opponent.character_id}.json",
-        mode="w",
-    )
+    stats_dir, match_history_dir, verdicts_path = result_paths(match_type)
+    with stage("matches"):
+        opponent.matches = get_matches_for_profile(
+            opponent, matchType=match_type, match_count=MATCH_COUNT, deadline=deadline
+        )
+    with stage("stats"):
+        opponent.stats = get_match_stats(opponent)
+    record_verdict(opponent, path=verdicts_path)
 
-    if open_profile:
-        url = f"http://127.0.0.1:5000/profile/{opponent.character_id}"
-        logging.info(f"Opening profile. URL={url}")
-        open_url(url)
+    if expand_linked:
+        with stage("linked"):
+            opponent.account_stats = get_account_stats([opponent, *_linked_results(linked_lookup)])
+    if is_1v1:
+        opponent.mmr_plot_path = mmr_plot_path(opponent.character_id)
+
+    # Slim summary first, the match payload is only loaded on demand
+    with stage("write"):
+        write_compact_json(data=player_summary(opponent), path=stats_dir / f"{opponent.character_id}.json")
+
+    # The score is what matters on the loading screen. The plot follows in the background.
+    if is_1v1:
+        mmr_plot_async(opponent)
+    with stage("write_matches"):
+        write_player_matches(opponent, match_history_dir)
+
+    # My rating moves after every game. Refresh it now so the next check reads it from memory.
+    refresh_my_profile_async(identity)
+
+    if open_profile and is_1v1:
+        _open_profile(opponent.character_id)
+
+    return opponent
+
+
+def execute_team_smurf_check(
+    screenshot_path=None,
+    screenshot_image=None,
+    team_size=None,
+    identity=None,
+    budget=TEAM_CHECK_BUDGET,
+):
+    """
+    Check every opponent of a 2v2, 3v3 or 4v4 game from its loading screen. The team size is detected from the
+    screenshot unless it is given.
+
+    Opponents are resolved and scored concurrently under one shared time budget in seconds. Match history paging stops
+    when it runs out, and opponents that still aren't done are returned as None while they finish in the background.
+    Returns (player, opponents) with opponents in nameplate order.
+    """
+    identity = identity or DEFAULT_IDENTITY
+    screenshot = screenshot_path if screenshot_image is None else screenshot_image
+    with trace(
+        "team_smurf_check",
+        screenshot_path=screenshot_path,
+        team_size=team_size,
+        identity=identity.character_id,
+    ) as current:
+        result = _execute_team_smurf_check(identity, screenshot, team_size, budget)
+        if result:
+            current.attributes.update(
+                opponent_character_ids=[opponent.character_id if opponent else None for opponent in result[1]]
+            )
+    return result
+
+
+def _execute_team_smurf_check(identity, screenshot, team_size, budget):
+    start = perf_counter()
+    deadline = start + budget
+
+    from app.image import opponent_nameplates
+
+    with stage("screenshot"):
+        nameplates = opponent_nameplates(screenshot, identity, team_size)
+    if not nameplates:
+        logging.warning("Unable to parse opponent details from screenshot.")
+        return
+    match_type = MATCH_TYPES[len(nameplates)]
+
+    with stage("my_profile"):
+        player = my_profile(identity)
+
+    # Each task gets its own copy of the context so its spans land in the current trace
+    futures = [
+        _OPPONENT_EXECUTOR.submit(
+            contextvars.copy_context().run,
+            _check_opponent,
+            identity,
+            player,
+            None,
+            nameplate.name,
+            nameplate.race,
+            ocr_names=nameplate.alternate_names,
+            match_type=match_type,
+            deadline=deadline,
+        )
+        for nameplate in nameplates
+    ]
+    with stage("opponents", count=len(futures)):
+        wait(futures, timeout=max(deadline - perf_counter(), 0))
+
+    opponents = []
+    for nameplate, future in zip(nameplates, futures):
+        if not future.done():
+            logging.warning(f"Check of {nameplate.name} didn't finish in {budget}s. It continues in the background.")
+            opponents.append(None)
+            continue
+        try:
+            opponents.append(future.result())
+        except Exception as e:
+            logging.error(f"Exception thrown checking {nameplate.name}")
+            logging.exception(e)
+            opponents.append(None)
 
     stop = perf_counter()
-    logging.info(f"Smurf check took {round(stop - start, 2)} seconds.")
+    logging.info(f"Team smurf check of {len(opponents)} opponents took {round(stop - start, 2)} seconds.")
 
-    return player, opponent
+    return player, opponents
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
 
     parser = argparse.ArgumentParser()
+    parser.add_argument("-screenshot_path")
+    parser.add_argument("-team_size", type=int, help="Check every opponent of a team game. 0 detects the size.")
     parser.add_argument("-opponent_character_id")
     parser.add_argument("-opponent_name")
     parser.add_argument("-opponent_race")
     parser.add_argument("-open_profile", default=False)
+    parser.add_argument("-expand_linked", action="store_true", help="Also check every linked character")
+    parser.add_argument("-local", action="store_true", help="Run in this process instead of on the daemon")
+    parser.add_argument("-my_name", help="Check for another of our players instead of the MY_* account")
+    parser.add_argument("-my_race")
+    parser.add_argument("-my_character_id")
+    parser.add_argument("-my_region")
     args = parser.parse_args()
-    execute_smurf_check(
-        opponent_character_id=args.opponent_character_id,
-        opponent_name=args.opponent_name,
-        opponent_race=args.opponent_race,
-        open_profile=args.open_profile,
-    )
+
+    if args.team_size is not None:
+        check, request_check, result_key = execute_team_smurf_check, request_team_smurf_check, "opponents"
+        kwargs = dict(screenshot_path=args.screenshot_path, team_size=args.team_size or None)
+    else:
+        check, request_check, result_key = execute_smurf_check, request_smurf_check, "opponent"
+        kwargs = dict(
+            screenshot_path=args.screenshot_path,
+            opponent_character_id=args.opponent_character_id,
+            opponent_name=args.opponent_name,
+            opponent_race=args.opponent_race,
+            open_profile=args.open_profile,
+            expand_linked=args.expand_linked,
+        )
+    if args.my_character_id:
+        if not args.my_name:
+            parser.error("-my_character_id needs -my_name to tell us apart from the opponent")
+        kwargs["identity"] = Identity(
+            name=args.my_name, race=args.my_race, character_id=args.my_character_id, region=args.my_region
+        )
+    result = None if args.local else request_check(**kwargs)
+    if result is None:
+        check(**kwargs)
+    elif "error" not in result:
+        logging.info(f"Daemon result: {result.get(result_key)}")
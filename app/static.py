@@ -10,26 +10,76 @@ MY_PROFILE_NAME = os.environ.get("MY_PROFILE_NAME")
 MY_RACE = os.environ.get("MY_RACE")
 MY_CHARACTER_ID = os.environ.get("MY_CHARACTER_ID")
 MY_REGION = os.environ.get("MY_REGION")
+MY_PROFILE_MAX_AGE = 60  # Seconds before my cached profile is refreshed after a check
+MY_PROFILE_REFRESH_INTERVAL = 600  # Seconds between timed refreshes of my profile in the daemon
 
 # Flask
 STATIC_DIR = Path(os.environ.get("STATIC_DIR"))
+MMR_PLOT_BACKEND = os.environ.get("MMR_PLOT_BACKEND", "png")  # "png" or "json" for a client side chart
+
+# API
+API_CACHE_TTL = 300  # Seconds a parsed sc2pulse response is reused
+API_CACHE_SIZE = 2048  # Responses kept in memory
+
+# Daemon
+DAEMON_HOST = os.environ.get("DAEMON_HOST", "127.0.0.1")
+DAEMON_PORT = int(os.environ.get("DAEMON_PORT", 5001))
 
 # Matches
 MATCH_COUNT = 1000  # Maximum number of matches to use in smurf stats
 MIN_MATCH_DURATION = 60  # Seconds
+MAX_STALE_PAGES = 3  # Pages in a row without a new match before giving up on the match history
+MATCH_STATS_CHECKPOINT = 100  # Matches between smurf qual checks while paging
+MATCH_STATS_STABLE_CHECKPOINTS = 3  # Checkpoints with the same smurf qual before paging stops early
+VERDICT_FAST_PATH_QUALS = ("Likely", "Definitely")  # Cached verdicts returned without recomputing
+LINKED_MAX_WORKERS = 4  # Linked characters checked at once
+TEAM_MAX_WORKERS = 4  # Opponents of a team game checked at once
+TEAM_CHECK_BUDGET = 8  # Seconds shared by every opponent of a team game, about the length of the loading screen
 
 # JSON paths
 PROFILES_DIR = Path(os.environ.get("PROFILES_DIR"))
 MATCHES_DIR = PROFILES_DIR / "matches"
+STATS_DIR = PROFILES_DIR / "stats"
+MATCH_HISTORY_DIR = PROFILES_DIR / "match_history"  # Match payloads split out of the stats documents
+NOTES_DIR = PROFILES_DIR / "notes"
+NOTES_LOG_PATH = NOTES_DIR / "notes.jsonl"  # Append-only log of every note, see app.notes
+ARCHIVE_PATH = PROFILES_DIR / "archive.smurf"  # Compacted profiles, see app.archive
+TRACES_PATH = PROFILES_DIR / "traces.jsonl"  # One structured trace per smurf check
+TRACES_MAX_BYTES = 16 * 1024 * 1024  # Trace log size before it is rotated to a single backup
+VERDICTS_PATH = PROFILES_DIR / "verdicts.json"  # Last verdict per character id, see app.verdicts
+TEAM_DIR = PROFILES_DIR / "team"  # Team game stats, match history and verdicts, one directory per match type
+
+# OCR
+OCR_MAX_WORKERS = os.cpu_count() or 1  # Tesseract processes run at once
+# Word confidence at which a name is read and nothing else is tried. Check changes with benchmarks.screenshots.
+OCR_CONFIDENCE_THRESHOLD = float(os.environ.get("OCR_CONFIDENCE_THRESHOLD", 85))
+OCR_MAX_REGIONS = 3  # Text regions tried per name crop, most name-like first
+OCR_MAX_ATTEMPTS = 4  # Tesseract calls per name crop at most
+OCR_TOP_K = 3  # Name guesses kept per nameplate for lookup retries
+
+# Capture
+CAPTURE_SOURCE = os.environ.get("CAPTURE_SOURCE", "0")  # Device index or video path, see app.capture
+CAPTURE_SCENE_THRESHOLD = 8  # Mean absolute difference of downscaled gray frames that counts as a new scene
+CAPTURE_RECHECK_FRAMES = 30  # Frames after which the loading screen match is redone even without a scene change
+CAPTURE_CONFIRM_FRAMES = 3  # Consecutive loading screen frames before a check is started
+
+# Image archive
+IMAGE_ARCHIVE_MAX_BYTES = int(os.environ.get("IMAGE_ARCHIVE_MAX_BYTES", 2 * 1024**3))  # Oldest images go first
+IMAGE_ARCHIVE_MAX_AGE_DAYS = int(os.environ.get("IMAGE_ARCHIVE_MAX_AGE_DAYS", 90))
+IMAGE_ARCHIVE_PNG_COMPRESSION = 1  # 0-9. Fast compression, archival is about disk space not ratio.
 
 # Image paths
 TMP_DIR = Path(os.environ.get("TMP_DIR"))
 IMAGES_DIR = Path(os.environ.get("IMAGES_DIR"))
 SCREENSHOTS_DIR = IMAGES_DIR / "screenshots"
 NAMES_DIR = IMAGES_DIR / "names"
+IMAGE_ARCHIVE_DIR = IMAGES_DIR / "archive"  # Content addressed images, see app.image_archive
 TEMPLATES_DIR = IMAGES_DIR / "templates"
 ZERG_TEMPLATE_PATH = TEMPLATES_DIR / "zerg.png"
 TERRAN_TEMPLATE_PATH = TEMPLATES_DIR / "terran.png"
 PROTOSS_TEMPLATE_PATH = TEMPLATES_DIR / "protoss.png"
 RANDOM_TEMPLATE_PATH = TEMPLATES_DIR / "random.png"
 BARCODE_TEMPLATE_PATH = TEMPLATES_DIR / "barcode.png"
+# Nameplate coordinates of team loading screens by team size, see app.image.nameplate_coordinates
+TEAM_LAYOUT_PATH = Path(os.environ.get("TEAM_LAYOUT_PATH", TEMPLATES_DIR / "team_layout.json"))
+TEAM_ROW_HEIGHT = int(os.environ.get("TEAM_ROW_HEIGHT", 60))  # Nameplate spacing for team sizes missing from the layout
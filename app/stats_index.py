@@ -0,0 +1,102 @@
+"""
+Stats index
+
+Every player's latest stats summary in memory, keyed by character id, so many players can be answered without opening
+a file each. Built from the archived stats records and the loose files in STATS_DIR. Each read checks the mtimes of the
+archive and the directory and reloads what changed. write_compact_json replaces files atomically, so every new or
+updated summary moves the directory mtime.
+"""
+
+import logging
+import os
+import threading
+from pathlib import Path
+
+import orjson
+
+from app.archive import open_archive
+from app.static import ARCHIVE_PATH, STATS_DIR
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+class StatsIndex:
+    def __init__(self, stats_dir=STATS_DIR, archive_path=ARCHIVE_PATH):
+        self.stats_dir = Path(stats_dir)
+        self.archive_path = Path(archive_path)
+        self._lock = threading.Lock()
+        self._archived = {}  # character id -> summary
+        self._archive_mtime = None
+        self._loose = {}  # character id -> (mtime, summary)
+        self._dir_mtime = None
+
+    def _refresh(self):
+        archive_mtime = _mtime_ns(self.archive_path)
+        dir_mtime = _mtime_ns(self.stats_dir)
+        if archive_mtime == self._archive_mtime and dir_mtime == self._dir_mtime:
+            return
+
+        with self._lock:
+            if archive_mtime != self._archive_mtime:
+                archive = open_archive(self.archive_path)
+                self._archived = dict(archive.iter_records("stats")) if archive else {}
+                self._archive_mtime = archive_mtime
+
+            if dir_mtime != self._dir_mtime:
+                self._loose = self._load_loose()
+                self._dir_mtime = dir_mtime
+
+    def _load_loose(self):
+        """
+        Loose summaries, only reading files that changed since the last load
+        """
+        if not self.stats_dir.is_dir():
+            return {}
+
+        loose = {}
+        with os.scandir(self.stats_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                character_id = entry.name[: -len(".json")]
+                mtime = entry.stat().st_mtime_ns
+                cached = self._loose.get(character_id)
+                if cached and cached[0] == mtime:
+                    loose[character_id] = cached
+                    continue
+                try:
+                    with open(entry.path, "rb") as f:
+                        loose[character_id] = (mtime, orjson.loads(f.read()))
+                except (OSError, orjson.JSONDecodeError):
+                    logging.warning(f"Skipping unreadable stats file {entry.path}")
+        return loose
+
+    def get(self, character_id):
+        self._refresh()
+        character_id = str(character_id)
+        loose = self._loose.get(character_id)
+        return loose[1] if loose else self._archived.get(character_id)
+
+    def summaries(self):
+        """
+        Every summary, loose files taking precedence over archived records
+        """
+        self._refresh()
+        return {**self._archived, **{character_id: summary for character_id, (_, summary) in self._loose.items()}}
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def stats_index():
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            _INDEX = StatsIndex()
+        return _INDEX
@@ -1,9 +1,13 @@
 import json
 import logging
+import os
 import shutil
+import tempfile
 from pathlib import Path
 
-from app.static import PROFILES_DIR
+import orjson
+
+from app.notes import notes_store
 
 
 def move(src, dst):
@@ -21,10 +25,55 @@ def write_json(data, path, mode="w"):
         json.dump(data, f, ensure_ascii=False, indent=4, default=str)
 
 
-def get_player_notes(character_id):
-    notes = {}
-    if Path(f"{PROFILES_DIR}/notes/{character_id}.json").exists():
-        with open(f"{PROFILES_DIR}/notes/{character_id}.json") as f:
-            notes = json.load(f)
+def _process_umask():
+    # The umask can only be read by setting it. Done once, at import, before any writer threads start.
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+_UMASK = _process_umask()
+
+
+def _file_mode(path):
+    """
+    Mode for a new version of path: the existing file's, or what open() would create it with
+    """
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
 
-    return notes
+def write_compact_json(data, path):
+    """
+    Write data as compact JSON. Dataclasses are serialized natively by orjson.
+
+    The file is replaced atomically, so readers never see a partial write and the directory mtime moves on every write.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        try:
+            f = os.fdopen(fd, "wb")
+        except BaseException:
+            os.close(fd)
+            raise
+        with f:
+            f.write(orjson.dumps(data, default=str))
+        # mkstemp creates files readable only by their owner
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_json(path):
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def get_player_notes(character_id):
+    return notes_store().notes(character_id)
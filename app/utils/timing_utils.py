@@ -0,0 +1,236 @@
+import logging
+import math
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Dict, List, Optional
+
+import orjson
+
+from app.static import TRACES_MAX_BYTES, TRACES_PATH
+from app.utils.date_utils import timestamp
+
+TRACE_PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class Span:
+    name: str
+    start: float  # Seconds since the start of the trace
+    duration: Optional[float] = None
+    attributes: Dict = field(default_factory=dict)
+
+
+@dataclass
+class Trace:
+    name: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    started_at: str = field(default_factory=lambda: timestamp(format="%Y-%m-%dT%H:%M:%S"))
+    duration: Optional[float] = None
+    attributes: Dict = field(default_factory=dict)
+    spans: List[Span] = field(default_factory=list)
+    origin: float = field(default_factory=perf_counter, repr=False)
+    pending: List = field(default_factory=list, repr=False)  # Background futures whose spans belong to this trace
+
+    def stage_totals(self):
+        totals = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0) + (span.duration or 0)
+        return totals
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "spans": self.spans,
+        }
+
+
+_TRACE = ContextVar("trace", default=None)
+_SPAN = ContextVar("span", default=None)
+
+
+@contextmanager
+def trace(name, path=TRACES_PATH, **attributes):
+    """
+    Trace everything run inside the block and append it to the trace log at path on exit. With path=None the trace is
+    only kept in memory, for callers that read it themselves.
+
+    Nested calls join the trace that is already active and leave writing it to the outermost block. Background work
+    registered with defer is waited for, off the caller's thread, before the trace is written.
+    """
+    active = _TRACE.get()
+    if active is not None:
+        active.attributes.update(attributes)
+        yield active
+        return
+
+    current = Trace(name=name, attributes=attributes)
+    token = _TRACE.set(current)
+    try:
+        yield current
+    finally:
+        current.duration = perf_counter() - current.origin
+        _TRACE.reset(token)
+        if path is not None:
+            _write_when_done(current, path)
+
+
+def _write_when_done(trace, path):
+    pending = list(trace.pending)
+    if not pending:
+        write_trace(trace, path)
+        return
+
+    lock = threading.Lock()
+    remaining = [len(pending)]
+
+    def _done(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            write_trace(trace, path)
+
+    for future in pending:
+        future.add_done_callback(_done)
+
+
+def defer(future):
+    """
+    Hold the current trace open until future is done, so spans recorded by background work land in it.
+    The trace's duration still ends with the traced block.
+    """
+    current = _TRACE.get()
+    if current is not None:
+        current.pending.append(future)
+    return future
+
+
+@contextmanager
+def stage(name, **attributes):
+    """
+    Time a stage of the current trace. Yields the span so attributes can be added once they are known.
+    """
+    current = _TRACE.get()
+    start = perf_counter()
+    span = Span(name=name, start=start - current.origin if current else 0, attributes=attributes)
+    token = _SPAN.set(span)
+    try:
+        yield span
+    finally:
+        span.duration = perf_counter() - start
+        _SPAN.reset(token)
+        if current is not None:
+            current.spans.append(span)
+        logging.debug(f"Stage {name} took {round(span.duration, 3)} seconds")
+
+
+def annotate(**attributes):
+    """
+    Add attributes to the innermost open stage, if any
+    """
+    span = _SPAN.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+def _rotated_path(path):
+    return f"{path}.1"
+
+
+def write_trace(trace, path=TRACES_PATH, max_bytes=TRACES_MAX_BYTES):
+    """
+    Append a trace to the log. Once the log passes max_bytes it is rotated to a single .1 backup.
+    """
+    try:
+        with open(path, "ab") as f:
+            f.write(orjson.dumps(trace.to_dict(), default=str) + b"\n")
+            size = f.tell()
+        if size > max_bytes:
+            os.replace(path, _rotated_path(path))
+    except OSError as e:
+        logging.error(f"Unable to write trace {trace.id} to {path}")
+        logging.exception(e)
+
+
+def _tail_lines(path, limit=None, block_size=64 * 1024):
+    """
+    Last limit complete lines of a file, oldest first, reading only as much of the end as needed
+    """
+    try:
+        with open(path, "rb") as f:
+            if limit is None:
+                return f.read().splitlines()
+
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            data = b""
+            while position > 0 and data.count(b"\n") <= limit:
+                read_size = min(block_size, position)
+                position -= read_size
+                f.seek(position)
+                data = f.read(read_size) + data
+    except FileNotFoundError:
+        return []
+
+    lines = [line for line in data.splitlines() if line]
+    if position > 0:
+        # The first line may have been cut by the block boundary
+        lines = lines[1:]
+    return lines[-limit:] if limit else []
+
+
+def load_traces(path=TRACES_PATH, limit=None):
+    """
+    Most recent traces first, from the log and its rotated backup
+    """
+    lines = _tail_lines(path, limit)
+    if limit is None or len(lines) < limit:
+        lines = _tail_lines(_rotated_path(path), None if limit is None else limit - len(lines)) + lines
+
+    traces = []
+    for line in reversed(lines):
+        try:
+            traces.append(orjson.loads(line))
+        except orjson.JSONDecodeError:
+            logging.warning(f"Skipping unreadable trace in {path}")
+    return traces
+
+
+def _percentile(sorted_values, percentile):
+    """
+    Nearest rank percentile
+    """
+    rank = max(1, math.ceil(percentile / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def stage_percentiles(traces, percentiles=TRACE_PERCENTILES):
+    """
+    Percentiles of the total time spent in each stage per trace, plus the trace duration itself
+    """
+    durations = {"total": []}
+    for trace in traces:
+        if trace.get("duration") is not None:
+            durations["total"].append(trace["duration"])
+        totals = {}
+        for span in trace.get("spans", []):
+            totals[span["name"]] = totals.get(span["name"], 0) + (span.get("duration") or 0)
+        for name, duration in totals.items():
+            durations.setdefault(name, []).append(duration)
+
+    summary = {}
+    for name, values in durations.items():
+        if not values:
+            continue
+        values = sorted(values)
+        summary[name] = {"count": len(values), **{f"p{p}": _percentile(values, p) for p in percentiles}}
+    return summary
@@ -0,0 +1,99 @@
+"""
+Persisted smurf verdicts by character id
+
+Lets repeat opponents be answered from the last check instead of recomputing from scratch
+"""
+
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import orjson
+from filelock import FileLock
+
+from app.static import VERDICTS_PATH
+from app.utils.date_utils import timestamp
+from app.utils.file_utils import write_compact_json
+
+
+@dataclass
+class Verdict:
+    character_id: str
+    smurf_score: Optional[float]
+    smurf_qual: Optional[str]
+    checked_at: str
+    last_match_date: Optional[str]  # Newest match used for the verdict
+    match_count: Optional[int]
+
+
+_VERDICTS = {}
+_VERDICTS_SOURCE = None  # (path, mtime) the table was loaded from
+_VERDICTS_LOCK = threading.Lock()
+
+
+def _load(path=VERDICTS_PATH, force=False):
+    """
+    Reload the table if another process rewrote it. An unreadable table is logged and treated as empty.
+    """
+    global _VERDICTS, _VERDICTS_SOURCE
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        _VERDICTS, _VERDICTS_SOURCE = {}, (str(path), None)
+        return
+
+    if force or (str(path), mtime) != _VERDICTS_SOURCE:
+        try:
+            with open(path, "rb") as f:
+                _VERDICTS = {key: Verdict(**value) for key, value in orjson.loads(f.read()).items()}
+        except (OSError, orjson.JSONDecodeError, AttributeError, TypeError) as e:
+            logging.error(f"Unable to read verdicts from {path}. Treating the table as empty.")
+            logging.exception(e)
+            _VERDICTS = {}
+        _VERDICTS_SOURCE = (str(path), mtime)
+
+
+def get_verdict(character_id, path=VERDICTS_PATH):
+    with _VERDICTS_LOCK:
+        _load(path)
+        return _VERDICTS.get(str(character_id))
+
+
+def get_verdicts(character_ids, path=VERDICTS_PATH):
+    """
+    Verdicts of many characters under one lock. Characters without a verdict are left out.
+    """
+    with _VERDICTS_LOCK:
+        _load(path)
+        return {str(key): _VERDICTS[str(key)] for key in character_ids if str(key) in _VERDICTS}
+
+
+def record_verdict(player, path=VERDICTS_PATH):
+    """
+    Store the verdict for a player with computed stats. The table is replaced atomically.
+    """
+    global _VERDICTS_SOURCE
+    if not player.stats:
+        return None
+
+    verdict = Verdict(
+        character_id=str(player.character_id),
+        smurf_score=player.stats.smurf_score,
+        smurf_qual=player.stats.smurf_qual,
+        checked_at=timestamp(format="%Y-%m-%dT%H:%M:%S"),
+        last_match_date=player.matches[0].date if player.matches else None,
+        match_count=player.stats.match_count,
+    )
+
+    # Other processes write the table too. Merge into the latest version under the lock file, always re-reading it
+    # since an mtime can miss a write made within the same timestamp tick.
+    with _VERDICTS_LOCK, FileLock(f"{path}.lock"):
+        _load(path, force=True)
+        _VERDICTS[verdict.character_id] = verdict
+        write_compact_json(data={key: asdict(value) for key, value in _VERDICTS.items()}, path=path)
+        _VERDICTS_SOURCE = (str(path), os.stat(path).st_mtime_ns)
+
+    logging.info(f"Recorded verdict {verdict}")
+    return verdict
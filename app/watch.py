@@ -10,7 +10,7 @@ from dotenv import load_dotenv
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
-from app.smurf_check import execute_smurf_check
+from app.client import smurf_check
 
 load_dotenv()
 
@@ -22,7 +22,7 @@ class CreationHandler(FileSystemEventHandler):
     def on_any_event(event):
         if event.event_type == "created":
             logging.info(f"Found new file: {event.src_path=}")
-            execute_smurf_check(screenshot_path=event.src_path, open_profile=True)
+            smurf_check(screenshot_path=event.src_path, open_profile=True)
 
 
 if __name__ == "__main__":
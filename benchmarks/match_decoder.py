@@ -0,0 +1,81 @@
+"""
+Microbenchmark for decoding match history pages
+
+Times raw page bytes -> Match objects. Pass recorded pages (the JSON body of /character/{id}/matches/..., see
+benchmarks/fixtures/pulse/index.json) with -pages, otherwise synthetic pages with the same shape are used.
+
+python -m benchmarks.match_decoder -pages benchmarks/fixtures/pulse/<page>.json -character_id 123
+"""
+
+import argparse
+import statistics
+from pathlib import Path
+from time import perf_counter
+
+import orjson
+
+from app.matches import decode_match
+from app.player import Player
+
+SYNTHETIC_CHARACTER_ID = "1"
+
+
+def _participant(character_id, decision, rating):
+    member = {"character": {"id": int(character_id), "name": f"Player{character_id}"}, "zergGamesPlayed": 1}
+    return {
+        "participant": {"playerCharacterId": int(character_id), "decision": decision},
+        "team": {"rating": rating, "members": [member]},
+        "teamState": {"teamState": {"rating": rating}},
+    }
+
+
+def synthetic_pages(page_count=100, page_size=10):
+    pages = []
+    for page in range(page_count):
+        result = []
+        for i in range(page_size):
+            match_id = page * page_size + i
+            result.append(
+                {
+                    "match": {"id": match_id, "date": "2024-08-01T12:00:00Z", "type": "_1V1", "duration": 600},
+                    "map": {"id": 1, "name": "Alcyone LE"},
+                    "participants": [
+                        _participant(SYNTHETIC_CHARACTER_ID, "WIN" if i % 2 else "LOSS", 4000),
+                        _participant(str(match_id + 2), "LOSS" if i % 2 else "WIN", 3950),
+                    ],
+                }
+            )
+        pages.append(orjson.dumps({"result": result}))
+    return pages
+
+
+def decode_pages(pages, profile):
+    matches = []
+    for page in pages:
+        for match in orjson.loads(page).get("result", []):
+            decoded = decode_match(match, profile)
+            if decoded is not None:
+                matches.append(decoded)
+    return matches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-pages", nargs="*")
+    parser.add_argument("-character_id", default=SYNTHETIC_CHARACTER_ID)
+    parser.add_argument("-runs", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = [Path(path).read_bytes() for path in args.pages] if args.pages else synthetic_pages()
+    profile = Player(character_id=args.character_id, name="benchmark", race="ZERG")
+
+    times = []
+    for _ in range(args.runs):
+        start = perf_counter()
+        matches = decode_pages(pages, profile)
+        times.append(perf_counter() - start)
+
+    median = statistics.median(times)
+    per_thousand = median / len(matches) * 1000 if matches else float("nan")
+    print(f"{len(pages)} pages, {len(matches)} matches: median={median * 1000:.2f}ms")
+    print(f"{per_thousand * 1000:.2f}ms per 1000 matches")
@@ -0,0 +1,225 @@
+"""
+Offline benchmark of the full smurf check pipeline
+
+Replays recorded sc2pulse responses through benchmarks.pulse_server and recorded loading screen screenshots through
+the screenshot parse of the check. Every stage of execute_smurf_check is timed, results are appended to a history file
+keyed by git commit and compared with the previous entry.
+
+Record a scenario against the live API (uses MY_* from the environment):
+    python -m benchmarks.pipeline record -name mirror -opponent_name Foo -opponent_race ZERG
+    python -m benchmarks.pipeline record -name screenshot -screenshot benchmarks/fixtures/screenshots/foo.png
+
+Replay every recorded scenario:
+    python -m benchmarks.pipeline run -runs 5
+
+Every run is a fresh process with an empty workspace, so nothing is cached from an earlier run. It times a cold check,
+then the same check again in the same process (warm: API responses and my profile are cached). Both skip the cached
+verdict fast path. Medians over the runs are reported for each.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import orjson
+
+from benchmarks.pulse_server import start_server
+
+BENCHMARKS_DIR = Path(__file__).parent
+REPO_DIR = BENCHMARKS_DIR.parent
+FIXTURES_DIR = BENCHMARKS_DIR / "fixtures"
+PULSE_FIXTURES_DIR = FIXTURES_DIR / "pulse"
+SCENARIOS_PATH = FIXTURES_DIR / "scenarios.json"
+HISTORY_PATH = BENCHMARKS_DIR / "results" / "history.jsonl"
+
+IDENTITY_KEYS = ("MY_PROFILE_NAME", "MY_RACE", "MY_CHARACTER_ID", "MY_REGION")
+REGRESSION_THRESHOLD = 1.2  # Flag stages that got 20% slower than the previous run
+
+
+def load_scenarios():
+    return orjson.loads(SCENARIOS_PATH.read_bytes()) if SCENARIOS_PATH.exists() else []
+
+
+def prepare_workspace(identity, api_root):
+    """
+    Point the app at a throwaway workspace and the stand-in API. Must run before any app module is imported.
+    """
+    workspace = Path(tempfile.mkdtemp(prefix="smurf_check_bench_"))
+    for directory in ("search", "summary", "common", "matches", "stats", "notes"):
+        (workspace / "profiles" / directory).mkdir(parents=True)
+    for directory in ("screenshots", "names"):
+        (workspace / "images" / directory).mkdir(parents=True)
+    (workspace / "static" / "mmr_plot").mkdir(parents=True)
+    (workspace / "tmp").mkdir()
+    shutil.copytree(REPO_DIR / "images" / "templates", workspace / "images" / "templates")
+
+    os.environ.update(identity)
+    os.environ.update(
+        {
+            "SC2PULSE_API_ROOT": api_root,
+            "PROFILES_DIR": str(workspace / "profiles"),
+            "IMAGES_DIR": str(workspace / "images"),
+            "STATIC_DIR": str(workspace / "static"),
+            "TMP_DIR": str(workspace / "tmp"),
+        }
+    )
+    # Some JSON is written relative to the working directory
+    os.chdir(workspace)
+    return workspace
+
+
+def timed_check(kwargs):
+    from app.plot import wait_for_pending_plots
+    from app.smurf_check import execute_smurf_check
+    from app.utils.timing_utils import trace
+
+    # Outer trace so the background plot lands in it before it is written
+    with trace("benchmark") as current:
+        start = perf_counter()
+        execute_smurf_check(**kwargs)
+        total = perf_counter() - start
+        wait_for_pending_plots()
+    return {**current.stage_totals(), "total": total}
+
+
+def check(args):
+    """
+    One run in this process: a cold check in a fresh workspace, then a warm one. Written to args.output as JSON.
+    """
+    scenario = orjson.loads(args.scenario)
+    workspace = prepare_workspace(scenario["identity"], args.api_root)
+    # A cached verdict would skip the pipeline being measured
+    kwargs = {**scenario["kwargs"], "use_verdicts": False}
+    try:
+        timings = {"cold": timed_check(kwargs), "warm": timed_check(kwargs)}
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workspace, ignore_errors=True)
+    Path(args.output).write_bytes(orjson.dumps(timings))
+
+
+def run_in_subprocess(scenario, api_root):
+    with tempfile.TemporaryDirectory() as directory:
+        output = Path(directory) / "timings.json"
+        command = [sys.executable, "-m", "benchmarks.pipeline", "check", "-api_root", api_root, "-output", str(output)]
+        subprocess.run([*command, "-scenario", orjson.dumps(scenario).decode()], cwd=REPO_DIR, check=True)
+        return orjson.loads(output.read_bytes())
+
+
+def _medians(runs):
+    stage_names = sorted({name for stages in runs for name in stages})
+    return {name: statistics.median([stages.get(name, 0) for stages in runs]) for name in stage_names}
+
+
+def git_commit():
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def record(args):
+    from dotenv import load_dotenv
+
+    load_dotenv(REPO_DIR / ".env")
+    server, api_root = start_server(PULSE_FIXTURES_DIR, record=True)
+    identity = {key: os.environ[key] for key in IDENTITY_KEYS}
+    kwargs = {
+        "screenshot_path": str(Path(args.screenshot).resolve()) if args.screenshot else None,
+        "opponent_character_id": args.opponent_character_id,
+        "opponent_name": args.opponent_name,
+        "opponent_race": args.opponent_race,
+    }
+    prepare_workspace(identity, api_root)
+    timed_check(kwargs)
+    server.shutdown()
+
+    if args.screenshot:
+        screenshots_dir = FIXTURES_DIR / "screenshots"
+        screenshots_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copy(args.screenshot, screenshots_dir / Path(args.screenshot).name)
+        kwargs["screenshot_path"] = f"screenshots/{Path(args.screenshot).name}"
+
+    scenarios = [scenario for scenario in load_scenarios() if scenario["name"] != args.name]
+    scenarios.append({"name": args.name, "identity": identity, "kwargs": kwargs})
+    SCENARIOS_PATH.write_bytes(orjson.dumps(scenarios, option=orjson.OPT_INDENT_2))
+    print(f"Recorded scenario {args.name}")
+
+
+def run(args):
+    scenarios = [scenario for scenario in load_scenarios() if not args.name or scenario["name"] in args.name]
+    if not scenarios:
+        sys.exit(f"No recorded scenarios in {SCENARIOS_PATH}")
+
+    server, api_root = start_server(PULSE_FIXTURES_DIR)
+    results = {}
+    try:
+        for scenario in scenarios:
+            scenario = {**scenario, "kwargs": dict(scenario["kwargs"])}
+            if scenario["kwargs"].get("screenshot_path"):
+                scenario["kwargs"]["screenshot_path"] = str(FIXTURES_DIR / scenario["kwargs"]["screenshot_path"])
+
+            runs = [run_in_subprocess(scenario, api_root) for _ in range(args.runs)]
+            for mode in ("cold", "warm"):
+                results[f"{scenario['name']}/{mode}"] = _medians([timings[mode] for timings in runs])
+    finally:
+        server.shutdown()
+
+    previous = None
+    if HISTORY_PATH.exists():
+        lines = HISTORY_PATH.read_bytes().splitlines()
+        previous = orjson.loads(lines[-1])["results"] if lines else None
+
+    HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(HISTORY_PATH, "ab") as f:
+        f.write(orjson.dumps({"commit": git_commit(), "runs": args.runs, "results": results}) + b"\n")
+
+    regressions = []
+    for scenario, stages in results.items():
+        print(f"{scenario}:")
+        for name, seconds in stages.items():
+            before = (previous or {}).get(scenario, {}).get(name)
+            change = f"{seconds / before:6.2f}x" if before else "      -"
+            print(f"  {name:<16} {seconds * 1000:10.1f}ms  {change}")
+            if before and seconds > before * REGRESSION_THRESHOLD:
+                regressions.append(f"{scenario}/{name}")
+
+    if regressions:
+        sys.exit(f"Regressions against the previous run: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record")
+    record_parser.add_argument("-name", required=True)
+    record_parser.add_argument("-screenshot")
+    record_parser.add_argument("-opponent_character_id")
+    record_parser.add_argument("-opponent_name")
+    record_parser.add_argument("-opponent_race")
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("-name", nargs="*")
+    run_parser.add_argument("-runs", type=int, default=5, help="Fresh processes per scenario")
+
+    # A single run, started by run in its own process
+    check_parser = subparsers.add_parser("check")
+    check_parser.add_argument("-scenario", required=True)
+    check_parser.add_argument("-api_root", required=True)
+    check_parser.add_argument("-output", required=True)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args)
+    elif args.command == "check":
+        check(args)
+    else:
+        run(args)
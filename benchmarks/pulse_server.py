@@ -0,0 +1,123 @@
+"""
+Local stand-in for the sc2pulse API
+
+Replays responses recorded under a fixtures directory. In record mode requests are forwarded to the real API and the
+responses are saved for later replays.
+
+python -m benchmarks.pulse_server -fixtures benchmarks/fixtures/pulse [-record]
+"""
+
+import argparse
+import hashlib
+import logging
+import re
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import orjson
+
+UPSTREAM_API_ROOT = "https://sc2pulse.nephest.com/sc2/api"
+INDEX_FILE = "index.json"
+
+# /character/{id}/matches/{date}/... The first page starts from "now" so its date never matches a recording
+MATCHES_PATH = re.compile(r"^/character/(?P<id>[^/]+)/matches/(?P<date>[^/]+)/(?P<rest>.+)$")
+
+
+class Fixtures:
+    """
+    Recorded responses keyed by request path
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        index_path = self.directory / INDEX_FILE
+        self.index = orjson.loads(index_path.read_bytes()) if index_path.exists() else {}
+
+    def save(self, path, body):
+        file_name = f"{hashlib.sha1(path.encode()).hexdigest()}.json"
+        (self.directory / file_name).write_bytes(body)
+        with self.lock:
+            self.index[path] = file_name
+            (self.directory / INDEX_FILE).write_bytes(orjson.dumps(self.index, option=orjson.OPT_INDENT_2))
+
+    def load(self, path):
+        file_name = self.index.get(path) or self.index.get(self._nearest_matches_page(path))
+        return (self.directory / file_name).read_bytes() if file_name else None
+
+    def _nearest_matches_page(self, path):
+        """
+        Recorded matches page for the same character with the nearest cursor date at or after the requested one,
+        falling back to the most recent page
+        """
+        requested = MATCHES_PATH.match(path)
+        if not requested:
+            return None
+
+        candidates = []
+        for recorded_path in self.index:
+            recorded = MATCHES_PATH.match(recorded_path)
+            if recorded and recorded["id"] == requested["id"]:
+                candidates.append((recorded["date"], recorded_path))
+        if not candidates:
+            return None
+
+        later = sorted(candidate for candidate in candidates if candidate[0] >= requested["date"])
+        return later[0][1] if later else max(candidates)[1]
+
+
+def make_handler(fixtures, record=False, upstream=UPSTREAM_API_ROOT):
+    class PulseHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if record:
+                with urllib.request.urlopen(upstream + self.path) as response:
+                    body = response.read()
+                fixtures.save(self.path, body)
+            else:
+                body = fixtures.load(self.path)
+
+            if body is None:
+                logging.warning(f"No recorded response for {self.path}")
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    return PulseHandler
+
+
+def start_server(fixtures_dir, record=False, host="127.0.0.1", port=0):
+    """
+    Start the stand-in server on a background thread. Returns the server and its API root.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(Fixtures(fixtures_dir), record=record))
+    threading.Thread(target=server.serve_forever, name="pulse_server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-fixtures", default="benchmarks/fixtures/pulse")
+    parser.add_argument("-record", action="store_true")
+    parser.add_argument("-port", type=int, default=5002)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(Fixtures(args.fixtures), record=args.record))
+    logging.info(f"Serving sc2pulse fixtures from {args.fixtures} on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,201 @@
+"""
+Batch reprocessing of archived loading screen screenshots
+
+Runs OCR and race detection over every screenshot in the image archive, and any left in SCREENSHOTS_DIR from before
+it, on a process pool, one worker per core. Reports accuracy against the labels the screenshots were archived with
+along with per-stage timings. Use it to check OCR and template changes against the real corpus.
+
+Screenshots are labelled {%Y_%m_%d_%H_%M_%S}_{left_name}_{left_race}_{right_name}_{right_race} with what was parsed
+when they were taken, so correct a misread label (the file name, or the label in the archive index) to make it ground
+truth. Screenshots that don't follow the 1v1 pattern are skipped.
+
+The name accuracy by confidence table is what OCR_CONFIDENCE_THRESHOLD is picked from. A read at or above the
+threshold ends OCR of that name, so pick the lowest threshold whose reads are still right. Try another with
+OCR_CONFIDENCE_THRESHOLD=90 python -m benchmarks.screenshots.
+
+python -m benchmarks.screenshots -limit 500 -misses 20
+"""
+
+import argparse
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from app.image_archive import image_archive
+from app.static import OCR_CONFIDENCE_THRESHOLD, SCREENSHOTS_DIR
+from app.utils.timing_utils import stage, stage_percentiles, trace
+
+RACES = "ZERG|TERRAN|PROTOSS|RANDOM|None"
+LABEL_PATTERN = re.compile(
+    rf"^\d{{4}}(?:_\d{{2}}){{5}}_(?P<left_name>.+)_(?P<left_race>{RACES})_(?P<right_name>.+)_(?P<right_race>{RACES})$"
+)
+FIELDS = ("left_name", "left_race", "right_name", "right_race")
+CONFIDENCE_THRESHOLDS = (50, 60, 70, 75, 80, 85, 90, 95)
+
+
+def parse_label(label):
+    """
+    Labelled fields of an archived screenshot, or None if it doesn't follow the 1v1 pattern
+    """
+    match = LABEL_PATTERN.match(label or "")
+    return match.groupdict() if match else None
+
+
+def labelled_screenshots(screenshots_dir=SCREENSHOTS_DIR):
+    """
+    (path, label) of every screenshot in the archive and in screenshots_dir, oldest first
+    """
+    archive = image_archive()
+    # The same screenshot archived twice is only checked once, with its latest label
+    archived = {archive.path(entry): entry.label for entry in archive.entries("screenshot")}
+    legacy = {path: path.stem for path in sorted(Path(screenshots_dir).glob("*.png"))}
+    return list(legacy.items()) + list(archived.items())
+
+
+def _init_worker():
+    # One Tesseract thread per process, the pool already uses every core
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    logging.basicConfig(level=logging.WARNING)
+
+
+def process_screenshot(path):
+    """
+    Parse one screenshot. Returns (path, parsed fields, stage timings as a trace dict, error). Errors are returned
+    rather than raised so one unreadable screenshot doesn't stop the run.
+    """
+    from app.image import parse_nameplates, read_image
+
+    try:
+        with trace("screenshot_batch", path=None) as current:
+            with stage("read"):
+                img = read_image(path)
+            if img is None:
+                raise ValueError("Unable to read image")
+            left, right = parse_nameplates(img)
+    except Exception as e:
+        return str(path), None, None, f"{type(e).__name__}: {e}"
+
+    parsed = {
+        "left_name": left.name,
+        "left_race": str(left.race),
+        "right_name": right.name,
+        "right_race": str(right.race),
+        # Confidence of the name read, for the threshold report
+        "left_confidence": left.candidates[0].confidence if left.candidates else None,
+        "right_confidence": right.candidates[0].confidence if right.candidates else None,
+    }
+    timings = {
+        "duration": current.duration,
+        "spans": [{"name": name, "duration": duration} for name, duration in current.stage_totals().items()],
+    }
+    return str(path), parsed, timings, None
+
+
+def confidence_report(reads, thresholds=CONFIDENCE_THRESHOLDS):
+    """
+    For each candidate OCR_CONFIDENCE_THRESHOLD, the share of names read at or above it and how many of those and of
+    the rest were right. reads are (confidence, correct) of every name read.
+
+    Reads at or above the threshold stop OCR early, so their accuracy is what the threshold trades against speed.
+    """
+    rows = []
+    for threshold in thresholds:
+        above = [correct for confidence, correct in reads if confidence is not None and confidence >= threshold]
+        below = [correct for confidence, correct in reads if confidence is None or confidence < threshold]
+        rows.append(
+            (
+                threshold,
+                len(above) / len(reads) if reads else None,
+                sum(above) / len(above) if above else None,
+                sum(below) / len(below) if below else None,
+            )
+        )
+    return rows
+
+
+def _percent(value):
+    return f"{value:7.1%}" if value is not None else "      -"
+
+
+def run(screenshots_dir=SCREENSHOTS_DIR, workers=None, limit=None, misses=0):
+    labelled = []
+    skipped = 0
+    for path, name in labelled_screenshots(screenshots_dir):
+        label = parse_label(name)
+        if label is None:
+            skipped += 1
+            continue
+        labelled.append((path, label))
+    labelled = labelled[:limit] if limit else labelled
+    if not labelled:
+        print(f"No labelled screenshots in the image archive or {screenshots_dir}")
+        return
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Reprocessing {len(labelled)} screenshots on {workers} workers. Skipped {skipped} unlabelled.")
+
+    labels = {str(path): label for path, label in labelled}
+    correct = dict.fromkeys(FIELDS, 0)
+    exact = 0
+    failures = []
+    errors = []
+    timings = []
+    reads = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        paths = [path for path, _ in labelled]
+        for path, parsed, trace_timings, error in executor.map(process_screenshot, paths, chunksize=8):
+            if error:
+                errors.append((path, error))
+                continue
+            timings.append(trace_timings)
+            label = labels[path]
+            wrong = [field for field in FIELDS if parsed[field] != label[field]]
+            for field in FIELDS:
+                correct[field] += field not in wrong
+            for side in ("left", "right"):
+                reads.append((parsed[f"{side}_confidence"], f"{side}_name" not in wrong))
+            if wrong:
+                failures.append((path, [(field, label[field], parsed[field]) for field in wrong]))
+            else:
+                exact += 1
+
+    total = len(labelled) - len(errors)
+    if errors:
+        print(f"Unable to process {len(errors)} screenshots:")
+        for path, error in errors:
+            print(f"  {Path(path).name}: {error}")
+    if not total:
+        return
+
+    print("Accuracy:")
+    for field in FIELDS:
+        print(f"  {field:<16} {correct[field] / total:7.1%}")
+    print(f"  {'screenshot':<16} {exact / total:7.1%}")
+
+    print(f"Name accuracy by confidence (OCR_CONFIDENCE_THRESHOLD is {OCR_CONFIDENCE_THRESHOLD:g}):")
+    print(f"  {'threshold':<10} {'read at':>7} {'right':>7} {'right below':>11}")
+    for threshold, share, above, below in confidence_report(reads):
+        print(f"  {threshold:<10} {_percent(share)} {_percent(above)} {_percent(below):>11}")
+
+    print("Stage timings (ms):")
+    for name, summary in stage_percentiles(timings).items():
+        percentiles = "  ".join(f"{key}={value * 1000:8.1f}" for key, value in summary.items() if key != "count")
+        print(f"  {name:<16} {percentiles}")
+
+    for path, wrong in failures[:misses]:
+        print(f"{Path(path).name}:")
+        for field, expected, got in wrong:
+            print(f"  {field}: expected {expected!r}, got {got!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-dir", default=SCREENSHOTS_DIR, help="Screenshots from before the image archive")
+    parser.add_argument("-workers", type=int, help="Worker processes. Defaults to one per core.")
+    parser.add_argument("-limit", type=int, help="Only reprocess the first screenshots, oldest first")
+    parser.add_argument("-misses", type=int, default=0, help="Print this many misread screenshots")
+    args = parser.parse_args()
+
+    run(args.dir, workers=args.workers, limit=args.limit, misses=args.misses)
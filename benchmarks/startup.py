@@ -0,0 +1,67 @@
+"""
+Startup time benchmark for the smurf check CLI
+
+Imports app.smurf_check in fresh interpreters, reports wall time and the slowest imports, and fails if any
+imaging or plotting library is loaded at import time.
+
+python -m benchmarks.startup
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+MODULE = "app.smurf_check"
+HEAVY_MODULES = ("cv2", "pytesseract", "PIL", "numpy", "matplotlib")
+STARTUP_BUDGET = 1.0  # Seconds
+
+
+def import_wall_time(module):
+    start = perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+    return perf_counter() - start
+
+
+def loaded_heavy_modules(module):
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return [m for m in output.strip().split(",") if m]
+
+
+def slowest_imports(module, top):
+    """
+    Parse `python -X importtime` output into (cumulative microseconds, module) pairs
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], check=True, capture_output=True, text=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-runs", type=int, default=5)
+    parser.add_argument("-top", type=int, default=15)
+    args = parser.parse_args()
+
+    times = [import_wall_time(MODULE) for _ in range(args.runs)]
+    median = statistics.median(times)
+    print(f"import {MODULE}: median={median:.3f}s min={min(times):.3f}s max={max(times):.3f}s ({args.runs} runs)")
+
+    print("Slowest imports (cumulative):")
+    for cumulative, name in slowest_imports(MODULE, args.top):
+        print(f"  {cumulative / 1e6:8.3f}s  {name}")
+
+    heavy = loaded_heavy_modules(MODULE)
+    if heavy:
+        sys.exit(f"Heavy modules loaded at import time: {heavy}")
+    if median > STARTUP_BUDGET:
+        sys.exit(f"Startup {median:.3f}s is over the {STARTUP_BUDGET}s budget")
@@ -1,51 +1,236 @@
-import json
 import os
+from dataclasses import asdict, fields
+from datetime import datetime, timezone
+
+import orjson
+from flask import (
+    Flask,
+    Response,
+    abort,
+    jsonify,
+    make_response,
+    redirect,
+    render_template,
+    request,
+    stream_with_context,
+)
+
+from app.archive import profile_json_mtime, read_profile_json
+from app.matches import MatchStats, empty_match_stats, load_player_matches
+from app.notes import notes_store
+from app.static import NOTES_DIR, NOTES_LOG_PATH, STATIC_DIR
+from app.stats_index import stats_index
+from app.utils.file_utils import get_player_notes
+from app.utils.timing_utils import load_traces, stage_percentiles
+from app.verdicts import get_verdicts
 
-from flask import Flask, redirect, render_template, request
+app = Flask(__name__)
 
-from app.static import IMAGES_DIR, PROFILES_DIR
-from app.utils.date_utils import timestamp
-from app.utils.file_utils import get_player_notes, write_json
-from app.matches import empty_match_stats
+TIMINGS_TRACE_LIMIT = 500  # Most recent traces used for stage percentiles
+MMR_PLOT_MAX_AGE = 60 * 60 * 24 * 365  # Plot URLs are versioned by mtime so they never go stale
 
-app = Flask(__name__)
+# Stats API fields. Player fields come from the summary, stats fields from its MatchStats.
+STATS_API_PLAYER_FIELDS = ("name", "race", "region", "rating_avg", "rating_max", "rating_last", "account_stats")
+STATS_API_STATS_FIELDS = tuple(field.name for field in fields(MatchStats))
+STATS_API_FIELDS = (*STATS_API_PLAYER_FIELDS, *STATS_API_STATS_FIELDS, "verdict")
+STATS_API_DEFAULT_FIELDS = ("name", "race", "rating_last", "match_count", "mmr_delta", "smurf_score", "smurf_qual")
+STATS_API_MAX_IDS = 10000
+STATS_API_STREAM_THRESHOLD = 500  # Results above this many ids are streamed as NDJSON
+
+# Rendered profile pages keyed by character id -> (etag, html)
+PROFILE_RENDER_CACHE = {}
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def profile_validators(id):
+    """
+    ETag and Last-Modified for a profile page, derived from the files it renders
+    """
+    stats_mtime = profile_json_mtime("stats", id)
+    note_count = len(get_player_notes(id))
+    notes_mtime = max(_mtime_ns(NOTES_DIR / f"{id}.json"), _mtime_ns(NOTES_LOG_PATH))
+    png_mtime = _mtime_ns(STATIC_DIR / f"mmr_plot/{id}.png")
+    json_mtime = _mtime_ns(STATIC_DIR / f"mmr_plot/{id}.json")
+    plot_format, plot_mtime = ("json", json_mtime) if json_mtime > png_mtime else ("png", png_mtime)
+    etag = f"{id}-{stats_mtime}-{note_count}-{plot_format}-{plot_mtime}"
+    last_modified = datetime.fromtimestamp(max(stats_mtime, notes_mtime, plot_mtime) / 1e9, tz=timezone.utc)
+    return etag, last_modified, plot_format, plot_mtime
 
 
 @app.route("/")
 def index():
-    profiles = []
-    file_names = [f for f in os.listdir(f"{PROFILES_DIR}/stats") if f.endswith(".json")]
-    for name in file_names:
-        with open(f"{PROFILES_DIR}/stats/{name}") as f:
-            profile = json.load(f)
-            profiles.append({"character_id": profile["character_id"], "name": profile["name"]})
-
-    profiles = sorted(profiles, key=lambda profile: profile["name"].lower())
+    profiles = [
+        {"character_id": character_id, "name": summary.get("name")}
+        for character_id, summary in stats_index().summaries().items()
+    ]
+    profiles = sorted(profiles, key=lambda profile: (profile["name"] or "").lower())
     return render_template("index.html", profiles=profiles)
 
 
+def _split(values):
+    return [value for item in values for value in str(item).split(",") if value]
+
+
+def _stats_record(character_id, summary, verdict, selected):
+    if summary is None:
+        return {"character_id": character_id, "found": False}
+
+    stats = summary.get("stats") or {}
+    record = {"character_id": character_id, "found": True}
+    for field in selected:
+        if field == "verdict":
+            record["verdict"] = asdict(verdict) if verdict else None
+        elif field in STATS_API_STATS_FIELDS:
+            record[field] = stats.get(field)
+        else:
+            record[field] = summary.get(field)
+    return record
+
+
+@app.route("/api/stats", methods=["GET", "POST"])
+def api_stats():
+    """
+    Compact stats and verdicts for many players, straight from the stats index.
+
+    ids and fields are comma separated query arguments, or lists in a JSON body for POST. Unknown ids come back with
+    "found": false. format=ndjson, or more than STATS_API_STREAM_THRESHOLD ids, streams one JSON object per line.
+    """
+    body = (request.get_json(silent=True) or {}) if request.method == "POST" else {}
+    ids = _split(body.get("ids") or request.args.getlist("ids"))
+    selected = _split(body.get("fields") or request.args.getlist("fields")) or STATS_API_DEFAULT_FIELDS
+    output = body.get("format") or request.args.get("format")
+
+    unknown = [field for field in selected if field not in STATS_API_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown fields {unknown}", "fields": STATS_API_FIELDS}), 400
+    if not ids:
+        return jsonify({"error": "No ids"}), 400
+    if len(ids) > STATS_API_MAX_IDS:
+        return jsonify({"error": f"At most {STATS_API_MAX_IDS} ids per request"}), 400
+
+    index = stats_index()
+    verdicts = get_verdicts(ids) if "verdict" in selected else {}
+
+    def _records():
+        for character_id in ids:
+            yield _stats_record(character_id, index.get(character_id), verdicts.get(character_id), selected)
+
+    if output == "ndjson" or len(ids) > STATS_API_STREAM_THRESHOLD:
+        lines = (orjson.dumps(record) + b"\n" for record in _records())
+        return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+    return Response(orjson.dumps(list(_records())), mimetype="application/json")
+
+
+@app.route("/api/stats/<id>")
+def api_player_stats(id):
+    selected = _split(request.args.getlist("fields")) or STATS_API_DEFAULT_FIELDS
+    unknown = [field for field in selected if field not in STATS_API_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown fields {unknown}", "fields": STATS_API_FIELDS}), 400
+
+    summary = stats_index().get(id)
+    if summary is None:
+        abort(404)
+    verdict = get_verdicts([id]).get(id) if "verdict" in selected else None
+    return Response(orjson.dumps(_stats_record(id, summary, verdict, selected)), mimetype="application/json")
+
+
+@app.route("/api/matches/<id>")
+def api_player_matches(id):
+    """
+    Match payload behind a profile's stats. It is kept out of the stats summary and only loaded when asked for.
+    """
+    matches = load_player_matches(id)
+    if matches is None:
+        abort(404)
+    return Response(orjson.dumps(matches), mimetype="application/json")
+
+
 @app.route("/profile/<id>", methods=["GET", "POST"])
 def profile(id):
 
     if request.method == "GET":
-        with open(f"{PROFILES_DIR}/stats/{id}.json") as f:
-            profile = json.load(f)
-
-        notes = get_player_notes(id)
-        mmr_plot = IMAGES_DIR / f"mmr_plot/{id}.png"
+        etag, last_modified, plot_format, plot_mtime = profile_validators(id)
 
-        if not profile.get("stats"):
-            profile["stats"] = empty_match_stats()
-
-        return render_template("profile.html", profile=profile, mmr_plot=mmr_plot, notes=notes)
+        cached = PROFILE_RENDER_CACHE.get(id)
+        if cached and cached[0] == etag:
+            html = cached[1]
+        else:
+            profile = read_profile_json("stats", id)
+            if profile is None:
+                abort(404)
+            notes = get_player_notes(id)
+
+            if not profile.get("stats"):
+                profile["stats"] = empty_match_stats()
+
+            html = render_template(
+                "profile.html",
+                profile=profile,
+                mmr_plot_format=plot_format,
+                mmr_plot_version=plot_mtime,
+                notes=notes,
+            )
+            PROFILE_RENDER_CACHE[id] = (etag, html)
+
+        response = make_response(html)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
 
     if request.method == "POST":
-        notes = get_player_notes(id)
-        notes[timestamp(format="%Y-%m-%d %H:%M:%S")] = request.form["player_notes"]
-        write_json(notes, f"{PROFILES_DIR}/notes/{id}.json")
+        notes_store().append(id, request.form["player_notes"])
+        PROFILE_RENDER_CACHE.pop(id, None)
         return redirect(request.url)
 
 
+@app.route("/notes/search")
+def notes_search():
+    query = request.args.get("q", "")
+    results = notes_store().search(query, limit=request.args.get("limit", 100, type=int))
+    if request.args.get("format") == "json":
+        return jsonify(results)
+
+    for result in results:
+        profile = read_profile_json("stats", result["character_id"])
+        result["name"] = profile.get("name") if profile else None
+    return render_template("notes_search.html", query=query, results=results)
+
+
+@app.route("/timings")
+def timings():
+    """
+    Per-stage percentiles over the most recent smurf checks
+    """
+    traces = load_traces(limit=request.args.get("limit", TIMINGS_TRACE_LIMIT, type=int))
+    return jsonify(stage_percentiles(traces))
+
+
+@app.route("/traces")
+def traces():
+    return jsonify(load_traces(limit=request.args.get("limit", 20, type=int)))
+
+
+@app.after_request
+def mmr_plot_cache_headers(response):
+    if request.path.startswith("/static/mmr_plot/"):
+        response.cache_control.public = True
+        if request.args.get("v"):
+            response.cache_control.max_age = MMR_PLOT_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+
+    return response
+
+
 @app.context_processor
 def mmr_delta_utility_processor():
     def mmr_delta_background_color(mmr_delta=None):
@@ -0,0 +1,52 @@
+"""
+app.static reads its directories from the environment on import, so every test session gets its own temporary
+PROFILES_DIR, STATIC_DIR, TMP_DIR and IMAGES_DIR before any app module is imported. Tests that write files take their
+paths from the fixtures below rather than the session directories.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+_SESSION_DIR = Path(tempfile.mkdtemp(prefix="smurf_check_tests_"))
+for _name in ("PROFILES_DIR", "STATIC_DIR", "TMP_DIR", "IMAGES_DIR"):
+    os.environ[_name] = str(_SESSION_DIR / _name.lower())
+    Path(os.environ[_name]).mkdir()
+os.environ["MY_PROFILE_NAME"] = "Me"
+os.environ["MY_RACE"] = "ZERG"
+os.environ["MY_CHARACTER_ID"] = "1"
+os.environ["MY_REGION"] = "US"
+
+
+def participant(character_id, decision="WIN", rating=4000, name=None, race="zerg"):
+    """
+    A participant of a match history entry, shaped like sc2pulse's
+    """
+    member = {"character": {"id": int(character_id), "name": name or f"Player{character_id}"}, f"{race}GamesPlayed": 1}
+    return {
+        "participant": {"playerCharacterId": int(character_id), "decision": decision},
+        "team": {"rating": rating, "members": [member]},
+        "teamState": {"teamState": {"rating": rating}},
+    }
+
+
+def match_entry(
+    match_id, participants, date="2024-08-01T12:00:00", match_type="_1V1", duration=600, map_name="Alcyone"
+):
+    """
+    One entry of a /character/{id}/matches page
+    """
+    return {
+        "match": {"id": match_id, "date": date, "type": match_type, "duration": duration},
+        "map": {"id": 1, "name": map_name},
+        "participants": participants,
+    }
+
+
+@pytest.fixture
+def profiles_dir(tmp_path):
+    path = tmp_path / "profiles"
+    path.mkdir()
+    return path
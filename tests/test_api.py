@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+from app import api
+from app.api import get_json, uncached
+
+ENDPOINT = f"{api.API_ROOT}/character/2/summary"
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    """
+    Stand-in sc2pulse. Set status to the status of the next responses. Returns the stub, which keeps the requested
+    endpoints.
+    """
+
+    class Pulse:
+        status = 200
+        requests = []
+
+        def get(self, endpoint):
+            self.requests.append(endpoint)
+            body = {"n": len(self.requests)} if self.status == 200 else {"error": "boom"}
+            return SimpleNamespace(status_code=self.status, ok=self.status < 400, content=orjson.dumps(body))
+
+    stub = Pulse()
+    monkeypatch.setattr(api, "get", stub.get)
+    monkeypatch.setattr(api, "_CACHE", {})
+    return stub
+
+
+def test_response_is_reused_within_ttl(responses, monkeypatch):
+    assert get_json(ENDPOINT) == {"n": 1}
+    assert get_json(ENDPOINT) == {"n": 1}
+    assert len(responses.requests) == 1
+
+    now = api.time.monotonic()
+    monkeypatch.setattr(api.time, "monotonic", lambda: now + api.API_CACHE_TTL)
+    assert get_json(ENDPOINT) == {"n": 2}
+
+
+def test_bypass_sends_the_request_and_refreshes(responses):
+    get_json(ENDPOINT)
+
+    assert get_json(ENDPOINT, ttl=0) == {"n": 2}
+    with uncached():
+        assert get_json(ENDPOINT) == {"n": 3}
+    assert get_json(ENDPOINT) == {"n": 3}
+    assert len(responses.requests) == 3
+
+
+def test_errors_are_not_cached(responses):
+    responses.status = 503
+    assert get_json(ENDPOINT) == {"error": "boom"}
+
+    responses.status = 200
+    assert get_json(ENDPOINT) == {"n": 2}
+    assert get_json(ENDPOINT) == {"n": 2}
+    assert len(responses.requests) == 2
+
+
+def test_callers_get_their_own_copy(responses):
+    get_json(ENDPOINT)["n"] = 0
+    hit = get_json(ENDPOINT)
+    hit["n"] = -1
+
+    assert get_json(ENDPOINT) == {"n": 1}
+    assert len(responses.requests) == 1
+
+
+def test_oldest_response_is_evicted(responses, monkeypatch):
+    monkeypatch.setattr(api, "API_CACHE_SIZE", 2)
+    for character_id in (1, 2, 3):
+        get_json(f"{api.API_ROOT}/character/{character_id}/summary")
+
+    assert list(api._CACHE) == [f"{api.API_ROOT}/character/{character_id}/summary" for character_id in (2, 3)]
+    get_json(f"{api.API_ROOT}/character/1/summary")
+    assert len(responses.requests) == 4
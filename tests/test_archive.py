@@ -0,0 +1,153 @@
+import os
+
+import orjson
+import pytest
+
+from app import archive as archive_module
+from app.archive import ProfileArchive, compact, read_profile_json
+from app.static import ARCHIVE_PATH
+
+
+def _write(profiles_dir, kind, key, data):
+    directory = profiles_dir / kind
+    directory.mkdir(exist_ok=True)
+    path = directory / f"{key}.json"
+    path.write_bytes(data)
+    return path
+
+
+@pytest.fixture
+def archive_path():
+    # read_profile_json falls back to the archive at ARCHIVE_PATH
+    yield ARCHIVE_PATH
+    ARCHIVE_PATH.unlink(missing_ok=True)
+
+
+def test_compact_round_trip(profiles_dir, tmp_path):
+    _write(profiles_dir, "stats", "1", orjson.dumps({"name": "Foo", "stats": {"smurf_qual": "Likely"}}))
+    _write(profiles_dir, "summary", "1", orjson.dumps([{"ratingMax": 5000}]))
+    # Match pages are appended to one file, so a record holds several documents
+    _write(profiles_dir, "matches", "1", b'{"result": [1]}\n{"result": [2]}\n')
+
+    path = compact(tmp_path / "archive.smurf", profiles_dir=profiles_dir)
+
+    with ProfileArchive(path) as archive:
+        assert archive.get("stats", 1) == {"name": "Foo", "stats": {"smurf_qual": "Likely"}}
+        assert archive.get("summary", "1") == [{"ratingMax": 5000}]
+        assert archive.get("matches", "1") == [{"result": [1]}, {"result": [2]}]
+        assert archive.get("stats", "2") is None
+        assert ("stats", 1) in archive
+        assert archive.entry("stats", "1")["name"] == "Foo"
+        assert dict(archive.iter_records("stats")) == {"1": {"name": "Foo", "stats": {"smurf_qual": "Likely"}}}
+
+
+def test_compact_keeps_archived_records_and_prefers_loose_files(profiles_dir, tmp_path):
+    path = tmp_path / "archive.smurf"
+    _write(profiles_dir, "stats", "1", orjson.dumps({"name": "Old"}))
+    _write(profiles_dir, "stats", "2", orjson.dumps({"name": "Kept"}))
+    compact(path, profiles_dir=profiles_dir, prune=True)
+    assert not (profiles_dir / "stats" / "1.json").exists()
+
+    _write(profiles_dir, "stats", "1", orjson.dumps({"name": "New"}))
+    compact(path, profiles_dir=profiles_dir)
+
+    with ProfileArchive(path) as archive:
+        assert archive.get("stats", "1") == {"name": "New"}
+        assert archive.get("stats", "2") == {"name": "Kept"}
+
+
+def _append(profiles_dir, key, page):
+    directory = profiles_dir / "matches"
+    directory.mkdir(exist_ok=True)
+    with open(directory / f"{key}.json", "ab") as f:
+        f.write(orjson.dumps({"result": [page]}) + b"\n")
+
+
+def _pages(path, key="1"):
+    with ProfileArchive(path) as archive:
+        return [document["result"][0] for document in archive.get("matches", key)]
+
+
+def test_compact_appends_match_pages_after_a_prune(profiles_dir, tmp_path):
+    path = tmp_path / "archive.smurf"
+    _append(profiles_dir, "1", 1)
+    compact(path, profiles_dir=profiles_dir, prune=True)
+    assert not (profiles_dir / "matches" / "1.json").exists()
+
+    _append(profiles_dir, "1", 2)
+    compact(path, profiles_dir=profiles_dir, prune=True)
+
+    assert _pages(path) == [1, 2]
+
+
+def test_compact_without_prune_doesnt_repeat_match_pages(profiles_dir, tmp_path):
+    path = tmp_path / "archive.smurf"
+    _append(profiles_dir, "1", 1)
+    compact(path, profiles_dir=profiles_dir, prune=True)
+
+    _append(profiles_dir, "1", 2)
+    compact(path, profiles_dir=profiles_dir)
+    # The loose file is still the one packed last time, now with another page
+    _append(profiles_dir, "1", 3)
+    compact(path, profiles_dir=profiles_dir)
+    compact(path, profiles_dir=profiles_dir)
+
+    assert _pages(path) == [1, 2, 3]
+
+
+def test_prune_keeps_files_written_after_they_were_packed(profiles_dir, tmp_path, monkeypatch):
+    path = tmp_path / "archive.smurf"
+    _append(profiles_dir, "1", 1)
+    _write(profiles_dir, "stats", "1", orjson.dumps({"name": "Foo"}))
+
+    real_replace = os.replace
+
+    def replace(src, dst):
+        real_replace(src, dst)
+        # A check appends a page between packing and pruning
+        _append(profiles_dir, "1", 2)
+
+    monkeypatch.setattr(archive_module.os, "replace", replace)
+    compact(path, profiles_dir=profiles_dir, prune=True)
+    monkeypatch.undo()
+
+    assert (profiles_dir / "matches" / "1.json").exists()
+    assert not (profiles_dir / "stats" / "1.json").exists()
+    assert _pages(path) == [1]
+
+    compact(path, profiles_dir=profiles_dir, prune=True)
+    assert _pages(path) == [1, 2]
+
+
+def test_compact_skips_unreadable_files(profiles_dir, tmp_path):
+    _write(profiles_dir, "stats", "1", b"{not json")
+    _write(profiles_dir, "stats", "2", orjson.dumps({"name": "Foo"}))
+
+    with ProfileArchive(compact(tmp_path / "archive.smurf", profiles_dir=profiles_dir)) as archive:
+        assert list(archive.keys("stats")) == ["2"]
+
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / "archive.smurf"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        ProfileArchive(path)
+
+
+def test_read_profile_json_prefers_loose_files(profiles_dir, archive_path):
+    _write(profiles_dir, "stats", "1", orjson.dumps({"name": "Archived"}))
+    compact(archive_path, profiles_dir=profiles_dir, prune=True)
+
+    assert read_profile_json("stats", "1", profiles_dir=profiles_dir) == {"name": "Archived"}
+
+    _write(profiles_dir, "stats", "1", orjson.dumps({"name": "Loose"}))
+    assert read_profile_json("stats", "1", profiles_dir=profiles_dir) == {"name": "Loose"}
+    assert read_profile_json("stats", "2", profiles_dir=profiles_dir) is None
+
+
+def test_read_profile_json_appends_loose_match_pages(profiles_dir, archive_path):
+    _append(profiles_dir, "1", 1)
+    compact(archive_path, profiles_dir=profiles_dir, prune=True)
+    _append(profiles_dir, "1", 2)
+
+    assert read_profile_json("matches", "1", profiles_dir=profiles_dir) == [{"result": [1]}, {"result": [2]}]
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from app import capture
+from app.capture import SCREEN_SIZE, LoadingScreenDetector
+
+# Half resolution, frames are only scaled to SCREEN_SIZE when the loading screen match runs
+FRAME_SHAPE = (540, 960, 3)
+
+
+def _frame(level):
+    return np.full(FRAME_SHAPE, level, dtype=np.uint8)
+
+
+@pytest.fixture
+def matches(monkeypatch):
+    """
+    Stand-in for the race icon match: bright frames are loading screens. Records every frame it is run on.
+    """
+    calls = []
+
+    def is_loading_screen(frame):
+        calls.append(frame)
+        return frame.mean() > 200
+
+    monkeypatch.setattr(capture, "is_loading_screen", is_loading_screen)
+    return calls
+
+
+def _confirmed(detector, levels):
+    return [index for index, level in enumerate(levels) if detector.update(_frame(level)) is not None]
+
+
+def test_hard_cut(matches):
+    levels = [20] * 10 + [250] * 10 + [20] * 10 + [250] * 10
+
+    assert _confirmed(LoadingScreenDetector(confirm_frames=3), levels) == [12, 32]
+    # The match runs on the first frame and on each cut, at SCREEN_SIZE
+    assert len(matches) == 4
+    assert all((frame.shape[1], frame.shape[0]) == SCREEN_SIZE for frame in matches)
+
+
+def test_fade_in(matches):
+    # Each step is below the scene threshold, the drift from the last evaluated frame is not
+    levels = list(range(0, 256, 4)) + [255] * 10
+    detector = LoadingScreenDetector(scene_threshold=8, confirm_frames=3, recheck_frames=1000)
+
+    confirmed = _confirmed(detector, levels)
+
+    assert len(confirmed) == 1
+    assert levels[confirmed[0]] > 200
+    assert len(matches) < len(levels) / 2
+
+
+def test_static_screen_is_rechecked(matches):
+    detector = LoadingScreenDetector(confirm_frames=3, recheck_frames=30)
+
+    assert _confirmed(detector, [20] * 100) == []
+    # First frame, then every recheck_frames frames
+    assert len(matches) == 4
+
+
+def test_confirmed_frame_is_scaled(matches):
+    detector = LoadingScreenDetector(confirm_frames=2)
+
+    detector.update(_frame(250))
+    confirmed = detector.update(_frame(250))
+
+    assert (confirmed.shape[1], confirmed.shape[0]) == SCREEN_SIZE
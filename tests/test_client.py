@@ -0,0 +1,96 @@
+import socket
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import client
+from app import smurf_check as smurf_check_module
+from app.client import request_smurf_check, smurf_check
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    status = 200
+    delay = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.delay)
+        body = b'{"opponent": {"character_id": "2"}}' if self.status == 200 else b'{"error": "boom"}'
+        self.send_response(self.status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def daemon():
+    """
+    Stand-in daemon. Returns a function that starts it with a response status and delay, and returns its port.
+    """
+    servers = []
+
+    def start(status=200, delay=0):
+        handler = type("Handler", (StatusHandler,), {"status": status, "delay": delay})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address[1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def local_checks(monkeypatch):
+    calls = []
+    monkeypatch.setattr(smurf_check_module, "execute_smurf_check", lambda **kwargs: calls.append(kwargs))
+    return calls
+
+
+def test_result(daemon):
+    assert request_smurf_check(port=daemon()) == {"opponent": {"character_id": "2"}}
+
+
+def test_refused_connection_falls_back(free_port, local_checks, monkeypatch):
+    assert request_smurf_check(port=free_port) is None
+
+    monkeypatch.setattr(client, "request_smurf_check", partial(request_smurf_check, port=free_port))
+    assert smurf_check(opponent_character_id="2") == {"player": None, "opponent": None}
+    assert local_checks == [{"opponent_character_id": "2"}]
+
+
+def test_http_error_is_reported(daemon, local_checks, monkeypatch):
+    port = daemon(status=500)
+
+    result = request_smurf_check(port=port)
+    assert "500" in result["error"]
+
+    monkeypatch.setattr(client, "request_smurf_check", partial(request_smurf_check, port=port))
+    assert "error" in smurf_check(opponent_character_id="2")
+    assert local_checks == []
+
+
+def test_timeout_is_reported(daemon, local_checks, monkeypatch):
+    port = daemon(delay=1)
+    monkeypatch.setattr(client, "DAEMON_TIMEOUT", 0.2)
+
+    assert "error" in request_smurf_check(port=port)
+
+    monkeypatch.setattr(client, "request_smurf_check", partial(request_smurf_check, port=port))
+    assert "error" in smurf_check(opponent_character_id="2")
+    assert local_checks == []
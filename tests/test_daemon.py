@@ -0,0 +1,54 @@
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import orjson
+import pytest
+
+from app import daemon
+from app.daemon import SmurfCheckHandler
+from app.player import DEFAULT_IDENTITY, Identity
+
+
+@pytest.fixture
+def checks(monkeypatch):
+    """
+    Daemon with a stand-in check. Returns the post function and the keyword arguments of every check run.
+    """
+    calls = []
+    monkeypatch.setattr(daemon, "execute_smurf_check", lambda **kwargs: calls.append(kwargs))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SmurfCheckHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def post(body):
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_address[1]}/check", data=orjson.dumps(body), method="POST"
+        )
+        with urllib.request.urlopen(request) as response:
+            return orjson.loads(response.read())
+
+    yield post, calls
+    server.shutdown()
+    server.server_close()
+
+
+def test_check_for_another_identity(checks):
+    post, calls = checks
+
+    post({"opponent_character_id": "2", "identity": {"name": "Alt", "character_id": 3, "region": "EU"}})
+    post({"opponent_character_id": "2"})
+
+    assert calls[0]["identity"] == Identity(name="Alt", character_id="3", region="EU")
+    assert calls[1]["identity"] == DEFAULT_IDENTITY
+
+
+@pytest.mark.parametrize("identity", [{"character_id": "3"}, {"name": "", "character_id": "3"}, {"name": "Alt"}, "Alt"])
+def test_incomplete_identity_is_rejected(checks, identity):
+    post, calls = checks
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post({"opponent_character_id": "2", "identity": identity})
+
+    assert error.value.code == 400
+    assert calls == []
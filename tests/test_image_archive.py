@@ -0,0 +1,79 @@
+import multiprocessing
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+from app import image_archive
+from app.image_archive import ImageArchive, archive_async, image_hash
+
+
+def _image(seed, shape=(30, 250, 3)):
+    return np.random.default_rng(seed).integers(0, 256, shape, dtype=np.uint8)
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    # archive_async stores into the shared archive
+    archive = ImageArchive(tmp_path / "archive")
+    monkeypatch.setattr(image_archive, "_ARCHIVE", archive)
+    return archive
+
+
+def test_archive_async_round_trip(archive):
+    name, screenshot = _image(1), _image(2, shape=(108, 192, 3))
+
+    archive_async([(name, "name", "Foo"), (screenshot, "screenshot", "2024-08-01_Foo_ZERG")]).result()
+
+    entries = archive.entries()
+    assert [(entry.kind, entry.label) for entry in entries] == [("name", "Foo"), ("screenshot", "2024-08-01_Foo_ZERG")]
+    assert [entry.label for entry in archive.entries(kind="name")] == ["Foo"]
+    # PNG is lossless, the stored pixels are the archived ones
+    for entry, img in zip(entries, (name, screenshot)):
+        assert entry.hash == image_hash(img)
+        assert np.array_equal(cv.imread(str(archive.path(entry))), img)
+
+
+def test_same_image_is_stored_once(archive):
+    img = _image(1)
+
+    first = archive.add(img, "screenshot", "first")
+    second = archive.add(img.copy(), "screenshot", "second")
+
+    assert first.hash == second.hash
+    assert second.size == first.size
+    assert len(archive.entries()) == 2
+    assert len(list((archive.root / "objects").rglob("*.png"))) == 1
+    assert archive.info() == {"entries": 2, "images": 1, "bytes": first.size, "kinds": {"screenshot": 2}}
+
+
+def _add_many(root, start, count):
+    archive = ImageArchive(root)
+    for seed in range(start, start + count):
+        archive.add(_image(seed), "name", str(seed))
+    # Every writer also stores one image they all share
+    archive.add(_image(999), "screenshot", f"shared_{start}")
+
+
+def test_concurrent_writers_keep_every_entry(tmp_path):
+    root = tmp_path / "archive"
+    processes = [
+        multiprocessing.get_context("spawn").Process(target=_add_many, args=(root, start, 20))
+        for start in (0, 100, 200)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    archive = ImageArchive(root)
+    entries = archive.entries()
+    assert len(entries) == 63
+    assert sorted(entry.label for entry in archive.entries(kind="screenshot")) == [
+        "shared_0",
+        "shared_100",
+        "shared_200",
+    ]
+    assert archive.info()["images"] == 61
+    assert all(archive.path(entry).exists() for entry in entries)
@@ -0,0 +1,226 @@
+from dataclasses import replace
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+from conftest import match_entry, participant
+
+from app import matches
+from app.matches import (
+    decode_match,
+    get_matches_for_profile,
+    load_player_matches,
+    newest_match_date,
+)
+from app.player import Player
+from app.static import MAX_STALE_PAGES
+
+PROFILE = Player(character_id="1", name="Me", race="ZERG")
+
+
+def test_decode_match():
+    entry = match_entry(
+        7,
+        [participant(1, "WIN", 4000), participant(2, "LOSS", 3950, name="Foo", race="terran")],
+        date="2024-08-01T12:00:00",
+        duration=612,
+        map_name="Alcyone",
+    )
+    match = decode_match(entry, PROFILE)
+
+    assert match.player == Player(character_id="1", name="Me", race="ZERG", rating_last=4000)
+    assert match.opponent == Player(character_id="2", name="Foo", race="TERRAN", rating_last=3950)
+    assert (match.date, match.duration, match.map, match.result, match.type) == (
+        "2024-08-01T12:00:00",
+        612,
+        "Alcyone",
+        "WIN",
+        "_1V1",
+    )
+    assert match.rating == 4000
+    assert match.participant_count == 2
+
+
+def test_decode_match_without_player():
+    entry = match_entry(7, [participant(2), participant(3)])
+    assert decode_match(entry, PROFILE) is None
+
+
+def test_decode_match_tolerates_missing_fields():
+    entry = {"participants": [{"participant": {"playerCharacterId": 1}}, {"participant": {"playerCharacterId": 2}}]}
+    match = decode_match(entry, PROFILE)
+
+    assert match.opponent == Player(character_id="2", name=None, race=None, rating_last=None)
+    assert (match.date, match.duration, match.map, match.result, match.type, match.rating) == (
+        None,
+        0,
+        None,
+        None,
+        None,
+        None,
+    )
+
+
+def test_decode_match_with_several_opponents_has_no_single_opponent():
+    entry = match_entry(7, [participant(1), participant(2), participant(3)], match_type="_2V2")
+    match = decode_match(entry, PROFILE)
+
+    assert match.opponent.character_id is None
+    assert match.participant_count == 3
+
+
+def test_newest_match_date_skips_other_match_types():
+    pages = [
+        {
+            "result": [
+                match_entry(3, [participant(1), participant(2), participant(3), participant(4)], match_type="_2V2")
+            ]
+        },
+        {"result": [match_entry(2, [participant(1), participant(2)], date="2024-08-01T10:00:00")]},
+    ]
+    with mock.patch.object(matches, "get_matches", side_effect=pages) as get_matches:
+        assert newest_match_date("1") == "2024-08-01T10:00:00"
+
+    # Always a fresh request, never the API cache
+    assert all(call.kwargs["ttl"] == 0 for call in get_matches.call_args_list)
+
+
+def test_newest_match_date_without_matches():
+    with mock.patch.object(matches, "get_matches", return_value={"result": []}):
+        assert newest_match_date("1") is None
+
+
+def test_only_1v1_games_are_limited_to_two_participants():
+    team_game = match_entry(8, [participant(1), participant(2), participant(3), participant(4)], match_type="_2V2")
+    odd_1v1 = match_entry(9, [participant(1), participant(2), participant(3)])
+
+    assert matches._is_match_type(team_game, "_2V2")
+    assert not matches._is_match_type(team_game, "_1V1")
+    assert not matches._is_match_type(odd_1v1, "_1V1")
+
+
+class PagedApi:
+    """
+    Stand-in for /character/{id}/matches. Returns up to page_size matches at or before the date cursor, newest first,
+    so consecutive pages overlap on their boundary match.
+    """
+
+    def __init__(self, entries, page_size=10):
+        self.entries = entries
+        self.page_size = page_size
+        self.cursors = []
+
+    def __call__(self, character_id, date, matchType="_1V1", map_id=1, ttl=None):
+        self.cursors.append(date)
+        cursor = _parse(date)
+        page = [entry for entry in self.entries if _parse(entry["match"]["date"]) <= cursor]
+        return {"result": page[: self.page_size]}
+
+
+def _parse(date):
+    return datetime.fromisoformat(date.removesuffix("Z"))
+
+
+def _history(count, newest=datetime(2024, 8, 1, 12), step=timedelta(minutes=30), first_id=1000):
+    return [
+        match_entry(
+            first_id - index,
+            [participant(1, decision="WIN" if index % 2 else "LOSS"), participant(2)],
+            date=(newest - index * step).isoformat(),
+        )
+        for index in range(count)
+    ]
+
+
+@pytest.fixture
+def paged_api(monkeypatch):
+    """
+    Installs a PagedApi over the given entries. Raw pages aren't written.
+    """
+    monkeypatch.setattr(matches, "write_json", lambda **kwargs: None)
+
+    def install(entries, page_size=10):
+        api = PagedApi(entries, page_size)
+        monkeypatch.setattr(matches, "get_matches", api)
+        return api
+
+    return install
+
+
+def _dates(found):
+    return [match.date for match in found]
+
+
+def test_overlapping_pages_are_not_duplicated(paged_api):
+    entries = _history(35)
+    paged_api(entries)
+
+    found = get_matches_for_profile(replace(PROFILE), early_stop=False)
+
+    assert _dates(found) == [entry["match"]["date"] for entry in entries]
+
+
+def test_equal_timestamps_step_back(paged_api):
+    # More matches in one second than fit on a page. The cursor can't move inside the second, so it steps past it.
+    tied = _history(15, step=timedelta(0), first_id=2000)
+    older = _history(5, newest=datetime(2024, 8, 1, 11), first_id=1000)
+    api = paged_api(tied + older)
+
+    found = get_matches_for_profile(replace(PROFILE), early_stop=False)
+
+    assert "2024-08-01T11:59:59Z" in api.cursors
+    assert len(found) == 15
+    assert _dates(found)[-5:] == [entry["match"]["date"] for entry in older]
+
+
+def test_stale_pages_give_up(monkeypatch):
+    # The same page whatever the cursor
+    page = {"result": _history(10)}
+    calls = []
+    monkeypatch.setattr(matches, "write_json", lambda **kwargs: None)
+    monkeypatch.setattr(matches, "get_matches", lambda *args, **kwargs: calls.append(args) or page)
+
+    found = get_matches_for_profile(replace(PROFILE), early_stop=False)
+
+    assert len(found) == 10
+    assert len(calls) == 1 + MAX_STALE_PAGES
+
+
+def test_empty_page_ends_paging(paged_api):
+    api = paged_api([])
+
+    assert get_matches_for_profile(replace(PROFILE)) == []
+    assert len(api.cursors) == 1
+
+
+def test_early_stop(paged_api, monkeypatch):
+    monkeypatch.setattr(matches, "MATCH_STATS_CHECKPOINT", 10)
+    monkeypatch.setattr(matches, "MATCH_STATS_STABLE_CHECKPOINTS", 2)
+    paged_api(_history(100))
+    profile = replace(PROFILE)
+
+    found = get_matches_for_profile(profile)
+
+    # The qual is the same at every checkpoint, so paging stops at the second one
+    assert profile.early_stopped
+    assert 20 <= len(found) < 100
+
+
+def test_without_early_stop_match_count_matches_are_fetched(paged_api, monkeypatch):
+    monkeypatch.setattr(matches, "MATCH_STATS_CHECKPOINT", 10)
+    monkeypatch.setattr(matches, "MATCH_STATS_STABLE_CHECKPOINTS", 2)
+    paged_api(_history(100))
+    profile = replace(PROFILE)
+
+    found = get_matches_for_profile(profile, match_count=45, early_stop=False)
+
+    assert len(found) == 45
+    assert not profile.early_stopped
+
+
+def test_match_payload_round_trip(profiles_dir):
+    player = replace(PROFILE, matches=[decode_match(match_entry(1, [participant(1), participant(2, "LOSS")]), PROFILE)])
+    matches.write_player_matches(player, directory=profiles_dir / "match_history")
+
+    assert load_player_matches("1", profiles_dir=profiles_dir) == player.matches
+    assert load_player_matches("2", profiles_dir=profiles_dir) is None
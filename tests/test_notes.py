@@ -0,0 +1,71 @@
+import orjson
+
+from app.notes import NotesStore
+
+
+def test_append_and_read(tmp_path):
+    store = NotesStore(tmp_path / "notes.jsonl", tmp_path / "legacy")
+    store.append(1, "Cannon rush every game", date="2024-08-01 12:00:00")
+    store.append("1", "Proxy gates", date="2024-08-02 12:00:00")
+
+    assert store.notes(1) == {"2024-08-01 12:00:00": "Cannon rush every game", "2024-08-02 12:00:00": "Proxy gates"}
+    assert store.notes(2) == {}
+
+
+def test_search_matches_every_word_newest_first(tmp_path):
+    store = NotesStore(tmp_path / "notes.jsonl", tmp_path / "legacy")
+    store.append(1, "Cannon rush", date="2024-08-01 12:00:00")
+    store.append(2, "cannon RUSH again", date="2024-08-02 12:00:00")
+    store.append(3, "Macro game", date="2024-08-03 12:00:00")
+
+    assert [result["character_id"] for result in store.search("rush cannon")] == ["2", "1"]
+    assert store.search("rush macro") == []
+    assert store.search("") == []
+    # Character ids are searchable too
+    assert store.search("3") == [{"character_id": "3", "date": "2024-08-03 12:00:00", "note": "Macro game"}]
+
+
+def test_notes_written_by_another_store_are_read(tmp_path):
+    writer = NotesStore(tmp_path / "notes.jsonl", tmp_path / "legacy")
+    reader = NotesStore(tmp_path / "notes.jsonl", tmp_path / "legacy")
+    assert reader.notes(1) == {}
+
+    writer.append(1, "Hidden tech", date="2024-08-01 12:00:00")
+    assert reader.notes(1) == {"2024-08-01 12:00:00": "Hidden tech"}
+
+
+def test_partial_last_line_is_read_once_complete(tmp_path):
+    log_path = tmp_path / "notes.jsonl"
+    record = orjson.dumps({"character_id": "1", "date": "2024-08-01 12:00:00", "note": "Hidden tech"})
+    log_path.write_bytes(record[:10])
+    store = NotesStore(log_path, tmp_path / "legacy")
+    assert store.notes(1) == {}
+
+    with open(log_path, "ab") as f:
+        f.write(record[10:] + b"\n")
+    assert store.notes(1) == {"2024-08-01 12:00:00": "Hidden tech"}
+
+
+def test_corrupt_lines_are_skipped(tmp_path):
+    log_path = tmp_path / "notes.jsonl"
+    log_path.write_bytes(
+        b'{"character_id": "1", "date": "2024-08-01 12:00:00", "note": "Before"}\n'
+        b'{"character_id": "1", "da\n'
+        b'{"character_id": "1"}\n'
+        b"[1, 2]\n"
+        b'{"character_id": "1", "date": "2024-08-02 12:00:00", "note": "After"}\n'
+    )
+    store = NotesStore(log_path, tmp_path / "legacy")
+
+    assert store.notes(1) == {"2024-08-01 12:00:00": "Before", "2024-08-02 12:00:00": "After"}
+
+
+def test_legacy_files_are_read(tmp_path):
+    legacy = tmp_path / "legacy"
+    legacy.mkdir()
+    (legacy / "1.json").write_bytes(orjson.dumps({"2024-08-01 12:00:00": "From before the log"}))
+    (legacy / "2.json").write_bytes(b"{not json")
+    store = NotesStore(tmp_path / "notes.jsonl", legacy)
+
+    assert store.notes(1) == {"2024-08-01 12:00:00": "From before the log"}
+    assert store.search("before log")[0]["character_id"] == "1"
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from app import image
+from app.image import NameCandidate, Nameplate, name_candidates, opponent_nameplate
+from app.player import Identity
+
+NAME_IMG = np.zeros((30, 250, 3), dtype=np.uint8)
+REGIONS = [(0, 5, 120, 20), (130, 5, 60, 20), (200, 5, 40, 20)]
+
+
+@pytest.fixture
+def tesseract(monkeypatch):
+    """
+    Scripted Tesseract. Set reads to the (text, confidence) words of each call in turn. Returns the stub, which counts
+    its calls.
+    """
+
+    class Tesseract:
+        reads = []
+        calls = 0
+
+        def image_to_data(self, region, lang, config, output_type):
+            words = self.reads[self.calls]
+            self.calls += 1
+            return {"text": [text for text, _ in words], "conf": [conf for _, conf in words]}
+
+    stub = Tesseract()
+    monkeypatch.setattr(image.pytesseract, "image_to_data", stub.image_to_data)
+    monkeypatch.setattr(image, "_text_regions", lambda img, rect_size: REGIONS)
+    monkeypatch.setattr(image, "OCR_CONFIDENCE_THRESHOLD", 85)
+    monkeypatch.setattr(image, "OCR_MAX_ATTEMPTS", 4)
+    return stub
+
+
+def test_candidates_are_ranked_by_confidence(tesseract):
+    tesseract.reads = [
+        [("Foo", 60)],
+        # Clan tags come before the name, and words Tesseract doesn't score are dropped
+        [("[TAG]", 95), ("F00", 70), ("", -1)],
+        [("Foo", 80)],
+        [("Fo", 50)],
+    ]
+
+    assert name_candidates(NAME_IMG) == [
+        NameCandidate(text="Foo", confidence=80, variant="otsu_2x"),
+        NameCandidate(text="F00", confidence=70, variant="otsu"),
+        NameCandidate(text="Fo", confidence=50, variant="color"),
+    ]
+    assert tesseract.calls == 4
+
+
+def test_candidates_are_capped_at_k(tesseract):
+    tesseract.reads = [[("Foo", 60)], [("F00", 70)], [("Fo", 50)], [("Foe", 40)]]
+
+    assert [candidate.text for candidate in name_candidates(NAME_IMG, k=2)] == ["F00", "Foo"]
+
+
+def test_confident_read_stops_early(tesseract):
+    tesseract.reads = [[("Foo", 60)], [("Foo", 90)], [("Fo", 99)]]
+
+    assert name_candidates(NAME_IMG) == [NameCandidate(text="Foo", confidence=90, variant="otsu")]
+    assert tesseract.calls == 2
+
+
+@pytest.mark.parametrize("max_attempts", [1, 2, 4])
+def test_attempts_are_capped(tesseract, monkeypatch, max_attempts):
+    monkeypatch.setattr(image, "OCR_MAX_ATTEMPTS", max_attempts)
+    # Three variants of the top region and two more regions would be five attempts
+    tesseract.reads = [[("Foo", 10)]] * 5
+
+    name_candidates(NAME_IMG)
+
+    assert tesseract.calls == max_attempts
+
+
+def test_nothing_read(tesseract):
+    tesseract.reads = [[]] * 5
+
+    assert name_candidates(NAME_IMG) == []
+    assert tesseract.calls == 4
+
+
+def test_opponent_nameplate_recognises_us_from_an_alternate_read(monkeypatch):
+    # Our name was misread, but the correct read is among the alternates
+    us = Nameplate(
+        side="left",
+        name="Mc",
+        race="ZERG",
+        candidates=(NameCandidate("Mc", 70, "color"), NameCandidate("Me", 60, "otsu")),
+    )
+    opponent = Nameplate(
+        side="right",
+        name="Foe",
+        race="TERRAN",
+        candidates=(NameCandidate("Foe", 80, "color"), NameCandidate("F0e", 40, "otsu")),
+    )
+    monkeypatch.setattr(image, "barcode_check", lambda img: False)
+    monkeypatch.setattr(image, "parse_nameplates", lambda img, team_size: [us, opponent])
+    monkeypatch.setattr(image, "archive_screenshot", lambda img, nameplates: None)
+
+    found = opponent_nameplate(NAME_IMG, Identity(name="Me", character_id="1"))
+
+    assert found == opponent
+    assert found.alternate_names == ["F0e"]
+    assert opponent_nameplate(NAME_IMG, Identity(name="Stranger", character_id="1")) is None
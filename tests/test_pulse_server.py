@@ -0,0 +1,49 @@
+import urllib.error
+import urllib.request
+
+import orjson
+import pytest
+
+from benchmarks.pulse_server import Fixtures, start_server
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    fixtures = Fixtures(tmp_path)
+    fixtures.save("/character/1/common", b'{"common": 1}')
+    fixtures.save("/character/1/matches/2024-08-02T00:00:00/_1V1/1/1/1", b'{"page": "newest"}')
+    fixtures.save("/character/1/matches/2024-07-01T00:00:00/_1V1/1/1/1", b'{"page": "older"}')
+    return fixtures
+
+
+def test_load_exact_path(fixtures):
+    assert fixtures.load("/character/1/common") == b'{"common": 1}'
+    assert fixtures.load("/character/2/common") is None
+
+
+def test_index_is_reloaded(fixtures, tmp_path):
+    assert Fixtures(tmp_path).load("/character/1/common") == b'{"common": 1}'
+
+
+def test_matches_page_falls_back_to_nearest_later_cursor(fixtures):
+    assert fixtures.load("/character/1/matches/2024-07-15T00:00:00/_1V1/1/1/1") == b'{"page": "newest"}'
+    assert fixtures.load("/character/1/matches/2024-06-01T00:00:00/_1V1/1/1/1") == b'{"page": "older"}'
+
+
+def test_first_matches_page_uses_most_recent_recording(fixtures):
+    # The first page of a check starts from now, which is after every recording
+    assert fixtures.load("/character/1/matches/2030-01-01T00:00:00/_1V1/1/1/1") == b'{"page": "newest"}'
+    assert fixtures.load("/character/2/matches/2030-01-01T00:00:00/_1V1/1/1/1") is None
+
+
+def test_server_replays_fixtures(fixtures, tmp_path):
+    server, api_root = start_server(tmp_path)
+    try:
+        with urllib.request.urlopen(api_root + "/character/1/common") as response:
+            assert orjson.loads(response.read()) == {"common": 1}
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(api_root + "/character/2/common")
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,89 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, replace
+
+from app import smurf_check
+from app.matches import empty_match_stats
+from app.player import Identity
+from app.static import LINKED_MAX_WORKERS
+from app.verdicts import Verdict
+
+ALT = Identity(name="Alt", race="TERRAN", character_id="3", region="EU")
+VERDICT = Verdict(
+    character_id="2",
+    smurf_score=3,
+    smurf_qual="Likely",
+    checked_at="2024-08-01T12:00:00",
+    last_match_date="2024-08-01T12:00:00",
+    match_count=100,
+)
+
+
+def test_cached_verdict_is_revalidated_as_the_requester(monkeypatch):
+    summary = {"character_id": "2", "name": "Foe", "stats": asdict(replace(empty_match_stats(), smurf_qual="Likely"))}
+    monkeypatch.setattr(smurf_check, "get_verdict", lambda character_id: VERDICT)
+    monkeypatch.setattr(smurf_check, "read_profile_json", lambda kind, key: summary)
+    # Played since the verdict, so it is recomputed
+    monkeypatch.setattr(smurf_check, "newest_match_date", lambda character_id: "2024-08-02T12:00:00")
+    checks = []
+    monkeypatch.setattr(smurf_check, "execute_smurf_check", lambda **kwargs: checks.append(kwargs))
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(smurf_check, "_REVALIDATE_EXECUTOR", executor)
+
+    opponent = smurf_check.cached_check("2", identity=ALT)
+    executor.shutdown(wait=True)
+
+    assert opponent.name == "Foe"
+    assert checks == [{"opponent_character_id": "2", "use_verdicts": False, "identity": ALT}]
+
+
+def _linked_stub(monkeypatch, failing=""):
+    """
+    Stand-in linked characters 3, 4 and 5, checked on a fresh pool. The failing character's check raises. Returns the
+    pool.
+    """
+    players = [Identity(name=f"Alt{character_id}", character_id=character_id) for character_id in "345"]
+    monkeypatch.setattr(smurf_check, "linked_players", lambda character_id: players)
+    # Every check waits for the others, so they only finish when they run side by side
+    barrier = threading.Barrier(len(players), timeout=5)
+
+    def check(player):
+        barrier.wait()
+        if player.character_id == failing:
+            raise ValueError("boom")
+        return player
+
+    monkeypatch.setattr(smurf_check, "_linked_player_stats", check)
+    executor = ThreadPoolExecutor(max_workers=LINKED_MAX_WORKERS)
+    monkeypatch.setattr(smurf_check, "_LINKED_EXECUTOR", executor)
+    return executor
+
+
+def test_linked_characters_are_checked_side_by_side(monkeypatch):
+    executor = _linked_stub(monkeypatch)
+
+    players = smurf_check._linked_results(smurf_check.submit_linked_checks(Identity(name="Foe", character_id="2")))
+    executor.shutdown(wait=True)
+
+    assert [player.character_id for player in players] == ["3", "4", "5"]
+
+
+def test_failed_linked_check_is_skipped(monkeypatch):
+    executor = _linked_stub(monkeypatch, failing="4")
+
+    players = smurf_check._linked_results(smurf_check.submit_linked_checks(Identity(name="Foe", character_id="2")))
+    executor.shutdown(wait=True)
+
+    assert [player.character_id for player in players] == ["3", "5"]
+
+
+def test_failed_linked_lookup_checks_nothing(monkeypatch):
+    executor = _linked_stub(monkeypatch)
+
+    def lookup(character_id):
+        raise ValueError("boom")
+
+    monkeypatch.setattr(smurf_check, "linked_players", lookup)
+
+    assert smurf_check._linked_results(smurf_check.submit_linked_checks(Identity(name="Foe", character_id="2"))) == []
+    executor.shutdown(wait=True)
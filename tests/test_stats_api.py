@@ -0,0 +1,135 @@
+import os
+from dataclasses import replace
+from functools import partial
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from conftest import match_entry, participant
+
+from app import verdicts
+from app.matches import decode_match, load_player_matches, write_player_matches
+from app.player import Player
+from app.stats_index import StatsIndex
+from app.utils.file_utils import write_compact_json
+from app.verdicts import get_verdicts, record_verdict
+from flask_app import app as flask_app
+
+SUMMARIES = {
+    "1": {"name": "Foo", "race": "ZERG", "rating_last": 5000, "stats": {"match_count": 50, "smurf_qual": "Likely"}},
+    "2": {"name": "Bar", "race": "TERRAN", "rating_last": 3000, "stats": {"match_count": 10, "smurf_qual": "Unlikely"}},
+}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    stats_dir = tmp_path / "stats"
+    for character_id, summary in SUMMARIES.items():
+        write_compact_json(summary, stats_dir / f"{character_id}.json")
+
+    verdicts_path = tmp_path / "verdicts.json"
+    monkeypatch.setattr(verdicts, "_VERDICTS", {})
+    monkeypatch.setattr(verdicts, "_VERDICTS_SOURCE", None)
+    player = SimpleNamespace(
+        character_id="1",
+        stats=SimpleNamespace(smurf_score=0.9, smurf_qual="Likely", match_count=50),
+        matches=[SimpleNamespace(date="2024-08-01T12:00:00")],
+    )
+    record_verdict(player, path=verdicts_path)
+
+    index = StatsIndex(stats_dir=stats_dir, archive_path=tmp_path / "archive.smurf")
+    monkeypatch.setattr(flask_app, "stats_index", lambda: index)
+    monkeypatch.setattr(flask_app, "get_verdicts", partial(get_verdicts, path=verdicts_path))
+    return flask_app.app.test_client()
+
+
+def test_get_many(client):
+    response = client.get("/api/stats?ids=1,3&ids=2&fields=name,smurf_qual")
+
+    assert response.status_code == 200
+    assert response.get_json() == [
+        {"character_id": "1", "found": True, "name": "Foo", "smurf_qual": "Likely"},
+        {"character_id": "3", "found": False},
+        {"character_id": "2", "found": True, "name": "Bar", "smurf_qual": "Unlikely"},
+    ]
+
+
+def test_post_with_verdicts(client):
+    response = client.post("/api/stats", json={"ids": ["1", "2"], "fields": ["rating_last", "verdict"]})
+
+    records = response.get_json()
+    assert records[0]["rating_last"] == 5000
+    assert records[0]["verdict"]["smurf_qual"] == "Likely"
+    assert records[0]["verdict"]["last_match_date"] == "2024-08-01T12:00:00"
+    assert records[1]["verdict"] is None
+
+
+def test_default_fields(client):
+    record = client.get("/api/stats?ids=1").get_json()[0]
+    assert set(record) == {"character_id", "found", *flask_app.STATS_API_DEFAULT_FIELDS}
+    assert record["match_count"] == 50
+
+
+def test_ndjson(client):
+    response = client.get("/api/stats?ids=1,2&fields=name&format=ndjson")
+
+    assert response.mimetype == "application/x-ndjson"
+    lines = [orjson.loads(line) for line in response.data.splitlines()]
+    assert [line["name"] for line in lines] == ["Foo", "Bar"]
+
+
+def test_large_requests_are_streamed(client, monkeypatch):
+    monkeypatch.setattr(flask_app, "STATS_API_STREAM_THRESHOLD", 1)
+    assert client.get("/api/stats?ids=1,2").mimetype == "application/x-ndjson"
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["/api/stats", "/api/stats?ids=1&fields=password"],
+)
+def test_bad_requests(client, query):
+    assert client.get(query).status_code == 400
+
+
+def test_too_many_ids(client, monkeypatch):
+    monkeypatch.setattr(flask_app, "STATS_API_MAX_IDS", 1)
+    assert client.get("/api/stats?ids=1,2").status_code == 400
+
+
+def test_single_player(client):
+    response = client.get("/api/stats/2?fields=name,match_count,verdict")
+
+    assert response.get_json() == {
+        "character_id": "2",
+        "found": True,
+        "name": "Bar",
+        "match_count": 10,
+        "verdict": None,
+    }
+    assert client.get("/api/stats/3").status_code == 404
+    assert client.get("/api/stats/1?fields=password").status_code == 400
+
+
+def test_updated_summary_is_served(client, tmp_path):
+    assert client.get("/api/stats/2?fields=name").get_json()["name"] == "Bar"
+
+    path = tmp_path / "stats" / "2.json"
+    write_compact_json({**SUMMARIES["2"], "name": "Renamed"}, path)
+    # Filesystem timestamps are coarse, make sure the rewrite lands on a later tick than the first read
+    later = path.stat().st_mtime_ns + 10**9
+    os.utime(path, ns=(later, later))
+    os.utime(path.parent, ns=(later, later))
+    assert client.get("/api/stats/2?fields=name").get_json()["name"] == "Renamed"
+
+
+def test_match_payload(client, tmp_path, monkeypatch):
+    profile = Player(character_id="1", name="Foo", race="ZERG")
+    matches = [decode_match(match_entry(1, [participant(1), participant(2, "LOSS")]), profile)]
+    write_player_matches(replace(profile, matches=matches), directory=tmp_path / "match_history")
+    monkeypatch.setattr(flask_app, "load_player_matches", partial(load_player_matches, profiles_dir=tmp_path))
+
+    response = client.get("/api/matches/1")
+
+    assert response.status_code == 200
+    assert [(match["opponent"]["character_id"], match["result"]) for match in response.get_json()] == [("2", "WIN")]
+    assert client.get("/api/matches/2").status_code == 404
@@ -0,0 +1,139 @@
+import threading
+import time
+
+import orjson
+import pytest
+
+from app import image, smurf_check, verdicts
+from app.image import Coordinate, Nameplate, nameplate_coordinates, opponent_nameplates
+from app.player import Identity, Player
+from app.static import STATS_DIR
+
+IDENTITY = Identity(name="Me", race="ZERG", character_id="1", region="US")
+
+
+def _nameplates(names, team_size):
+    sides = ["left"] * team_size + ["right"] * team_size
+    return [
+        Nameplate(side=side, slot=index % team_size, name=name, race="ZERG")
+        for index, (side, name) in enumerate(zip(sides, names))
+    ]
+
+
+def test_team_rows_are_stacked_around_the_1v1_row(monkeypatch, tmp_path):
+    monkeypatch.setattr(image, "TEAM_LAYOUT_PATH", tmp_path / "missing.json")
+    monkeypatch.setattr(image, "TEAM_ROW_HEIGHT", 60)
+
+    coordinates = nameplate_coordinates(2)
+
+    assert [(side, slot) for side, slot, _, _ in coordinates] == [("left", 0), ("left", 1), ("right", 0), ("right", 1)]
+    assert [name.top for _, _, name, _ in coordinates] == [410, 470, 410, 470]
+    assert [(side, slot) for side, slot, _, _ in nameplate_coordinates(1)] == [("left", 0), ("right", 0)]
+
+
+def test_team_layout_file(monkeypatch, tmp_path):
+    def plate(top):
+        return {
+            "name": {"left": 100, "top": top, "right": 300, "bottom": top + 30},
+            "race": {"left": 310, "top": top, "right": 370, "bottom": top + 50},
+        }
+
+    path = tmp_path / "team_layout.json"
+    path.write_bytes(orjson.dumps({"2": {"left": [plate(300), plate(400)], "right": [plate(300), plate(400)]}}))
+    monkeypatch.setattr(image, "TEAM_LAYOUT_PATH", path)
+
+    coordinates = nameplate_coordinates(2)
+
+    assert coordinates[1] == (
+        "left",
+        1,
+        Coordinate(left=100, top=400, right=300, bottom=430),
+        Coordinate(left=310, top=400, right=370, bottom=450),
+    )
+    # Sizes missing from the file fall back to stacked rows, a size with the wrong slot count is an error
+    assert len(nameplate_coordinates(3)) == 6
+    path = tmp_path / "broken_layout.json"
+    path.write_bytes(orjson.dumps({"2": {"left": [plate(300)], "right": [plate(300)]}}))
+    monkeypatch.setattr(image, "TEAM_LAYOUT_PATH", path)
+    with pytest.raises(ValueError):
+        nameplate_coordinates(2)
+
+
+def test_opponents_are_the_other_side(monkeypatch):
+    nameplates = _nameplates(["Ally", "Me", "Foe1", "Foe2"], team_size=2)
+    monkeypatch.setattr(image, "loading_screen_nameplates", lambda screenshot, team_size: nameplates)
+
+    assert [nameplate.name for nameplate in opponent_nameplates(None, IDENTITY)] == ["Foe1", "Foe2"]
+    assert opponent_nameplates(None, Identity(name="Stranger", character_id="2")) == []
+
+
+@pytest.fixture
+def team_check(monkeypatch, tmp_path):
+    """
+    Team check against stand-in lookups. Returns the match history calls.
+    """
+    monkeypatch.setattr(smurf_check, "TEAM_DIR", tmp_path / "team")
+    monkeypatch.setattr(verdicts, "_VERDICTS", {})
+    monkeypatch.setattr(verdicts, "_VERDICTS_SOURCE", None)
+    monkeypatch.setattr(smurf_check, "my_profile", lambda identity: Player(character_id="1", rating_last=4000))
+    monkeypatch.setattr(smurf_check, "refresh_my_profile_async", lambda identity: None)
+    monkeypatch.setattr(
+        smurf_check,
+        "player_from_character_search",
+        lambda name, race, region, rating: Player(character_id=name.removeprefix("Foe"), name=name, race=race),
+    )
+    monkeypatch.setattr(
+        smurf_check,
+        "player_from_summary",
+        lambda character_id, name, race, region: Player(character_id=character_id, name=name, race=race),
+    )
+    calls = []
+    monkeypatch.setattr(smurf_check, "get_matches_for_profile", lambda profile, **kwargs: calls.append(kwargs) or [])
+    return calls
+
+
+def test_team_check_writes_under_its_match_type(monkeypatch, tmp_path, team_check):
+    nameplates = _nameplates(["Me", "Ally", "Foe20", "Foe21"], team_size=2)
+    monkeypatch.setattr(image, "opponent_nameplates", lambda screenshot, identity, team_size: nameplates[2:])
+
+    player, opponents = smurf_check.execute_team_smurf_check(screenshot_image=object(), identity=IDENTITY)
+
+    assert [opponent.character_id for opponent in opponents] == ["20", "21"]
+    assert {call["matchType"] for call in team_check} == {"_2V2"}
+    assert all(call["deadline"] is not None for call in team_check)
+    for character_id in ("20", "21"):
+        assert (tmp_path / "team" / "_2V2" / "stats" / f"{character_id}.json").exists()
+        assert (tmp_path / "team" / "_2V2" / "match_history" / f"{character_id}.json").exists()
+        assert not (STATS_DIR / f"{character_id}.json").exists()
+    assert set(orjson.loads((tmp_path / "team" / "_2V2" / "verdicts.json").read_bytes())) == {"20", "21"}
+
+
+def test_team_check_runs_opponents_concurrently_under_one_budget(monkeypatch, team_check):
+    nameplates = _nameplates(["Me", "Ally", "Foe30", "Foe31"], team_size=2)
+    monkeypatch.setattr(image, "opponent_nameplates", lambda screenshot, identity, team_size: nameplates[2:])
+    # Both opponents have to be in their lookups at once to get past the barrier
+    barrier = threading.Barrier(2, timeout=5)
+    release = threading.Event()
+
+    def search(name, race, region, rating):
+        barrier.wait()
+        if name == "Foe31":
+            release.wait(5)
+        return Player(character_id=name.removeprefix("Foe"), name=name, race=race)
+
+    monkeypatch.setattr(smurf_check, "player_from_character_search", search)
+    finished = threading.Semaphore(0)
+    monkeypatch.setattr(smurf_check, "refresh_my_profile_async", lambda identity: finished.release())
+
+    start = time.perf_counter()
+    try:
+        _, opponents = smurf_check.execute_team_smurf_check(screenshot_image=object(), identity=IDENTITY, budget=0.5)
+    finally:
+        release.set()
+        # Let the late opponent finish before the stand-ins are undone
+        assert all(finished.acquire(timeout=5) for _ in range(2))
+
+    assert time.perf_counter() - start < 2
+    # The opponent still running when the budget ran out is reported as None
+    assert opponents[0].character_id == "30"
+    assert opponents[1] is None
@@ -0,0 +1,101 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.timing_utils import (
+    Trace,
+    _percentile,
+    defer,
+    load_traces,
+    stage,
+    stage_percentiles,
+    trace,
+    write_trace,
+)
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert _percentile(values, 50) == 50
+    assert _percentile(values, 90) == 90
+    assert _percentile(values, 99) == 99
+    assert _percentile([3.0], 99) == 3.0
+    assert _percentile([1, 2], 0) == 1
+
+
+def test_stage_percentiles_sum_stages_per_trace():
+    traces = [
+        {"duration": 1.0, "spans": [{"name": "api", "duration": 0.25}, {"name": "api", "duration": 0.25}]},
+        {"duration": 2.0, "spans": [{"name": "api", "duration": 1.0}, {"name": "ocr", "duration": None}]},
+        {"duration": None, "spans": []},
+    ]
+    summary = stage_percentiles(traces, percentiles=(50, 99))
+
+    assert summary["total"] == {"count": 2, "p50": 1.0, "p99": 2.0}
+    assert summary["api"] == {"count": 2, "p50": 0.5, "p99": 1.0}
+    assert summary["ocr"] == {"count": 1, "p50": 0, "p99": 0}
+
+
+def test_nested_traces_are_written_once(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    with trace("outer", path=path, a=1):
+        with trace("inner", path=path, b=2):
+            with stage("api"):
+                pass
+
+    (written,) = load_traces(path)
+    assert written["name"] == "outer"
+    assert written["attributes"] == {"a": 1, "b": 2}
+    assert [span["name"] for span in written["spans"]] == ["api"]
+
+
+def test_trace_without_path_is_not_written(tmp_path):
+    with trace("memory_only", path=None) as current:
+        with stage("read"):
+            pass
+    assert "read" in current.stage_totals()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_trace_waits_for_deferred_work(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    release = threading.Event()
+
+    def _plot():
+        release.wait(5)
+        with stage("plot"):
+            pass
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with trace("check", path=path):
+            defer(executor.submit(contextvars.copy_context().run, _plot))
+        assert load_traces(path) == []
+
+        release.set()
+    (written,) = load_traces(path)
+    assert [span["name"] for span in written["spans"]] == ["plot"]
+
+
+def test_load_traces_reads_newest_first_across_rotation(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    for i in range(20):
+        write_trace(Trace(name=f"trace{i}"), path, max_bytes=1000)
+    assert (tmp_path / "traces.jsonl.1").exists()
+
+    names = [written["name"] for written in load_traces(path, limit=5)]
+    assert names == ["trace19", "trace18", "trace17", "trace16", "trace15"]
+
+    everything = [written["name"] for written in load_traces(path)]
+    assert everything[0] == "trace19"
+    assert everything == sorted(everything, key=lambda name: int(name[5:]), reverse=True)
+    assert len(everything) < 20  # Only one backup is kept
+
+
+def test_load_traces_tail_spans_read_blocks(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    for i in range(200):
+        write_trace(Trace(name=f"trace{i}", attributes={"padding": "x" * 1000}), path, max_bytes=10**9)
+
+    names = [written["name"] for written in load_traces(path, limit=3)]
+    assert names == ["trace199", "trace198", "trace197"]
+    assert load_traces(tmp_path / "missing.jsonl", limit=3) == []
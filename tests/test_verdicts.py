@@ -0,0 +1,99 @@
+import multiprocessing
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+from app import verdicts
+from app.verdicts import Verdict, get_verdict, get_verdicts, record_verdict
+
+
+@pytest.fixture
+def verdicts_path(tmp_path, monkeypatch):
+    # The table is cached per process, start every test from an empty one
+    monkeypatch.setattr(verdicts, "_VERDICTS", {})
+    monkeypatch.setattr(verdicts, "_VERDICTS_SOURCE", None)
+    return tmp_path / "verdicts.json"
+
+
+def _player(character_id, smurf_qual="Likely", dates=("2024-08-02T12:00:00", "2024-08-01T12:00:00")):
+    return SimpleNamespace(
+        character_id=character_id,
+        stats=SimpleNamespace(smurf_score=0.8, smurf_qual=smurf_qual, match_count=len(dates)),
+        matches=[SimpleNamespace(date=date) for date in dates],
+    )
+
+
+def test_record_and_get(verdicts_path):
+    verdict = record_verdict(_player(1), path=verdicts_path)
+
+    assert verdict.character_id == "1"
+    assert (verdict.smurf_score, verdict.smurf_qual, verdict.match_count) == (0.8, "Likely", 2)
+    # Matches are newest first
+    assert verdict.last_match_date == "2024-08-02T12:00:00"
+    assert get_verdict(1, path=verdicts_path) == verdict
+    assert get_verdict("2", path=verdicts_path) is None
+
+
+def test_player_without_stats_is_not_recorded(verdicts_path):
+    assert record_verdict(SimpleNamespace(character_id=1, stats=None, matches=[]), path=verdicts_path) is None
+    assert not verdicts_path.exists()
+
+
+def test_newer_verdict_replaces_older(verdicts_path):
+    record_verdict(_player(1, "Likely"), path=verdicts_path)
+    record_verdict(_player(1, "Unlikely", dates=()), path=verdicts_path)
+
+    verdict = get_verdict(1, path=verdicts_path)
+    assert verdict.smurf_qual == "Unlikely"
+    assert verdict.last_match_date is None
+
+
+def test_get_verdicts_leaves_out_unknown_characters(verdicts_path):
+    record_verdict(_player(1), path=verdicts_path)
+    record_verdict(_player(2, "Definitely"), path=verdicts_path)
+
+    found = get_verdicts([1, "2", 3], path=verdicts_path)
+    assert {key: verdict.smurf_qual for key, verdict in found.items()} == {"1": "Likely", "2": "Definitely"}
+
+
+def test_table_rewritten_by_another_process_is_reloaded(verdicts_path):
+    record_verdict(_player(1), path=verdicts_path)
+    other = Verdict("2", 0.1, "Unlikely", "2024-08-03T12:00:00", None, 0)
+    table = {**orjson.loads(verdicts_path.read_bytes()), "2": other.__dict__}
+    tmp_path = verdicts_path.with_suffix(".other")
+    tmp_path.write_bytes(orjson.dumps(table))
+    tmp_path.replace(verdicts_path)
+
+    assert get_verdict(2, path=verdicts_path) == other
+    assert get_verdict(1, path=verdicts_path).smurf_qual == "Likely"
+
+
+def test_unreadable_table_is_treated_as_empty(verdicts_path):
+    verdicts_path.write_bytes(b'{"1": {"character_id": "1", "smu')
+    assert get_verdict(1, path=verdicts_path) is None
+
+    # The next verdict replaces the unreadable table
+    record_verdict(_player(2), path=verdicts_path)
+    assert get_verdict(2, path=verdicts_path).smurf_qual == "Likely"
+
+
+def _record_many(path, start, count):
+    for character_id in range(start, start + count):
+        record_verdict(_player(character_id), path=path)
+
+
+def test_concurrent_writers_keep_every_verdict(verdicts_path):
+    processes = [
+        multiprocessing.get_context("spawn").Process(target=_record_many, args=(verdicts_path, start, 30))
+        for start in (0, 1000, 2000)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    table = orjson.loads(verdicts_path.read_bytes())
+    assert len(table) == 90
+    assert not list(verdicts_path.parent.glob("*.tmp"))